@@ -0,0 +1,24 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+/**
+ * Interface batch_processor.py calls on the migrated contract, one call per
+ * batch. A contract may name the function differently: pass its ABI with
+ * --abi and the function taking (bytes32[], bytes32[], string[]) is used.
+ */
+interface IMigrationTarget {
+    /**
+     * Writes one batch of migrated state and activates the functions whose
+     * state is complete.
+     *
+     * slots[i] is a raw storage slot of the new layout and values[i] the
+     * whole 32-byte word to store there with sstore; packed slots already
+     * carry the combined value of their variables. activate lists the
+     * functions, as named in the dependency matrix, that may be called from
+     * this batch on.
+     *
+     * Must revert unless called by the migration operator, and when
+     * slots and values differ in length.
+     */
+    function migrateBatch(bytes32[] calldata slots, bytes32[] calldata values, string[] calldata activate) external;
+}
@@ -1,72 +1,62 @@
+import argparse
 import json
+import os
+import sys
 import requests
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+import rpc_client
+import batch_planner
 
-def get_latest_block_number():
+
+def get_latest_block_number(client=None):
     
     api_key = "YOUR_API_KEY"
-    url = f"https://mainnet.infura.io/v3/{api_key}"
-    headers = {'Content-Type': 'application/json'}
-    data = {
-        "jsonrpc": "2.0",
-        "method": "eth_blockNumber",
-        "params": [],
-        "id": 1
-    }
-    
-    # Convert the data dictionary to JSON format
-    json_data = json.dumps(data)
-
-    # Making a POST request
-    response = requests.post(url, headers=headers, data=json_data)
-
-    # Check if the request was successful
-    if response.status_code == 200:
-        response_json = response.json()
-        block_number_hex = response_json.get('result', None)
-        if block_number_hex:
-            return block_number_hex
-        return None
-    else:
+    if client is None:
+        client = rpc_client.get_client(rpc_client.infura_url(api_key))
+
+    # Pooled, retried JSON-RPC call
+    try:
+        block_number_hex = client.call("eth_blockNumber")
+    except (rpc_client.RpcError, requests.RequestException) as e:
         print("Failed to retrieve data")
-        print("Status Code:", response.status_code)
-        print("Response Text:", response.text)
+        print("Error:", e)
         return None
 
+    if block_number_hex:
+        return block_number_hex
+    return None
+
 
 
-def fetch_gas_limit(block_number):
+def fetch_gas_limit(block_number, client=None):
     
     api_key = 'YOUR_API_KEY'
+    if client is None:
+        client = rpc_client.get_client(rpc_client.infura_url(api_key))
 
-    # API endpoint
-    url = f'https://mainnet.infura.io/v3/{api_key}'
-
-    # JSON-RPC request payload
-    payload = {
-        "jsonrpc": "2.0",
-        "method": "eth_getBlockByNumber",
-        "params": [block_number, False],
-        "id": 1
-    }
-
-    # Headers
-    headers = {
-        'Content-Type': 'application/json'
-    }
-
-    # POST request
-    response = requests.post(url, json=payload, headers=headers)
-
-    # Check if the request was successful
-    if response.status_code == 200:
-        data = response.json()
-        gas_limit = data['result']['gasLimit']
-        return int(gas_limit, 16)
-    else:
+    try:
+        block = client.call("eth_getBlockByNumber", [block_number, False])
+    except (rpc_client.RpcError, requests.RequestException) as e:
         print("Failed to fetch data")
+        print("Error:", e)
         return None
 
+    if block is None:
+        return None
+    return int(block['gasLimit'], 16)
+
+
+
+def fetch_latest_block_and_gas_limit(client=None):
+    # Block number and gas limit of the latest block in a single round trip
+    api_key = 'YOUR_API_KEY'
+    if client is None:
+        client = rpc_client.get_client(rpc_client.infura_url(api_key))
+
+    block = client.call("eth_getBlockByNumber", ["latest", False])
+    return block['number'], int(block['gasLimit'], 16)
+
 
 
 def extract_sorted_vars(prio_vec_file, dp_mat_file):
@@ -78,17 +68,26 @@ def extract_sorted_vars(prio_vec_file, dp_mat_file):
     with open(dp_mat_file, 'r') as file:
         dp_mat = json.load(file)
 
-    
+    return sorted_vars(prio_vec, dp_mat)
+
+
+def sorted_vars(prio_vec, dp_mat):
+    # state variables in the order of the highest priority function using them
     sorted_funcs = sorted(prio_vec, key=lambda x: prio_vec[x], reverse=True)
 
     
     unique_vars = []
+    seen = set()
 
     
     for key in sorted_funcs:
+        # prio_vec keys are full signatures, dependency matrices may be keyed by name
+        if key not in dp_mat:
+            key = key.split("(")[0]
         if key in dp_mat:
             for value in dp_mat[key]:
-                if value not in unique_vars:
+                if value not in seen:
+                    seen.add(value)
                     unique_vars.append(value)
 
     return unique_vars
@@ -96,18 +95,31 @@ def extract_sorted_vars(prio_vec_file, dp_mat_file):
 
 
 
-def create_function_batches(data, unique_vars, dependency_matrix, batch_size):
+def create_function_batches(data, unique_vars, dependency_matrix, batch_size, missing=None):
+    # variables without shards (nothing stored) have no slots to write; they
+    # still complete and are appended to missing if given
 
+    batch_size = int(batch_size)
     current_batch_size = 0
     current_batch = {}
     current_batch["activate"] = []
-    funcs = list(dependency_matrix.keys())
-    var_completed = {}
-    for var in unique_vars:
-        var_completed[var] = False
+    # remaining dependency count per function, functions waiting on each var
+    remaining, dependents = batch_planner.build_activation_index(dependency_matrix)
     batches = []
+
+    # functions without state dependencies are available immediately
+    for func, count in remaining.items():
+        if count == 0:
+            current_batch["activate"].append(func)
+
     for var in unique_vars:
-        slots = data[var]
+        label = batch_planner.shard_label(data, var)
+        if label is None:
+            if missing is not None:
+                missing.append(var)
+            slots = {}
+        else:
+            slots = data[label]
         for key,val in slots.items():
             current_batch[key] = val
             current_batch_size = current_batch_size+1
@@ -117,27 +129,48 @@ def create_function_batches(data, unique_vars, dependency_matrix, batch_size):
                 current_batch["activate"] = []
                 current_batch_size = 0
 
-        var_completed[var] = True
-        for func in funcs:
-            dpendents = dependency_matrix[func]
-            all_included = True
-            for dependent in dpendents:
-                if var_completed[dependent] == False:
-                    all_included = False
-                    break
-            if all_included == True:
-                current_batch["activate"].append(func)
-                func.remove(func)
+        # only the functions depending on var need to be looked at
+        current_batch["activate"].extend(batch_planner.complete_variable(var, remaining, dependents))
 
+    if current_batch_size > 0 or current_batch["activate"]:
+        batches.append(current_batch)
 
+    return batches
 
 
 
 
+if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description="Plan gas-aware migration batches from a shard file")
+    parser.add_argument("shards", help="shards.json with {var: {slot: value}}")
+    parser.add_argument("prio_vec", help="prio_vec.json")
+    parser.add_argument("dp_mat", help="state dependency matrix JSON, {function: [vars]}")
+    parser.add_argument("--gas-target", type=int, default=None, help="gas per batch, defaults to half the latest block gas limit")
+    parser.add_argument("-o", "--output", default="batches.ndjson", help="NDJSON batch file for batch_processor")
+    args = parser.parse_args()
 
+    gas_target = args.gas_target
+    if gas_target is None:
+        block_number = get_latest_block_number()
+        gas_limit = fetch_gas_limit(block_number)
+        if gas_limit is None:
+            raise ValueError("Block gas limit could not be fetched")
+        gas_target = batch_planner.gas_target_for_block(gas_limit)
 
-block_number = get_latest_block_number()
-gas_limit = fetch_gas_limit(block_number)
-batch_size = gas_limit/30000
+    with open(args.shards, 'r') as file:
+        data = json.load(file)
+    with open(args.dp_mat, 'r') as file:
+        dependency_matrix = json.load(file)
+    unique_vars = extract_sorted_vars(args.prio_vec, args.dp_mat)
 
+    for var in unique_vars:
+        if batch_planner.shard_label(data, var) is None:
+            print(f"{var}: no shards, nothing to migrate", file=sys.stderr)
+
+    byte_ranges = batch_planner.load_byte_ranges(os.path.dirname(os.path.abspath(args.shards)))
+    batches = batch_planner.plan_batches(data, unique_vars, dependency_matrix, gas_target, byte_ranges=byte_ranges)
+    with open(args.output, 'w') as file:
+        for batch in batches:
+            file.write(json.dumps(batch) + "\n")
+    print(f"Wrote {len(batches)} batches to {args.output}")
@@ -0,0 +1,276 @@
+import json
+import os
+
+# Gas schedule (EIP-2929 access costs, EIP-2200/3529 SSTORE costs)
+TX_BASE_GAS = 21000
+COLD_SLOAD_COST = 2100
+WARM_STORAGE_READ_COST = 100
+SSTORE_SET_GAS = 20000
+SSTORE_RESET_GAS = 5000 - COLD_SLOAD_COST
+CALLDATA_ZERO_BYTE_GAS = 4
+CALLDATA_NONZERO_BYTE_GAS = 16
+
+# Activating a function is assumed to flip one fresh storage flag
+ACTIVATION_GAS = COLD_SLOAD_COST + SSTORE_SET_GAS
+
+# Share of the block gas limit a batch aims for; 0.5 is the EIP-1559 target
+DEFAULT_GAS_FRACTION = 0.5
+
+
+def calldata_gas(word):
+    # calldata cost of one ABI-encoded 32-byte word
+    data = word.to_bytes(32, "big")
+    zero_bytes = data.count(0)
+    return zero_bytes * CALLDATA_ZERO_BYTE_GAS + (len(data) - zero_bytes) * CALLDATA_NONZERO_BYTE_GAS
+
+
+def sstore_gas(original_value, current_value, new_value, warm):
+    """
+    Cost of one SSTORE of new_value into a slot holding current_value that
+    held original_value at the start of the transaction.
+    """
+    gas = 0 if warm else COLD_SLOAD_COST
+    if new_value == current_value:
+        return gas + WARM_STORAGE_READ_COST
+    if current_value == original_value:
+        if original_value == 0:
+            return gas + SSTORE_SET_GAS
+        return gas + SSTORE_RESET_GAS
+    # slot already dirty in this transaction
+    return gas + WARM_STORAGE_READ_COST
+
+
+def slot_write_gas(slot, value, original_value=0, current_value=None, warm=False):
+    # storage cost plus the calldata carrying the slot and the value (all ints)
+    if current_value is None:
+        current_value = original_value
+    return sstore_gas(original_value, current_value, value, warm) + calldata_gas(slot) + calldata_gas(value)
+
+
+def gas_target_for_block(gas_limit, fraction=DEFAULT_GAS_FRACTION):
+    return int(gas_limit * fraction)
+
+
+def to_hash(value):
+    return "0x" + format(value, "064x")
+
+
+FULL_SLOT = (1 << 256) - 1
+
+
+def packed_byte_ranges(reorg_infos, data_types):
+    """
+    Byte ranges of the variables that share their slot with others. Only
+    value types smaller than a slot are packed; every other variable owns
+    the slots it is stored in. Variables relocated by a layout diff
+    ("newSlot"/"newOffset") are placed at their new position and always
+    keep their byte range when smaller than a slot, as they may share it
+    with variables the diff leaves in place.
+
+    Args:
+    - reorg_infos (list): storage_reorg_info.json entries.
+    - data_types (list): data_types.json entries.
+
+    Returns:
+    - dict: {label: (offset, size)} in bytes from the low-order end.
+    """
+    sizes = {data_type["type"]: int(data_type["numberOfBytes"]) for data_type in data_types}
+    by_slot = {}
+    for info in reorg_infos:
+        by_slot.setdefault(int(info.get("newSlot", info["slot"]), 16), []).append(info)
+
+    byte_ranges = {}
+    for infos in by_slot.values():
+        for info in infos:
+            size = sizes[info["type"]]
+            if len(infos) > 1 or ("newSlot" in info and size < 32):
+                byte_ranges[info["label"]] = (info.get("newOffset", info["offset"]), size)
+    return byte_ranges
+
+
+def load_byte_ranges(directory):
+    # packed_byte_ranges of the layout files shard_gen reads, {} without them
+    try:
+        with open(os.path.join(directory, "storage_reorg_info.json"), 'r') as file:
+            reorg_infos = json.load(file)
+        with open(os.path.join(directory, "data_types.json"), 'r') as file:
+            data_types = json.load(file)
+    except FileNotFoundError:
+        return {}
+    return packed_byte_ranges(reorg_infos, data_types)
+
+
+def byte_mask(byte_range):
+    offset, size = byte_range
+    return ((1 << (8 * size)) - 1) << (8 * offset)
+
+
+def shard_label(shards, var):
+    """
+    Key of var in a {label: ...} shard mapping. Dependency matrices name
+    state variables "Contract.variable", shard files by their storage
+    layout label.
+
+    Returns:
+    - str: The key, or None if var has no shards.
+    """
+    if var in shards:
+        return var
+    label = var.rsplit(".", 1)[-1]
+    if label in shards:
+        return label
+    return None
+
+
+def build_activation_index(dependency_matrix):
+    """
+    Activation bookkeeping for a {function: [vars]} dependency matrix.
+
+    Returns:
+    - tuple: ({function: number of dependencies not migrated yet},
+      {var: [functions depending on it]})
+    """
+    remaining = {}
+    dependents = {}
+    for func, dependencies in dependency_matrix.items():
+        dependencies = set(dependencies)
+        remaining[func] = len(dependencies)
+        for var in dependencies:
+            dependents.setdefault(var, []).append(func)
+    return remaining, dependents
+
+
+def complete_variable(var, remaining, dependents):
+    # marks var as migrated and returns the functions that became ready
+    ready = []
+    for func in dependents.pop(var, []):
+        remaining[func] = remaining[func] - 1
+        if remaining[func] == 0:
+            ready.append(func)
+    return ready
+
+
+def iter_planned_batches(slot_source, unique_vars, dependency_matrix, gas_target, original_state=None, byte_ranges=None, activation_gas=ACTIVATION_GAS, tx_base_gas=TX_BASE_GAS):
+    """
+    Packs migration slots into batches that approach gas_target, yielding
+    each batch as soon as it is complete.
+
+    Slots are taken in priority order (unique_vars) and each is charged its
+    SSTORE cost: cold or warm access, zero to non-zero or non-zero to
+    non-zero, plus calldata. A shard replaces the bytes of its slot it
+    covers, the whole slot unless byte_ranges says otherwise, and keeps the
+    rest: the original value, or what an earlier shard of a packed slot
+    wrote. Such a slot is written with the combined value and a second
+    write is charged as a warm or reset write.
+    A function is activated in the batch in which its last dependency
+    completes, or in the next one if its activation would overflow the batch.
+
+    Args:
+    - slot_source (callable): var -> iterable of (slot, value) hex pairs,
+      e.g. lambda var: shards[var].items().
+    - unique_vars (list): Variables in priority order, see extract_sorted_vars.
+    - dependency_matrix (dict): {function: [vars]}.
+    - gas_target (int): Gas budget of one batch transaction.
+    - original_state (dict): {slot: value} already stored in the target
+      contract, empty (a fresh deployment) by default.
+    - byte_ranges (dict): {var: (offset, size)} of packed variables, see
+      packed_byte_ranges. Without it packed variables overwrite each other.
+
+    Yields:
+    - dict: Batches in the create_function_batches format, {slot: value}
+      plus "activate": [functions], with the estimate under "gas".
+    """
+    if original_state is None:
+        original_state = {}
+    if byte_ranges is None:
+        byte_ranges = {}
+
+    remaining, dependents = build_activation_index(dependency_matrix)
+
+    closed = []  # completed batches not yielded yet
+    # slot -> value written so far, as an int. Only packed slots are kept
+    # across batches, every other slot is written once by the variable that
+    # owns it, so this holds at most one entry per packed variable.
+    written = {}
+
+    def new_batch():
+        # batch, its gas estimate, {slot: (value at batch start, value)}
+        return {"activate": []}, tx_base_gas, {}
+
+    current_batch, current_gas, batch_values = new_batch()
+
+    def close_batch():
+        current_batch["gas"] = current_gas
+        closed.append(current_batch)
+
+    def activate(funcs):
+        nonlocal current_batch, current_gas, batch_values
+        for func in funcs:
+            if current_gas + activation_gas > gas_target and current_gas > tx_base_gas:
+                close_batch()
+                current_batch, current_gas, batch_values = new_batch()
+            current_batch["activate"].append(func)
+            current_gas = current_gas + activation_gas
+
+    # functions without state dependencies are available immediately
+    activate(sorted(func for func, count in remaining.items() if count == 0))
+
+    for var in unique_vars:
+        label = shard_label(byte_ranges, var)
+        mask = FULL_SLOT if label is None else byte_mask(byte_ranges[label])
+
+        for key, val in slot_source(var):
+            slot = int(key, 16)
+            value = int(val, 16) & mask
+            original_value = int(original_state.get(key, "0x0"), 16)
+
+            if key in batch_values:
+                tx_original, current_value = batch_values[key]
+                warm = True
+            else:
+                tx_original = current_value = written.get(key, original_value)
+                warm = False
+            new_value = (current_value & ~mask) | value
+            cost = slot_write_gas(slot, new_value, tx_original, current_value, warm=warm)
+
+            if current_gas + cost > gas_target and current_gas > tx_base_gas:
+                close_batch()
+                yield from closed
+                closed.clear()
+                current_batch, current_gas, batch_values = new_batch()
+                tx_original = current_value = written.get(key, original_value)
+                new_value = (current_value & ~mask) | value
+                cost = slot_write_gas(slot, new_value, tx_original, current_value, warm=False)
+
+            batch_values[key] = (tx_original, new_value)
+            if label is not None:
+                written[key] = new_value
+            current_batch[key] = to_hash(new_value)
+            current_gas = current_gas + cost
+
+        activate(complete_variable(var, remaining, dependents))
+        yield from closed
+        closed.clear()
+
+    if len(current_batch) > 1 or current_batch["activate"]:
+        close_batch()
+    yield from closed
+
+
+def plan_batches(data, unique_vars, dependency_matrix, gas_target, **kwargs):
+    """
+    iter_planned_batches over in-memory shards.
+
+    Args:
+    - data (dict): {var: {slot: value}} shards, e.g. shards.json.
+
+    Returns:
+    - list: The planned batches.
+    """
+    def slot_source(var):
+        label = shard_label(data, var)
+        if label is None:
+            return ()
+        return data[label].items()
+
+    return list(iter_planned_batches(slot_source, unique_vars, dependency_matrix, gas_target, **kwargs))
@@ -0,0 +1,400 @@
+import argparse
+import functools
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from Crypto.Hash import keccak
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+import rpc_client
+import batch_stream
+
+
+# Migration entry point every batch calls on the target contract, declared
+# by IMigrationTarget.sol. A target may name it differently, migration_signature
+# finds it in the target's ABI by its parameter types.
+MIGRATE_SIGNATURE = "migrateBatch(bytes32[],bytes32[],string[])"
+MIGRATE_PARAMETER_TYPES = ("bytes32[]", "bytes32[]", "string[]")
+
+# Replacements must raise the gas price by at least 10% (geth, anvil, hardhat)
+GAS_PRICE_BUMP = 1.125
+# Headroom over the planner's gas estimate
+GAS_MARGIN = 1.2
+
+UNDERPRICED_ERRORS = ("underpriced", "fee too low", "max fee per gas less than block base fee")
+ALREADY_KNOWN_ERRORS = ("already known", "known transaction", "already imported")
+NONCE_TOO_LOW_ERRORS = ("nonce too low", "nonce has already been used")
+
+
+class BatchProcessorError(Exception):
+    pass
+
+
+def get_selector(signature):
+    k = keccak.new(digest_bits=256)
+    k.update(signature.encode())
+    return k.digest()[:4]
+
+
+def load_abi(abi_file):
+    # a plain ABI list, or a compiler / framework artifact with an "abi" entry
+    with open(abi_file, 'r') as file:
+        abi = json.load(file)
+    if isinstance(abi, dict):
+        abi = abi["abi"]
+    return abi
+
+
+def migration_signature(abi):
+    """
+    The migration entry point of a target contract: its one function taking
+    (bytes32[] slots, bytes32[] values, string[] activate).
+
+    Returns:
+    - str: The function signature, e.g. MIGRATE_SIGNATURE.
+    """
+    candidates = [
+        item for item in abi
+        if item.get("type") == "function"
+        and tuple(param["type"] for param in item["inputs"]) == MIGRATE_PARAMETER_TYPES
+    ]
+    if len(candidates) != 1:
+        raise BatchProcessorError(
+            f"Expected one function taking ({','.join(MIGRATE_PARAMETER_TYPES)}) in the target ABI, found {len(candidates)}")
+    return f"{candidates[0]['name']}({','.join(MIGRATE_PARAMETER_TYPES)})"
+
+
+def _word(value):
+    return value.to_bytes(32, "big")
+
+
+def _encode_bytes32_array(values):
+    return _word(len(values)) + b"".join(_word(int(value, 16)) for value in values)
+
+
+def _encode_string_array(strings):
+    heads = []
+    tails = []
+    offset = 32 * len(strings)
+    for string in strings:
+        data = string.encode()
+        padded = data + b"\0" * (-len(data) % 32)
+        heads.append(_word(offset))
+        tails.append(_word(len(data)) + padded)
+        offset = offset + 32 + len(padded)
+    return _word(len(strings)) + b"".join(heads) + b"".join(tails)
+
+
+def encode_batch(batch, signature=MIGRATE_SIGNATURE):
+    """
+    ABI-encodes a batch as a call to migrateBatch(slots, values, activate).
+
+    Returns:
+    - str: 0x-prefixed calldata.
+    """
+    slots = [key for key in batch if key not in ("activate", "gas")]
+    values = [batch[key] for key in slots]
+
+    tails = [_encode_bytes32_array(slots), _encode_bytes32_array(values), _encode_string_array(batch["activate"])]
+    heads = []
+    offset = 32 * len(tails)
+    for tail in tails:
+        heads.append(_word(offset))
+        offset = offset + len(tail)
+
+    return "0x" + (get_selector(signature) + b"".join(heads) + b"".join(tails)).hex()
+
+
+def _error_matches(error, patterns):
+    message = str(error).lower()
+    return any(pattern in message for pattern in patterns)
+
+
+class BatchProcessor:
+    """
+    Submits migration batches to a JSON-RPC node with pipelined nonces.
+
+    Up to window transactions are in flight at once, each with its own
+    nonce, so the node can include several batches per block. Receipts of
+    every in-flight transaction are polled together in one JSON-RPC batch
+    by a background thread, and the next batch is submitted as soon as one
+    is mined. A transaction that is not mined within
+    stuck_after seconds, or that the node rejects as underpriced, is
+    replaced with the same nonce and a bumped gas price; receipts of every
+    sent version are watched until one of them is mined.
+
+    Transactions are sent with eth_sendTransaction from an unlocked sender
+    (Anvil, Hardhat), or signed locally and sent raw when private_key is
+    given, which needs the eth_account package.
+    """
+
+    def __init__(self, client, sender, target, window=8, poll_interval=0.5, stuck_after=30.0, max_resubmits=5, receipt_timeout=600.0, private_key=None, chain_id=None, encode=encode_batch):
+        self.client = client
+        self.sender = sender
+        self.target = target
+        self.window = window
+        self.poll_interval = poll_interval
+        self.stuck_after = stuck_after
+        self.max_resubmits = max_resubmits
+        self.receipt_timeout = receipt_timeout
+        self.private_key = private_key
+        self.chain_id = chain_id
+        self.encode = encode
+
+        self.account = None
+        if private_key is not None:
+            from eth_account import Account
+            self.account = Account.from_key(private_key)
+            if self.chain_id is None:
+                self.chain_id = int(client.call("eth_chainId"), 16)
+
+    def _gas_price(self):
+        return int(self.client.call("eth_gasPrice"), 16)
+
+    def _gas_limit(self, batch, data):
+        if batch.get("gas"):
+            return int(batch["gas"] * GAS_MARGIN)
+        estimate = self.client.call("eth_estimateGas", [{"from": self.sender, "to": self.target, "data": data}])
+        return int(int(estimate, 16) * GAS_MARGIN)
+
+    def _send(self, tx):
+        """
+        Sends one transaction version.
+
+        Returns:
+        - str: Its hash, or None if the node already holds a transaction
+          with this nonce that we cannot identify.
+        """
+        if self.account is None:
+            params = {key: hex(value) if isinstance(value, int) else value for key, value in tx.items()}
+            return self.client.call("eth_sendTransaction", [params])
+
+        signed = self.account.sign_transaction(dict(tx, chainId=self.chain_id, to=self.target))
+        raw = signed.raw_transaction if hasattr(signed, "raw_transaction") else signed.rawTransaction
+        try:
+            return self.client.call("eth_sendRawTransaction", ["0x" + bytes(raw).hex()])
+        except rpc_client.RpcError as e:
+            if _error_matches(e, ALREADY_KNOWN_ERRORS):
+                return "0x" + bytes(signed.hash).hex()
+            raise
+
+    def _submit(self, entry):
+        # sends entry's transaction, bumping the gas price while the node calls it underpriced
+        for _ in range(self.max_resubmits + 1):
+            try:
+                tx_hash = self._send(entry["tx"])
+            except rpc_client.RpcError as e:
+                if _error_matches(e, UNDERPRICED_ERRORS):
+                    entry["tx"]["gasPrice"] = int(entry["tx"]["gasPrice"] * GAS_PRICE_BUMP) + 1
+                    entry["resubmits"] = entry["resubmits"] + 1
+                    continue
+                if _error_matches(e, NONCE_TOO_LOW_ERRORS) and entry["hashes"]:
+                    # an earlier version of this nonce is already mined
+                    break
+                raise BatchProcessorError(f"Batch {entry['index']} (nonce {entry['tx']['nonce']}) rejected: {e}") from e
+            if tx_hash is not None and tx_hash not in entry["hashes"]:
+                entry["hashes"].append(tx_hash)
+            entry["sent_at"] = time.monotonic()
+            return
+        if not entry["hashes"]:
+            raise BatchProcessorError(f"Batch {entry['index']} (nonce {entry['tx']['nonce']}) still underpriced after {self.max_resubmits} resubmits")
+
+    def _collect(self, in_flight, watched, receipts):
+        # pops the mined entries of in_flight, returning their results
+        mined = []
+        for (nonce, tx_hash), receipt in zip(watched, receipts):
+            if receipt is None or isinstance(receipt, rpc_client.RpcError) or nonce not in in_flight:
+                continue
+            entry = in_flight.pop(nonce)
+            mined.append({
+                "index": entry["index"],
+                "nonce": nonce,
+                "tx_hash": tx_hash,
+                "status": int(receipt.get("status", "0x1"), 16),
+                "gas_used": int(receipt["gasUsed"], 16),
+                "block_number": int(receipt["blockNumber"], 16),
+                "submitted_at": entry["first_sent_at"],
+                "mined_at": time.monotonic(),
+                "resubmits": entry["resubmits"],
+            })
+        return mined
+
+    def _poll_receipts(self, in_flight, lock, mined, stop):
+        """
+        Runs in a background thread: polls the receipts of every version of
+        every in-flight transaction in one round trip per poll_interval and
+        puts the results on mined, so submitting never waits for a poll.
+        An error is put on mined as well and ends the thread.
+        """
+        while not stop.is_set():
+            try:
+                with lock:
+                    watched = [(nonce, tx_hash) for nonce, entry in in_flight.items() for tx_hash in entry["hashes"]]
+                if watched:
+                    receipts = self.client.batch([("eth_getTransactionReceipt", [tx_hash]) for _, tx_hash in watched], raise_errors=False)
+                    with lock:
+                        for result in self._collect(in_flight, watched, receipts):
+                            mined.put(result)
+            except Exception as e:
+                mined.put(e)
+                return
+            stop.wait(self.poll_interval)
+
+    def _stuck(self, in_flight):
+        # the entries due for a replacement, taken under the lock
+        now = time.monotonic()
+        stuck = []
+        for entry in in_flight.values():
+            if now - entry["first_sent_at"] > self.receipt_timeout:
+                raise BatchProcessorError(f"Batch {entry['index']} (nonce {entry['tx']['nonce']}) not mined after {self.receipt_timeout}s")
+            if now - entry["sent_at"] > self.stuck_after and entry["resubmits"] < self.max_resubmits:
+                stuck.append(entry)
+        return stuck
+
+    def _replace_stuck(self, stuck):
+        # resubmits with a bumped gas price, without the lock so the poller
+        # keeps collecting receipts during the RPC calls
+        for entry in stuck:
+            entry["tx"]["gasPrice"] = max(int(entry["tx"]["gasPrice"] * GAS_PRICE_BUMP) + 1, self._gas_price())
+            entry["resubmits"] = entry["resubmits"] + 1
+            self._submit(entry)
+
+    def process(self, batches, stop_on_failure=True):
+        """
+        Submits batches in order and waits for all of them to be mined.
+
+        Args:
+        - batches (iterable): Batches as produced by create_function_batches,
+          batch_planner or batch_stream.read_batches; consumed lazily, so a
+          stream that is still being planned can be passed.
+        - stop_on_failure (bool): Stop submitting once a batch reverts and
+          raise after the in-flight ones are mined.
+
+        Returns:
+        - list: One result dict per batch in batch order, with nonce,
+          tx_hash, status, gas_used, block_number, submit and mine times
+          and the number of resubmits.
+        """
+        nonce = int(self.client.call("eth_getTransactionCount", [self.sender, "pending"]), 16)
+        gas_price = self._gas_price()
+
+        results = []
+        in_flight = {}
+        batches = iter(batches)
+        index = 0
+        exhausted = False
+        failed = None
+
+        lock = threading.Lock()
+        mined = queue.Queue()
+        stop = threading.Event()
+        poller = threading.Thread(target=self._poll_receipts, args=(in_flight, lock, mined, stop), daemon=True)
+        poller.start()
+
+        def take(result):
+            nonlocal failed
+            if isinstance(result, Exception):
+                raise result
+            results.append(result)
+            if result["status"] == 0 and failed is None:
+                failed = result
+
+        try:
+            while True:
+                if failed is not None and stop_on_failure:
+                    exhausted = True
+                while not exhausted:
+                    with lock:
+                        if len(in_flight) >= self.window:
+                            break
+                    batch = next(batches, None)
+                    if batch is None:
+                        exhausted = True
+                        break
+                    data = self.encode(batch)
+                    entry = {
+                        "index": index,
+                        "tx": {
+                            "from": self.sender,
+                            "to": self.target,
+                            "data": data,
+                            "nonce": nonce,
+                            "gas": self._gas_limit(batch, data),
+                            "gasPrice": gas_price,
+                            "value": 0,
+                        },
+                        "hashes": [],
+                        "resubmits": 0,
+                    }
+                    self._submit(entry)
+                    entry["first_sent_at"] = entry["sent_at"]
+                    gas_price = max(gas_price, entry["tx"]["gasPrice"])
+                    with lock:
+                        in_flight[nonce] = entry
+                    nonce = nonce + 1
+                    index = index + 1
+
+                with lock:
+                    if exhausted and not in_flight:
+                        break
+
+                # wake up on the next receipt, or after poll_interval to
+                # replace stuck transactions
+                try:
+                    take(mined.get(timeout=self.poll_interval))
+                    while True:
+                        take(mined.get_nowait())
+                except queue.Empty:
+                    pass
+                with lock:
+                    stuck = self._stuck(in_flight)
+                self._replace_stuck(stuck)
+        finally:
+            stop.set()
+            poller.join()
+
+        # results put on the queue before the last in-flight entry was popped
+        while not mined.empty():
+            take(mined.get_nowait())
+
+        results.sort(key=lambda result: result["index"])
+        if failed is not None and stop_on_failure:
+            raise BatchProcessorError(f"Batch {failed['index']} reverted in transaction {failed['tx_hash']}")
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Submit planned migration batches")
+    parser.add_argument("batches", help="batch file written by batch_stream (NDJSON or binary)")
+    parser.add_argument("target", help="address of the migrated contract")
+    parser.add_argument("--rpc", default="http://127.0.0.1:8545", help="JSON-RPC endpoint, e.g. a local anvil or hardhat node")
+    parser.add_argument("--sender", default=None, help="unlocked sender, defaults to the node's first account")
+    parser.add_argument("--private-key", default=os.environ.get("SMARTSHIFT_PRIVATE_KEY"), help="sign locally instead of using an unlocked account")
+    parser.add_argument("-w", "--window", type=int, default=8, help="transactions in flight")
+    parser.add_argument("--abi", default=None, help="ABI or artifact of the target, its migration function is looked up by parameter types (default: IMigrationTarget's migrateBatch)")
+    args = parser.parse_args()
+
+    signature = MIGRATE_SIGNATURE
+    if args.abi is not None:
+        signature = migration_signature(load_abi(args.abi))
+
+    client = rpc_client.get_client(args.rpc)
+    sender = args.sender
+    if args.private_key is not None:
+        from eth_account import Account
+        sender = Account.from_key(args.private_key).address
+    elif sender is None:
+        sender = client.call("eth_accounts")[0]
+
+    processor = BatchProcessor(client, sender, args.target, window=args.window, private_key=args.private_key,
+                               encode=functools.partial(encode_batch, signature=signature))
+    started = time.monotonic()
+    results = processor.process(batch_stream.read_batches(args.batches))
+    elapsed = time.monotonic() - started
+
+    gas_used = sum(result["gas_used"] for result in results)
+    blocks = {result["block_number"] for result in results}
+    print(f"{len(results)} batches in {elapsed:.1f}s over {len(blocks)} blocks, {gas_used} gas")
@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import struct
+import sys
+import batch_gen
+import batch_planner
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+import json_stream
+
+# Binary batch file: magic, then per batch a header
+# (slot count, activation count, gas estimate), the 32-byte slot/value
+# pairs and the activated functions as length-prefixed UTF-8 names
+BINARY_MAGIC = b"SSBATCH1"
+BATCH_HEADER = struct.Struct(">IIQ")
+NAME_LENGTH = struct.Struct(">H")
+
+
+def index_shard_file(stream):
+    """
+    Scans a {var: {slot: value}} shard file once without decoding the slot
+    maps.
+
+    Returns:
+    - dict: {var: byte offset of its slot map}
+    """
+    stream.seek(0)
+    tokens = json_stream.iter_tokens(stream)
+    index = {}
+    json_stream.expect(tokens, "{")
+
+    for offset, token in tokens:
+        if token == "}":
+            break
+        if token == ",":
+            continue
+        var = token
+        json_stream.expect(tokens, ":")
+        index[var] = json_stream.expect(tokens, "{")
+        depth = 1
+        while depth > 0:
+            _, token = next(tokens)
+            if token in ("{", "["):
+                depth = depth + 1
+            elif token in ("}", "]"):
+                depth = depth - 1
+
+    return index
+
+
+def iter_variable_slots(stream, offset):
+    # (slot, value) pairs of the slot map starting at offset
+    stream.seek(offset)
+    tokens = json_stream.iter_tokens(stream)
+    json_stream.expect(tokens, "{")
+
+    for offset, token in tokens:
+        if token == "}":
+            return
+        if token == ",":
+            continue
+        json_stream.expect(tokens, ":")
+        _, value = next(tokens)
+        yield token, value
+
+
+def stream_batches(shard_file, unique_vars, dependency_matrix, gas_target, index=None, **kwargs):
+    """
+    Plans batches straight from a shard file. Only the byte offset of each
+    variable is kept in memory, slot maps are read from disk one variable
+    at a time in priority order and batches are yielded as they complete.
+    Only the values of slots shared by packed variables are remembered
+    across batches, their byte ranges are read from the storage_reorg_info.json
+    and data_types.json next to shard_file unless byte_ranges is given.
+    index, an earlier index_shard_file of the same file, saves the scan.
+    """
+    if kwargs.get("byte_ranges") is None:
+        kwargs["byte_ranges"] = batch_planner.load_byte_ranges(os.path.dirname(os.path.abspath(shard_file)))
+
+    with open(shard_file, "rb") as stream:
+        if index is None:
+            index = index_shard_file(stream)
+
+        def slot_source(var):
+            label = batch_planner.shard_label(index, var)
+            if label is None:
+                return ()
+            return iter_variable_slots(stream, index[label])
+
+        yield from batch_planner.iter_planned_batches(slot_source, unique_vars, dependency_matrix, gas_target, **kwargs)
+
+
+def _word(hex_string):
+    return int(hex_string, 16).to_bytes(32, "big")
+
+
+def write_batches(batches, out_file, fmt="ndjson"):
+    """
+    Writes batches as they arrive, flushing after each one so a submitter
+    tailing out_file can start before planning finishes.
+
+    Args:
+    - fmt (str): "ndjson" (one batch object per line) or "binary".
+
+    Returns:
+    - int: Number of batches written.
+    """
+    count = 0
+    if fmt == "ndjson":
+        with open(out_file, "w") as out:
+            for batch in batches:
+                out.write(json.dumps(batch, separators=(",", ":")) + "\n")
+                out.flush()
+                count = count + 1
+    elif fmt == "binary":
+        with open(out_file, "wb") as out:
+            out.write(BINARY_MAGIC)
+            for batch in batches:
+                slots = [(key, val) for key, val in batch.items() if key not in ("activate", "gas")]
+                parts = [BATCH_HEADER.pack(len(slots), len(batch["activate"]), batch.get("gas", 0))]
+                for key, val in slots:
+                    parts.append(_word(key))
+                    parts.append(_word(val))
+                for func in batch["activate"]:
+                    name = func.encode()
+                    parts.append(NAME_LENGTH.pack(len(name)))
+                    parts.append(name)
+                out.write(b"".join(parts))
+                out.flush()
+                count = count + 1
+    else:
+        raise ValueError(f"Unknown batch format {fmt}")
+    return count
+
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated batch file")
+    return data
+
+
+def read_batches(in_file):
+    # Yields the batches of an NDJSON or binary batch file
+    with open(in_file, "rb") as stream:
+        if stream.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            stream.seek(0)
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        while True:
+            header = stream.read(BATCH_HEADER.size)
+            if not header:
+                return
+            if len(header) != BATCH_HEADER.size:
+                raise ValueError("Truncated batch file")
+            slot_count, activation_count, gas = BATCH_HEADER.unpack(header)
+            batch = {"activate": []}
+            for _ in range(slot_count):
+                pair = _read_exact(stream, 64)
+                batch["0x" + pair[:32].hex()] = "0x" + pair[32:].hex()
+            for _ in range(activation_count):
+                length, = NAME_LENGTH.unpack(_read_exact(stream, NAME_LENGTH.size))
+                batch["activate"].append(_read_exact(stream, length).decode())
+            batch["gas"] = gas
+            yield batch
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plan migration batches from a shard file without loading it")
+    parser.add_argument("shards", help="shards.json with {var: {slot: value}}")
+    parser.add_argument("prio_vec", help="prio_vec.json")
+    parser.add_argument("dp_mat", help="state dependency matrix JSON, {function: [vars]}")
+    parser.add_argument("--gas-target", type=int, default=None, help="gas per batch, defaults to half the latest block gas limit")
+    parser.add_argument("--format", choices=("ndjson", "binary"), default="ndjson")
+    parser.add_argument("-o", "--output", default="batches.ndjson")
+    args = parser.parse_args()
+
+    gas_target = args.gas_target
+    if gas_target is None:
+        _, gas_limit = batch_gen.fetch_latest_block_and_gas_limit()
+        gas_target = batch_planner.gas_target_for_block(gas_limit)
+
+    unique_vars = batch_gen.extract_sorted_vars(args.prio_vec, args.dp_mat)
+    with open(args.dp_mat, 'r') as file:
+        dependency_matrix = json.load(file)
+
+    count = write_batches(stream_batches(args.shards, unique_vars, dependency_matrix, gas_target), args.output, args.format)
+    print(f"Wrote {count} batches to {args.output}")
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import tempfile
+import solcx
+import lru_cache
+
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "SMARTSHIFT_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "smartshift", "solc"),
+)
+
+# Everything the pipeline stages read from a compile, so one compile serves
+# the dependency builder, the priority vector and the state extractor.
+DEFAULT_OUTPUT_SELECTION = {
+    "*": {
+        "*": [
+            "abi",
+            "evm.bytecode",
+            "evm.deployedBytecode",
+            "evm.methodIdentifiers",
+            "metadata",
+            "storageLayout",
+        ],
+        "": [
+            "ast"
+        ]
+    }
+}
+
+# in-process copy of what is on disk, keyed like the files; outputs carry
+# full ASTs, so a long-running process keeps only the most recent ones
+MEMORY_CACHE_SIZE = 64
+memory_cache = lru_cache.LruCache(MEMORY_CACHE_SIZE)
+
+
+def create_standard_input(contract_file, output_selection=None):
+    """
+    Reads a Solidity file and creates a standard JSON input dictionary.
+
+    Args:
+    - contract_file (str): The file path to the Solidity contract.
+    - output_selection (dict): The solc outputSelection, defaults to
+      DEFAULT_OUTPUT_SELECTION.
+
+    Returns:
+    - dict: The standard JSON input for the Solidity compiler.
+    """
+    if output_selection is None:
+        output_selection = DEFAULT_OUTPUT_SELECTION
+
+    with open(contract_file, 'r') as file:
+        content = file.read()
+
+    return {
+        "language": "Solidity",
+        "sources": {
+            contract_file: {
+                "content": content
+            }
+        },
+        "settings": {
+            "outputSelection": output_selection
+        }
+    }
+
+
+def get_cache_key(input_dict, solc_version):
+    # sources, settings (including outputSelection) and compiler version
+    # determine the compiler output, together with the imported files
+    # solc reads from disk, which are checked by import_digests instead
+    canonical = json.dumps(input_dict, sort_keys=True, separators=(",", ":"))
+    digest = hashlib.sha256()
+    digest.update(str(solc_version).encode())
+    digest.update(b"\0")
+    digest.update(canonical.encode())
+    return digest.hexdigest()
+
+
+def read_cache_file(path):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_cache_file(path, output_json):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # write then rename so concurrent readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as file:
+            json.dump(output_json, file)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def file_digest(path):
+    # sha256 of a file's content, None if it cannot be read
+    try:
+        with open(path, 'rb') as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def import_digests(input_dict, output_json):
+    """
+    Returns:
+    - dict: {path: content digest} of every source the compile read from
+      disk rather than from the input, i.e. the imported files.
+    """
+    return {
+        path: file_digest(path)
+        for path in output_json.get("sources", {})
+        if "content" not in input_dict["sources"].get(path, {})
+    }
+
+
+def make_cache_entry(input_dict, output_json):
+    # what is stored under a cache key: the output and the imports it was compiled against
+    return {"imports": import_digests(input_dict, output_json), "output": output_json}
+
+
+def is_current(entry):
+    # whether every import of a cached entry still has the content it was compiled against
+    if not isinstance(entry, dict) or "imports" not in entry or "output" not in entry:
+        return False
+    return all(file_digest(path) == digest for path, digest in entry["imports"].items())
+
+
+def active_solc_version(solc_version=None):
+    # the compiler compile_standard uses when no version is given
+    if solc_version is None:
+        return solcx.get_solc_version()
+    return solc_version
+
+
+def compile_standard(input_dict, solc_version=None, cache_dir=None):
+    """
+    Compiles a standard JSON input, reusing a previous output for the same
+    sources, settings and compiler version if one is cached and the files
+    it imported are unchanged.
+
+    Args:
+    - input_dict (dict): The standard JSON input.
+    - solc_version (str): The solc version to use, defaults to the active
+      solcx version.
+    - cache_dir (str): Where outputs are stored, defaults to DEFAULT_CACHE_DIR.
+
+    Returns:
+    - dict: The standard JSON output.
+    """
+    solc_version = active_solc_version(solc_version)
+    if cache_dir is None:
+        cache_dir = DEFAULT_CACHE_DIR
+
+    key = get_cache_key(input_dict, solc_version)
+    path = os.path.join(cache_dir, key[:2], key + ".json")
+
+    entry = memory_cache.get(path)
+    if entry is not None and is_current(entry):
+        return entry["output"]
+
+    entry = read_cache_file(path)
+    if not is_current(entry):
+        output_json = solcx.compile_standard(input_dict, solc_version=solc_version)
+        entry = make_cache_entry(input_dict, output_json)
+        write_cache_file(path, entry)
+
+    memory_cache.put(path, entry)
+    return entry["output"]
+
+
+def compile_file(contract_file, solc_version=None, cache_dir=None):
+    input_dict = create_standard_input(contract_file)
+    return compile_standard(input_dict, solc_version=solc_version, cache_dir=cache_dir)
+
+
+def get_contract_outputs(output_json, contract_file=None):
+    """
+    Flattens the "contracts" section of a standard JSON output.
+
+    Returns:
+    - dict: {contract name: per-contract output} for contract_file, or for
+      every source if contract_file is None.
+    """
+    contracts = {}
+    for source, source_contracts in output_json.get("contracts", {}).items():
+        if contract_file is not None and source != contract_file:
+            continue
+        for name, outputs in source_contracts.items():
+            contracts[name] = outputs
+    return contracts
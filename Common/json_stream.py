@@ -0,0 +1,51 @@
+import json
+import re
+
+CHUNK_SIZE = 1 << 16
+
+# a structural character or a complete string, after optional whitespace
+TOKEN = re.compile(rb'[ \t\r\n]*(?:([{}\[\]:,])|("(?:[^"\\]|\\.)*"))')
+
+
+def iter_tokens(stream, chunk_size=CHUNK_SIZE):
+    """
+    Tokenizes a JSON document whose scalars are all strings, like
+    shards.json or old_storage.json, reading chunk_size bytes at a time.
+
+    Yields:
+    - tuple: (byte offset, token), where a token is one of the characters
+      {}[]:, or a decoded string.
+    """
+    base = stream.tell()
+    buffer = b""
+    pos = 0
+    eof = False
+
+    while True:
+        match = TOKEN.match(buffer, pos)
+        if match is None:
+            rest = buffer[pos:]
+            if eof:
+                if rest.strip():
+                    raise ValueError(f"Unexpected {rest[:20]!r} at offset {base + pos}, only string values are supported")
+                return
+            # the token runs past the buffer, keep its start and read on
+            more = stream.read(chunk_size)
+            eof = not more
+            base = base + pos
+            buffer = rest + more
+            pos = 0
+            continue
+
+        if match.group(1) is not None:
+            yield base + match.start(1), match.group(1).decode()
+        else:
+            yield base + match.start(2), json.loads(match.group(2))
+        pos = match.end()
+
+
+def expect(tokens, expected):
+    offset, token = next(tokens)
+    if token != expected:
+        raise ValueError(f"Expected {expected!r} at offset {offset}, got {token!r}")
+    return offset
@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+
+
+class LruCache:
+    """
+    Thread-safe dict-like cache holding at most maxsize entries, evicting
+    the least recently used one. maxsize None keeps everything, like the
+    plain dicts the one-shot scripts use.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits = self.hits + 1
+                return self.entries[key]
+            self.misses = self.misses + 1
+            return default
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while self.maxsize is not None and len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions = self.evictions + 1
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self.entries.pop(key, default)
+
+    def get_or_compute(self, key, compute):
+        # compute runs outside the lock, concurrent misses may both compute
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,186 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+
+DEFAULT_TIMEOUT = 30
+
+# HTTP statuses and JSON-RPC error codes providers use for rate limiting
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+RATE_LIMIT_ERROR_CODES = {-32005, -32029, -32090, 429}
+
+
+def infura_url(api_key, network="mainnet"):
+    return f"https://{network}.infura.io/v3/{api_key}"
+
+
+class RpcError(Exception):
+    def __init__(self, error):
+        self.code = error.get("code")
+        self.data = error.get("data")
+        super().__init__(error.get("message", "JSON-RPC error"))
+
+
+class RpcClient:
+    """
+    JSON-RPC client over one pooled HTTP session.
+
+    Calls can be sent one at a time with call() or as JSON-RPC batch arrays
+    with batch(). Batches larger than batch_size are split into chunks that
+    are sent concurrently, at most max_workers at a time. Connection errors,
+    retryable HTTP statuses and rate-limit errors are retried with
+    exponential backoff.
+    """
+
+    def __init__(self, url, max_workers=8, batch_size=100, max_retries=5, backoff=0.5, timeout=DEFAULT_TIMEOUT):
+        self.url = url
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._ids = itertools.count(1)
+        self._ids_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+        self.session.close()
+
+    def _next_id(self):
+        with self._ids_lock:
+            return next(self._ids)
+
+    def _sleep(self, attempt, response=None):
+        delay = self.backoff * (2 ** attempt)
+        if response is not None and "Retry-After" in response.headers:
+            try:
+                delay = max(delay, float(response.headers["Retry-After"]))
+            except ValueError:
+                pass
+        time.sleep(delay)
+
+    def _post(self, payload):
+        # returns the decoded body, retrying transport errors and retryable statuses
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response.json()
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+            if attempt == self.max_retries:
+                response.raise_for_status()
+            self._sleep(attempt, response)
+
+    def call(self, method, params=None):
+        return self.batch([(method, params)])[0]
+
+    def _send_chunk(self, calls):
+        results = [None] * len(calls)
+        pending = list(range(len(calls)))
+
+        for attempt in range(self.max_retries + 1):
+            requests_by_id = {}
+            payload = []
+            for position in pending:
+                method, params = calls[position]
+                request_id = self._next_id()
+                requests_by_id[request_id] = position
+                payload.append({
+                    "jsonrpc": "2.0",
+                    "method": method,
+                    "params": [] if params is None else params,
+                    "id": request_id,
+                })
+
+            responses = self._post(payload)
+            if isinstance(responses, dict):
+                # some servers answer a batch with a single error object
+                if "error" in responses:
+                    responses = [dict(responses, id=request_id) for request_id in requests_by_id]
+                else:
+                    responses = [responses]
+
+            pending = []
+            for response in responses:
+                position = requests_by_id.pop(response.get("id"), None)
+                if position is None:
+                    continue
+                if "error" in response and response["error"] is not None:
+                    if response["error"].get("code") in RATE_LIMIT_ERROR_CODES and attempt < self.max_retries:
+                        pending.append(position)
+                    else:
+                        results[position] = RpcError(response["error"])
+                else:
+                    results[position] = response.get("result")
+            # requests the server dropped are sent again
+            pending.extend(requests_by_id.values())
+
+            if not pending:
+                break
+            if attempt == self.max_retries:
+                for position in pending:
+                    results[position] = RpcError({"code": None, "message": "no response after retries"})
+                break
+            pending.sort()
+            self._sleep(attempt)
+
+        return results
+
+    def batch(self, calls, raise_errors=True):
+        """
+        Sends a list of (method, params) calls.
+
+        Args:
+        - calls (list): (method, params) tuples.
+        - raise_errors (bool): Raise the first RpcError instead of returning it
+          in place of the result.
+
+        Returns:
+        - list: The results in the order of calls.
+        """
+        calls = list(calls)
+        chunks = [calls[i:i + self.batch_size] for i in range(0, len(calls), self.batch_size)]
+
+        if len(chunks) == 1:
+            chunk_results = [self._send_chunk(chunks[0])]
+        else:
+            chunk_results = list(self.executor.map(self._send_chunk, chunks))
+
+        results = [result for chunk in chunk_results for result in chunk]
+        if raise_errors:
+            for result in results:
+                if isinstance(result, RpcError):
+                    raise result
+        return results
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(url, **kwargs):
+    # one pooled client per endpoint for the whole process
+    with _clients_lock:
+        if url not in _clients:
+            _clients[url] = RpcClient(url, **kwargs)
+        return _clients[url]
@@ -0,0 +1,225 @@
+def index_function(function_def):
+    """
+    Collects the call sites and identifier references inside one function.
+
+    Returns:
+    - tuple: ([FunctionCall, ...], [Identifier, ...]) in source order
+    """
+    call_sites = []
+    references = []
+
+    # solcast nodes only iterate their "nodes" list, the child expressions
+    # and statements of every node are kept in _children
+    stack = list(function_def._children)
+    while stack:
+        node = stack.pop()
+        if node.nodeType == "FunctionCall":
+            call_sites.append(node)
+        elif node.nodeType == "Identifier":
+            references.append(node)
+        stack.extend(node._children)
+
+    # _children is a set, source order keeps the results deterministic
+    call_sites.sort(key=lambda node: node.offset)
+    references.sort(key=lambda node: node.offset)
+    return call_sites, references
+
+
+def index_contract(contract_def, walk=None):
+    """
+    Walks a ContractDefinition once and indexes the nodes the dependency
+    builders need.
+
+    Args:
+    - contract_def (solcast node): The ContractDefinition to index.
+    - walk (set): Ids of the functions whose bodies are indexed, defaults
+      to every function. Functions outside the set are still listed in
+      "functions" but get no "call_sites"/"references" entry.
+
+    Returns:
+    - dict: {
+        "functions": {id: FunctionDefinition} for every kind == "function",
+        "state_vars": {id: VariableDeclaration} for every state variable,
+        "call_sites": {function id: [FunctionCall, ...]},
+        "references": {function id: [Identifier, ...]}
+      }
+    """
+    functions = {}
+    state_vars = {}
+    call_sites = {}
+    references = {}
+
+    # functions and state variables are always direct members of the contract,
+    # constructors, fallback and receive are not part of the matrices
+    for node in contract_def:
+        if node.nodeType == "FunctionDefinition" and node.kind == "function":
+            functions[node.id] = node
+            if walk is None or node.id in walk:
+                call_sites[node.id], references[node.id] = index_function(node)
+        elif node.nodeType == "VariableDeclaration" and node.stateVariable:
+            state_vars[node.id] = node
+
+    return {
+        "functions": functions,
+        "state_vars": state_vars,
+        "call_sites": call_sites,
+        "references": references,
+    }
+
+
+def canonical_type(type_string):
+    # drop the data location, e.g. "uint256[] memory" -> "uint256[]"
+    for location in (" storage ref", " storage pointer", " memory", " calldata", " storage"):
+        if type_string.endswith(location):
+            return type_string[:-len(location)]
+    return type_string
+
+
+TYPE_DEFINITIONS = ("StructDefinition", "UserDefinedValueTypeDefinition")
+
+
+def index_type_definitions(scopes, declarations=None):
+    """
+    Indexes the structs and user-defined value types declared in scopes
+    (source units or contracts), at file level or inside a contract.
+
+    Returns:
+    - dict: {id: (ContractDefinition or None, node)}, the form of
+      inheritance.index_declarations, which the entries are added to when
+      given.
+    """
+    if declarations is None:
+        declarations = {}
+    for scope in scopes:
+        contract_def = scope if scope.nodeType == "ContractDefinition" else None
+        for node in scope:
+            if node.nodeType in TYPE_DEFINITIONS:
+                declarations[node.id] = (contract_def, node)
+            elif node.nodeType == "ContractDefinition":
+                index_type_definitions([node], declarations)
+    return declarations
+
+
+def local_declarations(function_def):
+    # the types visible without an index of the whole compile: those of the
+    # function's source unit and of the contracts and types it depends on
+    contract_def = function_def.parent(filters={"nodeType": "ContractDefinition"})
+    dependencies = getattr(contract_def, "dependencies", [])
+    declarations = index_type_definitions(
+        [function_def.parent(0)] + [node for node in dependencies if node.nodeType == "ContractDefinition"])
+    for node in dependencies:
+        if node.nodeType in TYPE_DEFINITIONS:
+            declarations[node.id] = (None, node)
+    return declarations
+
+
+def abi_type(type_name, declarations):
+    """
+    Spells a parameter's TypeName the way the ABI and selectors do:
+    contracts as address, enums as uint8, structs as (member,...) tuples and
+    value types as their underlying type, external function types as
+    function. Types the ABI cannot carry (mappings, internal function
+    types) keep their typeString, as do structs whose definition is not in
+    declarations.
+    """
+    type_string = canonical_type(type_name.typeDescriptions["typeString"])
+
+    if type_name.nodeType == "ArrayTypeName":
+        # the length is only resolved in the typeString, e.g. uint256[N]
+        return abi_type(type_name.baseType, declarations) + "[" + type_string.rsplit("[", 1)[1]
+    if type_name.nodeType == "ElementaryTypeName":
+        return "address" if type_string == "address payable" else type_string
+    if type_name.nodeType == "FunctionTypeName" and type_name.visibility == "external":
+        return "function"
+    if type_name.nodeType != "UserDefinedTypeName":
+        return type_string
+
+    if type_string.startswith(("contract ", "interface ", "library ")):
+        return "address"
+    if type_string.startswith("enum "):
+        return "uint8"
+    declaration = declarations.get(type_name.referencedDeclaration)
+    if declaration is None:
+        return type_string
+    type_def = declaration[1]
+    if type_def.nodeType == "UserDefinedValueTypeDefinition":
+        return abi_type(type_def.underlyingType, declarations)
+    members = ",".join(abi_type(member.typeName, declarations) for member in type_def.members)
+    return f"({members})"
+
+
+def function_signature(function_def, declarations=None):
+    """
+    The canonical signature of a function, with parameter types in ABI form
+    so it hashes to the function's selector.
+
+    Args:
+    - function_def (solcast node): The FunctionDefinition.
+    - declarations (dict): inheritance.index_declarations of the compile,
+      to resolve structs declared in other files. Without it only the
+      function's own source unit and its contract's dependencies are
+      searched.
+    """
+    params = function_def.parameters.parameters
+    if declarations is None and any(
+            param.typeName.nodeType in ("UserDefinedTypeName", "ArrayTypeName") for param in params):
+        declarations = local_declarations(function_def)
+    return f"{function_def.name}(" + ",".join(abi_type(param.typeName, declarations) for param in params) + ")"
+
+
+def readable_function_names(signatures):
+    # plain names, overloads keep their full signature to stay distinct
+    overloads = {}
+    for signature in signatures:
+        overloads.setdefault(signature.split("(", 1)[0], []).append(signature)
+    return {
+        signature: name if len(signatures) == 1 else signature
+        for name, signatures in overloads.items()
+        for signature in signatures
+    }
+
+
+def build_symbol_table(contract_def, contract_index=None):
+    """
+    Builds a lookup table from AST ids to the declarations of a contract.
+
+    Args:
+    - contract_def (solcast node): The ContractDefinition to describe.
+    - contract_index (dict): The output of index_contract for contract_def,
+      built on demand if not given.
+
+    Returns:
+    - dict: {id: {"name", "nodeType", "signature", "offset", "readable"}}
+      for every function and state variable of the contract. "readable" is
+      the name the dependency matrices use: the function name, or its
+      signature when overloaded, and "Contract.variable" for state.
+    """
+    if contract_index is None:
+        contract_index = index_contract(contract_def)
+
+    symbol_table = {}
+
+    for function_id, function_def in contract_index["functions"].items():
+        symbol_table[function_id] = {
+            "name": function_def.name,
+            "nodeType": function_def.nodeType,
+            "signature": function_signature(function_def),
+            "offset": function_def.offset,
+        }
+
+    for var_id, var_decl in contract_index["state_vars"].items():
+        symbol_table[var_id] = {
+            "name": var_decl.name,
+            "nodeType": var_decl.nodeType,
+            "signature": canonical_type(var_decl.typeDescriptions["typeString"]),
+            "offset": var_decl.offset,
+            "readable": contract_def.name + "." + var_decl.name,
+        }
+
+    names = readable_function_names(
+        entry["signature"] for entry in symbol_table.values() if entry["nodeType"] == "FunctionDefinition")
+    for entry in symbol_table.values():
+        if entry["nodeType"] == "FunctionDefinition":
+            entry["readable"] = names[entry["signature"]]
+
+    return symbol_table
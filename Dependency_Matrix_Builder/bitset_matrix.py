@@ -0,0 +1,131 @@
+class BitsetMatrix:
+    """
+    Function x state variable dependency matrix with one packed integer row
+    per function. Bit i of a row is set when the function depends on the
+    state variable in column i.
+
+    This is an alternative to the dict-of-sets form used by dp_builder:
+    merging two rows is a single integer OR instead of a set union, and a
+    row costs one bit per state variable instead of one set entry.
+    """
+
+    __slots__ = ("columns", "column_index", "rows")
+
+    def __init__(self, columns, rows=None):
+        self.columns = list(columns)
+        self.column_index = {state_var: i for i, state_var in enumerate(self.columns)}
+        self.rows = {} if rows is None else dict(rows)
+
+    @classmethod
+    def from_sets(cls, state_dependency_matrix, state_vars=None):
+        """
+        Packs a {function id: set(state var ids)} matrix.
+
+        Args:
+        - state_dependency_matrix (dict): The dict-of-sets matrix.
+        - state_vars (iterable): The column order, defaults to the sorted ids
+          of every state variable referenced by the matrix.
+        """
+        if state_vars is None:
+            state_vars = sorted(set().union(*state_dependency_matrix.values()))
+        matrix = cls(state_vars)
+        for func, dependencies in state_dependency_matrix.items():
+            matrix.rows[func] = matrix.pack(dependencies)
+        return matrix
+
+    @classmethod
+    def from_readable(cls, readable_state_dependency_matrix, symbol_table):
+        # names are mapped back to ids through the "readable" names of the
+        # contract's symbol table, overloads keyed by their signature
+        function_ids = {}
+        state_ids = {}
+        for node_id, entry in symbol_table.items():
+            if entry["nodeType"] == "FunctionDefinition":
+                function_ids[entry["readable"]] = node_id
+            else:
+                state_ids[entry["readable"]] = node_id
+
+        return cls.from_sets(
+            {
+                function_ids[func]: {state_ids[name] for name in state_vars}
+                for func, state_vars in readable_state_dependency_matrix.items()
+            },
+            state_vars=sorted(state_ids.values()),
+        )
+
+    def pack(self, state_vars):
+        row = 0
+        for state_var in state_vars:
+            row |= 1 << self.column_index[state_var]
+        return row
+
+    def unpack(self, row):
+        state_vars = set()
+        while row:
+            low_bit = row & -row
+            state_vars.add(self.columns[low_bit.bit_length() - 1])
+            row ^= low_bit
+        return state_vars
+
+    def to_sets(self):
+        return {func: self.unpack(row) for func, row in self.rows.items()}
+
+    def to_readable(self, symbol_table):
+        return {
+            symbol_table[func]["readable"]: {symbol_table[state_var]["readable"] for state_var in self.unpack(row)}
+            for func, row in self.rows.items()
+        }
+
+    def to_numpy(self):
+        """
+        Returns (function ids, state var ids, dense boolean matrix). NumPy is
+        only needed for this export.
+        """
+        import numpy as np
+
+        funcs = list(self.rows)
+        width = len(self.columns)
+        dense = np.zeros((len(funcs), width), dtype=bool)
+        if width:
+            num_bytes = (width + 7) // 8
+            packed = np.frombuffer(
+                b"".join(self.rows[func].to_bytes(num_bytes, "little") for func in funcs),
+                dtype=np.uint8,
+            ).reshape(len(funcs), num_bytes)
+            dense[:] = np.unpackbits(packed, axis=1, bitorder="little")[:, :width]
+        return funcs, list(self.columns), dense
+
+    def count(self, func):
+        return bin(self.rows[func]).count("1")
+
+    def close(self, func_sorted_order, func_dependency_matrix):
+        """
+        ORs the rows of every callee into its caller, callees first. Only
+        valid for an acyclic call graph, see close_components.
+        """
+        rows = self.rows
+        for func in func_sorted_order:
+            row = rows[func]
+            for dependent_func in func_dependency_matrix[func]:
+                row |= rows[dependent_func]
+            rows[func] = row
+        return self
+
+    def close_components(self, components, func_dependency_matrix):
+        """
+        Closure over strongly connected components in callees-first order,
+        see dp_builder.close_state_dependency_matrix. Every member of a
+        component ends up with the same row.
+        """
+        rows = self.rows
+        for component in components:
+            row = 0
+            for func in component:
+                row |= rows[func]
+                # rows of callees in the same component are still direct rows,
+                # ORing them in is harmless
+                for dependent_func in func_dependency_matrix[func]:
+                    row |= rows[dependent_func]
+            for func in component:
+                rows[func] = row
+        return self
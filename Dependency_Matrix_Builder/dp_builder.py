@@ -1,178 +1,136 @@
-import subprocess
-import json
 import sys
 import os
-import re
 import solcast
-import solcx
-from collections import deque
-import requests
+from ast_index import index_contract, build_symbol_table
+from bitset_matrix import BitsetMatrix
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+import compile_cache
 
 
+def construct_function_dependency_graph(contract_def, contract_index=None):
+    if contract_index is None:
+        contract_index = index_contract(contract_def)
 
-def create_solc_input_json(contract_file):
-    """
-    Reads a Solidity file and creates a JSON input for the Solidity compiler.
-
-    Args:
-    - contract_file (str): The file path to the Solidity contract.
-
-    Returns:
-    - str: A JSON string configured for use with the Solidity compiler, or
-      an error message if the file could not be found.
-    """
-    # Read the contents of the Solidity file
-    try:
-        with open(contract_file, 'r') as file:
-            content = file.read()
-    except FileNotFoundError:
-        return f"Error: The file '{contract_file}' does not exist."
-
-    # Define the input dictionary for the compiler
-    input_dict = {
-        "language": "Solidity",
-        "sources": {
-            contract_file: {
-                "content": content
-            }
-        },
-        "settings": {
-            "outputSelection": {
-                "*": {
-          "*": [
-            "abi",
-            "evm.bytecode",
-            "evm.deployedBytecode",
-            "evm.methodIdentifiers",
-            "metadata"
-          ],
-          "": [
-            "ast"
-          ]
-        }
-
-            }
-        }
-    }
-
-    # Convert the Python dictionary to a JSON string
-    input_json = json.dumps(input_dict, indent=4)
-    
-    return input_json
-
-
-
-
-
-def construct_function_dependency_graph(contract_def):
     dependency_graph = {}
+    functions = contract_index["functions"]
 
-    function_defs = contract_def.children(
-        include_children=False,
-        filters={'nodeType': "FunctionDefinition", 'kind':"function"}
-    )
-    
-    
-    for function_def in function_defs:
-        dependency_graph[function_def.id] = set()
-        function_calls = function_def.children(
-            include_children=False,
-            filters={'nodeType': "FunctionCall"}
-            )
-        if len(function_calls) > 0:
-            for function_call in function_calls:
-                if function_call.expression.nodeType == "Identifier" and any(func_def.id == function_call.expression.referencedDeclaration for func_def in function_defs) and (function_def.id != function_call.expression.referencedDeclaration):
-                    dependency_graph[function_def.id].add(function_call.expression.referencedDeclaration)
-                    
+    for function_id, function_calls in contract_index["call_sites"].items():
+        dependency_graph[function_id] = set()
+        for function_call in function_calls:
+            if function_call.expression.nodeType == "Identifier":
+                callee = function_call.expression.referencedDeclaration
+                if callee in functions and callee != function_id:
+                    dependency_graph[function_id].add(callee)
 
     return dependency_graph
 
 
-def construct_state_dependency_matrix(contract_def):
+def construct_state_dependency_matrix(contract_def, contract_index=None):
+    if contract_index is None:
+        contract_index = index_contract(contract_def)
+
     state_dependency_matrix = {}
-    state_vars = contract_def.children(
-        include_children=False,
-        filters={'nodeType': "VariableDeclaration",'stateVariable':True}
-    )
+    state_vars = contract_index["state_vars"]
 
-    function_defs = contract_def.children(
-        include_children=False,
-        filters={'nodeType': "FunctionDefinition", 'kind':"function"}
-    )
+    for function_id, identifiers in contract_index["references"].items():
+        state_dependency_matrix[function_id] = {
+            identifier.referencedDeclaration
+            for identifier in identifiers
+            if identifier.referencedDeclaration in state_vars
+        }
 
-    for function_def in function_defs:
-        state_dependency_matrix[function_def.id] = set()
-        identifiers = function_def.children(
-            include_children=False,
-            filters={'nodeType': "Identifier"}
-        )
-        for identifier in identifiers:
-            if any(state_var.id == identifier.referencedDeclaration for state_var in state_vars):
-                state_dependency_matrix[function_def.id].add(identifier.referencedDeclaration)
-
-    return state_dependency_matrix    
-    
+    return state_dependency_matrix
 
-def detect_cycle(graph):
-    visited = set()
-    rec_stack = set()
-
-    def dfs(node):
-        if node in rec_stack:
-            return True  # Cycle detected
-        if node in visited:
-            return False
-
-        visited.add(node)
-        rec_stack.add(node)
-        
-        # Recur for all vertices adjacent to this vertex
-        for neighbor in graph[node]:
-            if dfs(neighbor):
-                return True
-
-        rec_stack.remove(node)
-        return False
-
-    for node in graph:
-        if node not in visited:
-            if dfs(node):
-                return True
-    return False
-
-def topological_sort(graph):
-    in_degree = {node: 0 for node in graph}
-    for node in graph:
-        for neighbor in graph[node]:
-            in_degree[neighbor] += 1
-    
-    queue = deque([node for node in in_degree if in_degree[node] == 0])
-    topo_order = []
-
-    while queue:
-        vertex = queue.popleft()
-        topo_order.append(vertex)
-        
-        for neighbor in graph[vertex]:
-            in_degree[neighbor] -= 1
-            if in_degree[neighbor] == 0:
-                queue.append(neighbor)
-    
-    if len(topo_order) == len(graph):
-        topo_order.reverse()
-        return topo_order
-    else:
-        return None  # This means there was a cycle, which should not happen here
 
+def strongly_connected_components(graph):
+    """
+    Iterative Tarjan's algorithm, so deep call chains do not hit Python's
+    recursion limit.
 
-def modify_state_dependency_matrix(func_sorted_order, func_dependency_matrix, state_dependency_matrix):
+    Args:
+    - graph (dict): {node: set(successors)}, every successor is a key.
 
-    for func in func_sorted_order:
-        for dpendent_func in func_dependency_matrix[func]:
-            state_dependency_matrix[func] = state_dependency_matrix[func] | state_dependency_matrix[dpendent_func]
+    Returns:
+    - list: The strongly connected components as lists of nodes. A component
+      comes after every component it has an edge to, i.e. callees first.
+    """
+    index = {}
+    lowlink = {}
+    on_stack = set()
+    stack = []
+    components = []
+
+    for root in graph:
+        if root in index:
+            continue
+
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph[root]))]
+
+        while work:
+            node, neighbors = work[-1]
+            descended = False
+            for neighbor in neighbors:
+                if neighbor not in index:
+                    index[neighbor] = lowlink[neighbor] = len(index)
+                    stack.append(neighbor)
+                    on_stack.add(neighbor)
+                    work.append((neighbor, iter(graph[neighbor])))
+                    descended = True
+                    break
+                elif neighbor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[neighbor])
+            if descended:
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+
+    return components
+
+
+def close_state_dependency_matrix(func_dependency_matrix, state_dependency_matrix, components=None):
+    """
+    Computes the transitive state dependencies of every function over the
+    condensation of the call graph. Functions in one strongly connected
+    component (mutual recursion) depend on the union of the component's
+    state variables, so recursive contracts need no special casing.
 
-    return state_dependency_matrix
+    Returns:
+    - dict: {function id: set(state var ids)}, a new matrix.
+    """
+    if components is None:
+        components = strongly_connected_components(func_dependency_matrix)
+
+    closed = {}
+    for component in components:
+        state_vars = set()
+        for func in component:
+            state_vars |= state_dependency_matrix[func]
+            for dependent_func in func_dependency_matrix[func]:
+                # callees in the same component are not closed yet, their
+                # direct dependencies are already part of state_vars
+                if dependent_func in closed:
+                    state_vars |= closed[dependent_func]
+        for func in component:
+            closed[func] = state_vars if len(component) == 1 else set(state_vars)
+
+    return closed
 
 
 
@@ -193,78 +151,76 @@ def calculate_function_activation_threshold(contract_def,state_dependency_matrix
     print(len(var_decl))        
     print(count_of_vars/count_of_funcs)    
 
-def construct_readable_function_dependency_matrix(contract_def,func_dependency_matrix):
+def construct_readable_function_dependency_matrix(contract_def,func_dependency_matrix,symbol_table=None):
+    if symbol_table is None:
+        symbol_table = build_symbol_table(contract_def)
+
     readable_func_dependency_matrix = {}
 
     for func,dependencies in func_dependency_matrix.items():
-        
-        function_def = contract_def.children(
-            include_children=False,
-            filters={'nodeType': "FunctionDefinition", 'id':func}
-        )
-
-        readable_func_dependency_matrix[function_def[0].name] = set()
-
-        for dependency in dependencies:
-
-            dependency_def = contract_def.children(
-                include_children=False,
-                filters={'nodeType': "FunctionDefinition", 'id':dependency}
-            )
-
-            readable_func_dependency_matrix[function_def[0].name].add(dependency_def[0].name)
+        readable_func_dependency_matrix[symbol_table[func]["readable"]] = {
+            symbol_table[dependency]["readable"] for dependency in dependencies
+        }
 
-    
     return readable_func_dependency_matrix
 
 
 
-def construct_readable_state_dependency_matrix(contract_def,state_dependency_matrix):
+def construct_readable_state_dependency_matrix(contract_def,state_dependency_matrix,symbol_table=None):
+    if symbol_table is None:
+        symbol_table = build_symbol_table(contract_def)
+
     readable_state_dependency_matrix = {}
 
     for func,dependencies in state_dependency_matrix.items():
-        
-        function_def = contract_def.children(
-            include_children=False,
-            filters={'nodeType': "FunctionDefinition", 'id':func}
-        )
+        readable_state_dependency_matrix[symbol_table[func]["readable"]] = {
+            symbol_table[dependency]["readable"] for dependency in dependencies
+        }
 
-        readable_state_dependency_matrix[function_def[0].name] = set()
+    return readable_state_dependency_matrix
 
-        for dependency in dependencies:
+def analyze_contract(contract_def, backend="sets"):
+    contract_index = index_contract(contract_def)
+    symbol_table = build_symbol_table(contract_def, contract_index)
+    func_dependency_matrix = construct_function_dependency_graph(contract_def, contract_index)
+    #readable_func_dependency_matrix = construct_readable_function_dependency_matrix(contract_def,func_dependency_matrix,symbol_table)
+    #print(readable_func_dependency_matrix)
+    state_dependency_matrix = construct_state_dependency_matrix(contract_def, contract_index)
+    # mutually recursive functions are collapsed instead of rejected
+    components = strongly_connected_components(func_dependency_matrix)
+    if backend == "bitset":
+        bitset_matrix = BitsetMatrix.from_sets(state_dependency_matrix, sorted(contract_index["state_vars"]))
+        bitset_matrix.close_components(components, func_dependency_matrix)
+        return bitset_matrix.to_readable(symbol_table)
 
-            dependency_def = contract_def.children(
-                include_children=False,
-                filters={'nodeType': "VariableDeclaration",'stateVariable':True,'id':dependency}
-            )
+    state_dependency_matrix = close_state_dependency_matrix(func_dependency_matrix, state_dependency_matrix, components)
+    return construct_readable_state_dependency_matrix(contract_def,state_dependency_matrix,symbol_table)
 
-            readable_state_dependency_matrix[function_def[0].name].add(dependency_def[0].name)
 
-    
-    return readable_state_dependency_matrix
+def analyze_file(contract_filename, backend="sets", solc_version=None):
+    # inheritance builds on the closure helpers above, import it late
+    from inheritance import index_declarations, get_source_texts, analyze_linearized_contract
 
-contract_filename = 'Tokens/ERC-1155/ERC-1155.sol'
-json_input = create_solc_input_json(contract_filename)
-output_json = solcx.compile_standard(json.loads(json_input))
-source_units = solcast.from_standard_output(output_json)
-contract_defs = source_units[0].children(filters={'nodeType': "ContractDefinition",'contractKind':"contract"})
+    solc_version = compile_cache.active_solc_version(solc_version)
+    input_dict = compile_cache.create_standard_input(contract_filename)
+    output_json = compile_cache.compile_standard(input_dict, solc_version)
+    source_units = solcast.from_standard_output(output_json)
+    declarations = index_declarations(source_units)
+    source_texts = get_source_texts(input_dict, output_json)
+    contract_defs = source_units[0].children(filters={'nodeType': "ContractDefinition",'contractKind':"contract"})
 
-for contract_def in contract_defs:   
-    func_dependency_matrix = construct_function_dependency_graph(contract_def)
-    #readable_func_dependency_matrix = construct_readable_function_dependency_matrix(contract_def,func_dependency_matrix)
-    #print(readable_func_dependency_matrix)
-    state_dependency_matrix = construct_state_dependency_matrix(contract_def)
-    if detect_cycle(func_dependency_matrix):
-        raise ValueError("Cycle detected in the graph")
-    
-    sorted_order = topological_sort(func_dependency_matrix)
-    state_dependency_matrix = modify_state_dependency_matrix(sorted_order,func_dependency_matrix,state_dependency_matrix)
-    readable_state_dependency_matrix = construct_readable_state_dependency_matrix(contract_def,state_dependency_matrix)
-    print(readable_state_dependency_matrix)
-    
-    
+    readable_state_dependency_matrices = {}
+    for contract_def in contract_defs:
+        # base contract summaries are cached, every derived contract reuses them
+        readable_state_dependency_matrices[contract_def.name] = analyze_linearized_contract(
+            contract_def, declarations, source_texts, backend, solc_version=solc_version)
 
+    return readable_state_dependency_matrices
 
 
+if __name__ == "__main__":
 
+    contract_filename = 'Tokens/ERC-1155/ERC-1155.sol'
 
+    for contract_name, readable_state_dependency_matrix in analyze_file(contract_filename).items():
+        print(readable_state_dependency_matrix)
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import sys
+import solcast
+from ast_index import function_signature
+from inheritance import index_declarations, get_source_texts, summarize_node, analyze_linearized_contract
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+import compile_cache
+
+SNAPSHOT_VERSION = 3
+
+# AST ids are renumbered on every compile, so snapshots identify functions by
+# signature and modifiers by name. Snapshots hold the per-declaration
+# summaries of inheritance.py; the closure over the linearization is always
+# rebuilt by analyze_linearized_contract, so incremental and full runs agree.
+
+
+def function_hash(source, function_def):
+    # hash of the function's source text, offsets are byte offsets into source
+    start, end = function_def.offset
+    return hashlib.sha256(source[start:end]).hexdigest()
+
+
+def context_hash(contract_def, declarations, solc_version=None):
+    # Declarations that name resolution inside an unchanged function depends
+    # on: the functions, modifiers and state variables of every contract in
+    # the linearization. If any of them change every function is recomputed.
+    context = [str(solc_version)]
+    for base_id in contract_def.linearizedBaseContracts:
+        base_def = declarations[base_id][0]
+        functions = []
+        modifiers = []
+        state_names = []
+        for node in base_def:
+            if node.nodeType == "FunctionDefinition":
+                functions.append(function_signature(node, declarations))
+            elif node.nodeType == "ModifierDefinition":
+                modifiers.append(node.name)
+            elif node.nodeType == "VariableDeclaration" and node.stateVariable:
+                state_names.append(node.name)
+        context.append([base_def.name, base_def.contractKind, sorted(functions), sorted(modifiers), sorted(state_names)])
+    return hashlib.sha256(json.dumps(context).encode()).hexdigest()
+
+
+def load_snapshot(snapshot_file):
+    try:
+        with open(snapshot_file, 'r') as file:
+            snapshot = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"version": SNAPSHOT_VERSION, "contracts": {}}
+
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return {"version": SNAPSHOT_VERSION, "contracts": {}}
+    return snapshot
+
+
+def save_snapshot(snapshot_file, snapshot):
+    tmp_file = snapshot_file + ".tmp"
+    with open(tmp_file, 'w') as file:
+        json.dump(snapshot, file, indent=2, sort_keys=True)
+    os.replace(tmp_file, snapshot_file)
+
+
+def summarize_contract_incremental(contract_def, declarations, source_texts, previous=None, solc_version=None):
+    """
+    inheritance.summarize_contract, reusing the summaries of an earlier run
+    for functions and modifiers whose source did not change.
+
+    Args:
+    - contract_def (solcast node): The ContractDefinition to summarize.
+    - declarations (dict): inheritance.index_declarations of the compile.
+    - source_texts (dict): inheritance.get_source_texts of the compile.
+    - previous (dict): This contract's entry of an earlier snapshot, or None.
+
+    Returns:
+    - tuple: (contract summary, new snapshot entry, number of bodies walked)
+    """
+    source = source_texts.get(contract_def.contract_id)
+    context = context_hash(contract_def, declarations, solc_version)
+    if previous is None or previous.get("context") != context:
+        previous = {"functions": {}, "modifiers": {}}
+
+    summary = {"name": contract_def.name, "functions": {}, "modifiers": {}}
+    entry = {"context": context, "functions": {}, "modifiers": {}}
+    walked = 0
+
+    for node in contract_def:
+        if node.nodeType == "FunctionDefinition" and node.kind == "function":
+            group, key = "functions", function_signature(node, declarations)
+        elif node.nodeType == "ModifierDefinition":
+            group, key = "modifiers", node.name
+        else:
+            continue
+
+        node_hash = None if source is None else function_hash(source, node)
+        previous_entry = previous[group].get(key)
+        if node_hash is not None and previous_entry is not None and previous_entry["hash"] == node_hash:
+            node_summary = previous_entry["summary"]
+        else:
+            # only the bodies of changed declarations are walked
+            node_summary = summarize_node(node, declarations)
+            walked = walked + 1
+
+        summary[group][key] = node_summary
+        entry[group][key] = {"hash": node_hash, "summary": node_summary}
+
+    return summary, entry, walked
+
+
+def analyze_file_incremental(contract_filename, snapshot_file=None, backend="sets", solc_version=None):
+    """
+    dp_builder.analyze_file, re-summarizing only the functions whose source
+    changed since the run that wrote snapshot_file.
+
+    Returns:
+    - tuple: ({contract: readable state dependency matrix},
+      {declaring contract: number of bodies walked})
+    """
+    if snapshot_file is None:
+        snapshot_file = contract_filename + ".deps.json"
+
+    solc_version = compile_cache.active_solc_version(solc_version)
+    input_dict = compile_cache.create_standard_input(contract_filename)
+    output_json = compile_cache.compile_standard(input_dict, solc_version)
+    source_units = solcast.from_standard_output(output_json)
+    declarations = index_declarations(source_units)
+    source_texts = get_source_texts(input_dict, output_json)
+    contract_defs = source_units[0].children(filters={'nodeType': "ContractDefinition",'contractKind':"contract"})
+
+    snapshot = load_snapshot(snapshot_file)
+    summaries = {}
+    recomputed = {}
+
+    def base_summary(base_def):
+        # bases shared by several contracts are summarized once per run
+        if base_def.id not in summaries:
+            summary, entry, walked = summarize_contract_incremental(
+                base_def, declarations, source_texts, snapshot["contracts"].get(base_def.name), solc_version)
+            snapshot["contracts"][base_def.name] = entry
+            summaries[base_def.id] = summary
+            recomputed[base_def.name] = walked
+        return summaries[base_def.id]
+
+    readable_state_dependency_matrices = {}
+    for contract_def in contract_defs:
+        readable_state_dependency_matrices[contract_def.name] = analyze_linearized_contract(
+            contract_def, declarations, source_texts, backend, solc_version=solc_version, base_summary=base_summary)
+
+    save_snapshot(snapshot_file, snapshot)
+    return readable_state_dependency_matrices, recomputed
+
+
+if __name__ == "__main__":
+
+    contract_filename = sys.argv[1] if len(sys.argv) > 1 else 'Tokens/ERC-1155/ERC-1155.sol'
+    snapshot_file = sys.argv[2] if len(sys.argv) > 2 else None
+
+    matrices, recomputed = analyze_file_incremental(contract_filename, snapshot_file)
+    for contract_name, walked in recomputed.items():
+        print(f"{contract_name}: recomputed {walked} functions", file=sys.stderr)
+    for contract_name, readable_state_dependency_matrix in matrices.items():
+        print(readable_state_dependency_matrix)
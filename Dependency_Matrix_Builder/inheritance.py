@@ -0,0 +1,289 @@
+import hashlib
+import os
+import sys
+from ast_index import index_function, index_type_definitions, function_signature, readable_function_names
+from dp_builder import close_state_dependency_matrix, strongly_connected_components
+from bitset_matrix import BitsetMatrix
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+import compile_cache
+import lru_cache
+
+SUMMARY_VERSION = 2
+
+SUMMARY_CACHE_DIR = os.path.join(os.path.dirname(compile_cache.DEFAULT_CACHE_DIR), "summaries")
+
+# Contract summaries describe a contract's own functions and modifiers by
+# signature and name rather than AST id, so a summary computed for a base
+# contract (e.g. an OpenZeppelin base) in one compile can be reused by every
+# derived contract of a batch, even though each compile numbers ids anew.
+SUMMARY_CACHE_SIZE = 1024
+summary_cache = lru_cache.LruCache(SUMMARY_CACHE_SIZE)
+
+
+def index_declarations(source_units):
+    """
+    Indexes the contract-level declarations of every source unit.
+
+    Returns:
+    - dict: {id: (ContractDefinition, node)} for every contract, function,
+      modifier and state variable. Contracts map to themselves. Structs and
+      user-defined value types are included for function_signature, those
+      at file level with None as their contract.
+    """
+    declarations = {}
+    for source_unit in source_units:
+        for contract_def in source_unit:
+            if contract_def.nodeType != "ContractDefinition":
+                continue
+            declarations[contract_def.id] = (contract_def, contract_def)
+            for node in contract_def:
+                if node.nodeType in ("FunctionDefinition", "ModifierDefinition"):
+                    declarations[node.id] = (contract_def, node)
+                elif node.nodeType == "VariableDeclaration" and node.stateVariable:
+                    declarations[node.id] = (contract_def, node)
+    return index_type_definitions(source_units, declarations)
+
+
+def _summarize_body(node, declarations, modifier_invocations):
+    calls = set()
+    state = set()
+    modifiers = set()
+
+    call_sites, references = index_function(node)
+
+    for function_call in call_sites:
+        expression = function_call.expression
+        if expression.nodeType not in ("Identifier", "MemberAccess"):
+            continue
+        target = declarations.get(getattr(expression, "referencedDeclaration", None))
+        if target is None or target[1].nodeType != "FunctionDefinition":
+            continue
+        target_contract, target_def = target
+        # libraries hold no state, storage they are handed shows up as an
+        # identifier at the call site
+        if target_contract.contractKind == "library":
+            continue
+        signature = function_signature(target_def, declarations)
+        if expression.nodeType == "Identifier" or (
+                expression.expression.nodeType == "Identifier" and expression.expression.name == "this"):
+            # internal and this.f() calls dispatch virtually
+            calls.add(("virtual", signature))
+        else:
+            # super.f() and Base.f() are bound statically
+            calls.add(("static", target_contract.name + "." + signature))
+
+    for identifier in references:
+        target = declarations.get(identifier.referencedDeclaration)
+        if target is not None and target[1].nodeType == "VariableDeclaration":
+            state.add(target[0].name + "." + target[1].name)
+
+    for invocation in modifier_invocations:
+        target = declarations.get(invocation.modifierName.referencedDeclaration)
+        # base constructor calls are listed as modifiers too
+        if target is not None and target[1].nodeType == "ModifierDefinition":
+            modifiers.add(target[1].name)
+
+    return {
+        "calls": sorted(list(call) for call in calls),
+        "state": sorted(state),
+        "modifiers": sorted(modifiers),
+    }
+
+
+def summarize_node(node, declarations):
+    # summary of one function (kind == "function") or modifier declaration
+    if node.nodeType == "ModifierDefinition":
+        return _summarize_body(node, declarations, [])
+    summary = _summarize_body(node, declarations, node.modifiers)
+    summary["kind"] = node.kind
+    summary["implemented"] = node.implemented
+    return summary
+
+
+def summarize_contract(contract_def, declarations):
+    """
+    Summarizes the functions and modifiers a contract declares itself.
+
+    Returns:
+    - dict: {
+        "name": contract name,
+        "functions": {signature: {"kind", "implemented", "calls", "state", "modifiers"}},
+        "modifiers": {name: {"calls", "state", "modifiers"}}
+      }
+      where "calls" holds ["virtual", signature] or ["static", "Contract.signature"]
+      pairs and "state" holds "Contract.variable" names.
+    """
+    functions = {}
+    modifiers = {}
+
+    for node in contract_def:
+        if node.nodeType == "FunctionDefinition" and node.kind == "function":
+            functions[function_signature(node, declarations)] = summarize_node(node, declarations)
+        elif node.nodeType == "ModifierDefinition":
+            modifiers[node.name] = summarize_node(node, declarations)
+
+    return {"name": contract_def.name, "functions": functions, "modifiers": modifiers}
+
+
+def summary_key(contract_def, declarations, source_texts, solc_version=None):
+    # A summary depends on the contract's own text, on the declarations it
+    # can resolve names to, i.e. the text of its linearized bases, and on
+    # the compiler that resolved them.
+    digest = hashlib.sha256(str(SUMMARY_VERSION).encode())
+    digest.update(str(solc_version).encode() + b"\0")
+    for base_id in contract_def.linearizedBaseContracts:
+        base_def = declarations[base_id][0]
+        source = source_texts.get(base_def.contract_id)
+        if source is None:
+            return None
+        start, end = base_def.offset
+        digest.update(base_def.name.encode() + b"\0")
+        digest.update(hashlib.sha256(source[start:end]).digest())
+    return digest.hexdigest()
+
+
+def get_summary(contract_def, declarations, source_texts, cache_dir=None, solc_version=None):
+    """
+    Returns the summary of contract_def, from the in-process cache, from the
+    on-disk cache in cache_dir, or computed and stored in both.
+    """
+    key = summary_key(contract_def, declarations, source_texts, solc_version)
+    if key is None:
+        return summarize_contract(contract_def, declarations)
+
+    summary = summary_cache.get(key)
+    if summary is not None:
+        return summary
+
+    if cache_dir is None:
+        cache_dir = SUMMARY_CACHE_DIR
+    path = os.path.join(cache_dir, key[:2], key + ".json")
+
+    summary = compile_cache.read_cache_file(path)
+    if summary is None:
+        summary = summarize_contract(contract_def, declarations)
+        compile_cache.write_cache_file(path, summary)
+
+    summary_cache.put(key, summary)
+    return summary
+
+
+def get_source_texts(input_dict, output_json):
+    """
+    Maps solc source indices (the third field of "src") to source bytes.
+    Sources that are not part of the compiler input are read from disk.
+    """
+    source_texts = {}
+    for path, source in output_json.get("sources", {}).items():
+        if path in input_dict["sources"] and "content" in input_dict["sources"][path]:
+            source_texts[source["id"]] = input_dict["sources"][path]["content"].encode()
+        else:
+            try:
+                with open(path, 'rb') as file:
+                    source_texts[source["id"]] = file.read()
+            except OSError:
+                continue
+    return source_texts
+
+
+def build_linearized_matrices(summaries):
+    """
+    Builds the dependency matrices of the most derived contract of a
+    linearization.
+
+    Args:
+    - summaries (list): Contract summaries in linearized order, most
+      derived first.
+
+    Returns:
+    - tuple: (function dependency graph, direct state dependency matrix,
+      {signature: node}) over "Contract.signature" / "Contract.modifier()"
+      nodes, where the last dict gives the implementation each externally
+      visible signature resolves to.
+    """
+    linearized_names = {summary["name"] for summary in summaries}
+
+    # virtual lookup: the first implementation in linearized order wins,
+    # unimplemented declarations only count if nothing implements them
+    resolved_functions = {}
+    for implemented_pass in (True, False):
+        for summary in summaries:
+            for signature, function_summary in summary["functions"].items():
+                if signature not in resolved_functions and function_summary["implemented"] == implemented_pass:
+                    resolved_functions[signature] = summary["name"] + "." + signature
+
+    resolved_modifiers = {}
+    for summary in summaries:
+        for name in summary["modifiers"]:
+            resolved_modifiers.setdefault(name, summary["name"] + "." + name + "()")
+
+    func_dependency_matrix = {}
+    state_dependency_matrix = {}
+
+    def add_node(node, node_summary):
+        dependencies = set()
+        for mode, target in node_summary["calls"]:
+            if mode == "virtual":
+                target = resolved_functions.get(target)
+            elif target.split(".", 1)[0] not in linearized_names:
+                target = None
+            if target is not None and target != node:
+                dependencies.add(target)
+        for name in node_summary["modifiers"]:
+            if name in resolved_modifiers:
+                dependencies.add(resolved_modifiers[name])
+        func_dependency_matrix[node] = dependencies
+        state_dependency_matrix[node] = set(node_summary["state"])
+
+    for summary in summaries:
+        for signature, function_summary in summary["functions"].items():
+            add_node(summary["name"] + "." + signature, function_summary)
+        for name, modifier_summary in summary["modifiers"].items():
+            add_node(summary["name"] + "." + name + "()", modifier_summary)
+
+    # static targets that were never declared (e.g. interface functions)
+    for dependencies in list(func_dependency_matrix.values()):
+        for dependency in dependencies:
+            if dependency not in func_dependency_matrix:
+                func_dependency_matrix[dependency] = set()
+                state_dependency_matrix[dependency] = set()
+
+    return func_dependency_matrix, state_dependency_matrix, resolved_functions
+
+
+def analyze_linearized_contract(contract_def, declarations, source_texts, backend="sets", cache_dir=None,
+                                solc_version=None, base_summary=None):
+    """
+    Inheritance- and modifier-aware version of dp_builder.analyze_contract.
+
+    Args:
+    - base_summary (callable): contract_def -> summary of that base, defaults
+      to get_summary. incremental.py passes one that reuses the function
+      summaries of an earlier run.
+
+    Returns:
+    - dict: {function name: set("Contract.variable")} for every function
+      the contract exposes, including inherited ones. Overloaded functions
+      are keyed by their full signature.
+    """
+    if base_summary is None:
+        def base_summary(base_def):
+            return get_summary(base_def, declarations, source_texts, cache_dir, solc_version)
+
+    summaries = [base_summary(declarations[base_id][0]) for base_id in contract_def.linearizedBaseContracts]
+    func_dependency_matrix, state_dependency_matrix, resolved_functions = build_linearized_matrices(summaries)
+
+    if backend == "bitset":
+        state_vars = sorted(set().union(*state_dependency_matrix.values()))
+        bitset_matrix = BitsetMatrix.from_sets(state_dependency_matrix, state_vars)
+        bitset_matrix.close_components(strongly_connected_components(func_dependency_matrix), func_dependency_matrix)
+        closed = bitset_matrix.to_sets()
+    else:
+        closed = close_state_dependency_matrix(func_dependency_matrix, state_dependency_matrix)
+
+    names = readable_function_names(resolved_functions)
+    readable_state_dependency_matrix = {}
+    for signature, node in resolved_functions.items():
+        readable_state_dependency_matrix[names[signature]] = set(closed[node])
+    return readable_state_dependency_matrix
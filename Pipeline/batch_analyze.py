@@ -0,0 +1,149 @@
+import argparse
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "Common"))
+sys.path.append(os.path.join(ROOT, "Dependency_Matrix_Builder"))
+sys.path.append(os.path.join(ROOT, "Storage_Processor"))
+
+import compile_cache
+import dp_builder
+import state_extract
+
+
+STAGES = ("dependencies", "layout")
+
+
+def collect_sources(paths):
+    """
+    Expands files and directories into a sorted, de-duplicated list of
+    Solidity sources. Directories are searched recursively.
+    """
+    sources = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, files in os.walk(path):
+                for file_name in files:
+                    if file_name.endswith(".sol"):
+                        sources.add(os.path.normpath(os.path.join(directory, file_name)))
+        else:
+            sources.add(os.path.normpath(path))
+    return sorted(sources)
+
+
+def run_dependencies(src_file):
+    readable_matrices = dp_builder.analyze_file(src_file)
+    return {
+        contract_name: {func: sorted(state_vars) for func, state_vars in sorted(matrix.items())}
+        for contract_name, matrix in sorted(readable_matrices.items())
+    }
+
+
+def run_layout(src_file):
+    output_json = compile_cache.compile_file(src_file)
+    layouts = {}
+    for contract_name in sorted(compile_cache.get_contract_outputs(output_json, src_file)):
+        result, data_types = state_extract.extract_layout(src_file, contract_name)
+        layouts[contract_name] = {
+            "storage_reorg_info": result,
+            "data_types": data_types,
+        }
+    return layouts
+
+
+def run_job(job):
+    # runs in a worker process: every stage of one source, so the source is
+    # compiled once and only this process writes its cache entry. Errors are
+    # reported per stage instead of tearing down the whole batch
+    src_file, stages = job
+    results = {}
+    errors = {}
+    for stage in stages:
+        try:
+            if stage == "dependencies":
+                results[stage] = run_dependencies(src_file)
+            else:
+                results[stage] = run_layout(src_file)
+        except Exception as e:
+            errors[stage] = {
+                "type": type(e).__name__,
+                "message": str(e),
+                "traceback": traceback.format_exc(),
+            }
+    return src_file, results, errors
+
+
+def run_batch(paths, stages=STAGES, workers=None):
+    """
+    Analyzes every Solidity source under paths on a process pool, one job
+    per source.
+
+    Args:
+    - paths (list): Solidity files and/or directories.
+    - stages (tuple): Any of "dependencies" and "layout".
+    - workers (int): Size of the process pool, defaults to os.cpu_count().
+
+    Returns:
+    - dict: {source: {"dependencies": ..., "layout": ..., "errors": {stage: error}}},
+      ordered by source path regardless of completion order.
+    """
+    sources = collect_sources(paths)
+    jobs = [(src_file, tuple(stages)) for src_file in sources]
+
+    if workers == 1:
+        outcomes = [run_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(run_job, jobs))
+
+    results = {}
+    for src_file, stage_results, errors in outcomes:
+        results[src_file] = dict(stage_results)
+        results[src_file]["errors"] = errors
+
+    return results
+
+
+def write_layout_files(results):
+    # mirrors state_extract's layout of one contract per test directory
+    for src_file, result in results.items():
+        layouts = result.get("layout")
+        if not layouts or len(layouts) != 1:
+            continue
+        layout = next(iter(layouts.values()))
+        directory = os.path.dirname(src_file)
+        state_extract.writeJSON(os.path.join(directory, "storage_reorg_info.json"), layout["storage_reorg_info"])
+        state_extract.writeJSON(os.path.join(directory, "data_types.json"), layout["data_types"])
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run SmartShift analysis over many contracts in parallel.")
+    parser.add_argument("paths", nargs="+", help="Solidity files or directories to analyze")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes (default: cpu count)")
+    parser.add_argument("-s", "--stage", action="append", choices=STAGES, help="stage to run, may be repeated (default: all)")
+    parser.add_argument("-o", "--output", default=None, help="write combined results to this JSON file")
+    parser.add_argument("--write-layout", action="store_true", help="write storage_reorg_info.json and data_types.json next to single-contract sources")
+    args = parser.parse_args()
+
+    results = run_batch(args.paths, stages=tuple(args.stage or STAGES), workers=args.workers)
+
+    if args.write_layout:
+        write_layout_files(results)
+
+    if args.output is not None:
+        state_extract.writeJSON(args.output, results)
+    else:
+        print(json.dumps(results, indent=2))
+
+    failed = 0
+    for src_file, result in results.items():
+        for stage, error in result["errors"].items():
+            failed = failed + 1
+            print(f"{src_file} [{stage}]: {error['type']}: {error['message']}", file=sys.stderr)
+
+    sys.exit(1 if failed else 0)
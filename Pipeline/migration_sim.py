@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "Common"))
+sys.path.append(os.path.join(ROOT, "Batch_Mngr"))
+sys.path.append(os.path.join(ROOT, "Prio_Vec"))
+
+import batch_gen
+import batch_planner
+import batch_stream
+import selector_index
+import tx_store
+
+
+# Mainnet block gas limit, the default block size batches are packed into
+DEFAULT_BLOCK_GAS_LIMIT = 30000000
+
+# calls that hit no ABI function (receive, fallback, unknown selectors);
+# they are reported on their own, not as functions of the plan
+UNMATCHED_BUCKETS = (selector_index.EMPTY_CALLDATA, selector_index.UNKNOWN_SELECTOR)
+
+
+@contextmanager
+def timed(timings, stage):
+    # adds the wall time of the block to timings[stage]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def estimate_batch_gas(batch):
+    # planner cost model for batches that carry no estimate, e.g. from create_function_batches
+    gas = batch_planner.TX_BASE_GAS + batch_planner.ACTIVATION_GAS * len(batch["activate"])
+    for key, val in batch.items():
+        if key not in ("activate", "gas"):
+            gas = gas + batch_planner.slot_write_gas(int(key, 16), int(val, 16))
+    return gas
+
+
+def schedule_batches(batches, block_gas_limit=DEFAULT_BLOCK_GAS_LIMIT, block_share=1.0):
+    """
+    Places batches into consecutive blocks in order, each block taking as
+    many batches as fit into block_share of its gas limit.
+
+    Returns:
+    - list: {"block", "slots", "gas", "activate"} per batch, blocks counted
+      from 1 at the start of the migration.
+    """
+    capacity = block_gas_limit * block_share
+    schedule = []
+    block = 1
+    used = 0
+    for batch in batches:
+        gas = batch.get("gas") or estimate_batch_gas(batch)
+        if used > 0 and used + gas > capacity:
+            block = block + 1
+            used = 0
+        used = used + gas
+        schedule.append({
+            "block": block,
+            "slots": sum(1 for key in batch if key not in ("activate", "gas")),
+            "gas": gas,
+            "activate": list(batch["activate"]),
+        })
+    return schedule
+
+
+def calls_from_rows(rows, selectors):
+    """
+    Turns tx_store.iter_rows rows into (block, signature) calls.
+
+    Args:
+    - selectors (dict): {selector: signature} of the contract.
+    """
+    return [(block, selector_index.resolve(selectors, selector)) for block, selector, _, _ in rows]
+
+
+def load_calls(file_name):
+    # [[block, function], ...] or [{"block": ..., "function": ...}, ...]
+    with open(file_name, 'r') as file:
+        calls = json.load(file)
+    return [(call["block"], call["function"]) if isinstance(call, dict) else tuple(call) for call in calls]
+
+
+def simulate(schedule, calls, functions=None):
+    """
+    Replays recorded calls against a scheduled batch plan.
+
+    The migration starts at the block of the first call. A call is rejected
+    when it arrives before the batch activating its function is mined;
+    functions the plan never activates are only available once the whole
+    migration is done. Activation names may be bare function names or full
+    signatures. Calls in the UNMATCHED_BUCKETS are left out of the
+    function statistics and curves and counted under "unmatched", as
+    rejected until the migration is done.
+
+    Args:
+    - schedule (list): Output of schedule_batches.
+    - calls (list): (block, function) pairs, e.g. calls_from_rows.
+    - functions (iterable): Every function of the contract, so functions that
+      never get called still show up in the FAT curve.
+
+    Returns:
+    - dict: Per-function availability and rejected calls, the FAT and
+      downtime curves, and totals for this plan and for a stop-the-world
+      migration of the same length.
+    """
+    migration_blocks = schedule[-1]["block"] if schedule else 0
+
+    availability = {}
+    for entry in schedule:
+        for func in entry["activate"]:
+            availability.setdefault(func, entry["block"])
+
+    def available_at(func):
+        block = availability.get(func)
+        if block is None:
+            block = availability.get(func.split("(")[0], migration_blocks)
+        return block
+
+    all_functions = set(availability)
+    if functions is not None:
+        all_functions.update(functions)
+
+    start_block = min(block for block, _ in calls) if calls else 0
+    unmatched = {bucket: {"calls": 0, "rejected": 0} for bucket in UNMATCHED_BUCKETS}
+    for block, func in calls:
+        if func in unmatched:
+            unmatched[func]["calls"] = unmatched[func]["calls"] + 1
+            if block - start_block < migration_blocks:
+                unmatched[func]["rejected"] = unmatched[func]["rejected"] + 1
+    calls = [(block, func) for block, func in calls if func not in unmatched]
+
+    if calls:
+        call_blocks = np.asarray([block for block, _ in calls], dtype=np.int64)
+        offsets = call_blocks - start_block
+        names, codes = np.unique(np.asarray([func for _, func in calls], dtype=object), return_inverse=True)
+    else:
+        offsets = np.zeros(0, dtype=np.int64)
+        names, codes = np.zeros(0, dtype=object), np.zeros(0, dtype=np.int64)
+
+    # calls are reported under the name the plan uses for their function
+    def plan_name(func):
+        if func in all_functions or func.split("(")[0] not in all_functions:
+            return func
+        return func.split("(")[0]
+
+    call_functions = [plan_name(func) for func in names.tolist()]
+    all_functions.update(call_functions)
+
+    # call i is rejected while its function is not active yet
+    function_available = np.asarray([available_at(func) for func in names.tolist()], dtype=np.int64)
+    rejected = offsets < function_available[codes] if len(names) else np.zeros(0, dtype=bool)
+    rejected_by_function = np.bincount(codes[rejected], minlength=len(names))
+    calls_by_function = np.bincount(codes, minlength=len(names))
+
+    # FAT curve: share of slots migrated vs share of functions active, per block
+    total_slots = sum(entry["slots"] for entry in schedule) or 1
+    activation_blocks = np.asarray(sorted(available_at(func) for func in all_functions), dtype=np.int64)
+    fat_curve = []
+    migrated = 0
+    position = 0
+    for block in range(1, migration_blocks + 1):
+        while position < len(schedule) and schedule[position]["block"] == block:
+            migrated = migrated + schedule[position]["slots"]
+            position = position + 1
+        active = int(np.searchsorted(activation_blocks, block, side="right"))
+        fat_curve.append({
+            "block": block,
+            "migrated": migrated / total_slots,
+            "active": active / max(len(all_functions), 1),
+        })
+
+    downtime_curve = np.bincount(offsets[rejected], minlength=migration_blocks + 1)[:migration_blocks + 1].tolist() if migration_blocks else []
+    stop_the_world = int(np.count_nonzero(offsets < migration_blocks))
+
+    per_function = {func: {"available_at": available_at(func), "calls": 0, "rejected": 0} for func in sorted(all_functions)}
+    for i, func in enumerate(call_functions):
+        per_function[func]["calls"] = per_function[func]["calls"] + int(calls_by_function[i])
+        per_function[func]["rejected"] = per_function[func]["rejected"] + int(rejected_by_function[i])
+
+    return {
+        "migration_blocks": migration_blocks,
+        "functions": per_function,
+        "fat_curve": fat_curve,
+        "downtime_curve": downtime_curve,
+        "total_calls": int(len(offsets)),
+        "rejected_calls": int(np.count_nonzero(rejected)),
+        "stop_the_world_rejected_calls": stop_the_world,
+        "mean_function_downtime": float(np.mean([available_at(func) for func in all_functions])) if all_functions else 0.0,
+        "unmatched": unmatched,
+    }
+
+
+def run_strategy(name, unique_vars, dependency_matrix, shard_file, calls, batching="planner", gas_target=None, batch_size=None, block_gas_limit=DEFAULT_BLOCK_GAS_LIMIT):
+    """
+    Plans, schedules and replays one priority order / batching strategy,
+    timing every stage.
+
+    Args:
+    - batching (str): "planner" for gas-aware batches up to gas_target,
+      "fixed" for create_function_batches with batch_size slots.
+    """
+    timings = {}
+
+    if batching == "planner":
+        if gas_target is None:
+            gas_target = batch_planner.gas_target_for_block(block_gas_limit)
+        with timed(timings, "plan"):
+            batches = list(batch_stream.stream_batches(shard_file, unique_vars, dependency_matrix, gas_target))
+    else:
+        with timed(timings, "plan"):
+            with open(shard_file, 'r') as file:
+                data = json.load(file)
+            batches = batch_gen.create_function_batches(data, unique_vars, dependency_matrix, batch_size)
+
+    with timed(timings, "schedule"):
+        schedule = schedule_batches(batches, block_gas_limit)
+    with timed(timings, "replay"):
+        report = simulate(schedule, calls, dependency_matrix.keys())
+
+    report["strategy"] = name
+    report["batches"] = len(batches)
+    report["gas"] = sum(entry["gas"] for entry in schedule)
+    report["timings"] = timings
+    return report
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Simulate a migration against recorded transactions and compare strategies.")
+    parser.add_argument("shards", help="shards.json with {var: {slot: value}}")
+    parser.add_argument("dp_mat", help="state dependency matrix JSON, {function: [vars]}")
+    parser.add_argument("--prio-vec", action="append", default=[], help="priority vector to compare, may be repeated")
+    parser.add_argument("--calls", default=None, help="JSON list of [block, function] calls")
+    parser.add_argument("--tx-store-address", default=None, help="replay the stored transactions of this address instead")
+    parser.add_argument("--selectors", default=None, help="JSON {selector: signature} used with --tx-store-address")
+    parser.add_argument("--gas-target", type=int, action="append", default=[], help="planner gas target, may be repeated")
+    parser.add_argument("--fixed-batch-size", type=int, action="append", default=[], help="also compare fixed slot-count batching")
+    parser.add_argument("--block-gas-limit", type=int, default=DEFAULT_BLOCK_GAS_LIMIT)
+    parser.add_argument("-o", "--output", default=None, help="write the full reports to this JSON file")
+    args = parser.parse_args()
+
+    timings = {}
+    with timed(timings, "load calls"):
+        if args.tx_store_address is not None:
+            with open(args.selectors, 'r') as file:
+                selectors = json.load(file)
+            conn = tx_store.open_store()
+            calls = calls_from_rows(tx_store.iter_rows(conn, args.tx_store_address), selectors)
+        elif args.calls is not None:
+            calls = load_calls(args.calls)
+        else:
+            calls = []
+
+    with open(args.dp_mat, 'r') as file:
+        dependency_matrix = json.load(file)
+
+    reports = []
+    for prio_vec_file in args.prio_vec or [None]:
+        with timed(timings, "prioritize"):
+            if prio_vec_file is None:
+                # declaration order as the baseline priority
+                unique_vars = list(dict.fromkeys(var for state_vars in dependency_matrix.values() for var in state_vars))
+            else:
+                unique_vars = batch_gen.extract_sorted_vars(prio_vec_file, args.dp_mat)
+        label = prio_vec_file or "declaration order"
+
+        for gas_target in args.gas_target or [None]:
+            reports.append(run_strategy(f"{label} / gas target {gas_target or 'default'}", unique_vars, dependency_matrix, args.shards, calls, "planner", gas_target=gas_target, block_gas_limit=args.block_gas_limit))
+        for batch_size in args.fixed_batch_size:
+            reports.append(run_strategy(f"{label} / {batch_size} slots per batch", unique_vars, dependency_matrix, args.shards, calls, "fixed", batch_size=batch_size, block_gas_limit=args.block_gas_limit))
+
+    for report in reports:
+        stages = ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in report["timings"].items())
+        print(f"{report['strategy']}: {report['batches']} batches over {report['migration_blocks']} blocks, "
+              f"{report['rejected_calls']}/{report['total_calls']} calls rejected "
+              f"(stop-the-world {report['stop_the_world_rejected_calls']}), "
+              f"mean function downtime {report['mean_function_downtime']:.1f} blocks [{stages}]")
+        for bucket, counts in report["unmatched"].items():
+            if counts["calls"]:
+                print(f"  {bucket}: {counts['rejected']}/{counts['calls']} calls rejected")
+    print("shared stages: " + ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in timings.items()))
+
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump({"timings": timings, "reports": reports}, file, indent=2)
@@ -0,0 +1,333 @@
+import argparse
+import json
+import os
+import socketserver
+import sys
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "Common"))
+sys.path.append(os.path.join(ROOT, "Dependency_Matrix_Builder"))
+sys.path.append(os.path.join(ROOT, "Storage_Processor"))
+sys.path.append(os.path.join(ROOT, "Prio_Vec"))
+sys.path.append(os.path.join(ROOT, "Batch_Mngr"))
+
+import batch_analyze
+import batch_gen
+import batch_planner
+import batch_stream
+import compile_cache
+import inheritance
+import lru_cache
+import priovec
+import rpc_client
+import selector_index
+import tx_store
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# entries per result cache; compiled outputs are bounded by compile_cache
+DEFAULT_CACHE_SIZE = 128
+
+# request bodies above this are refused
+MAX_BODY = 16 * 1024 * 1024
+
+
+class ServiceError(Exception):
+    # a bad request, reported with HTTP status 400
+    pass
+
+
+def file_key(path):
+    # cache key of a file's current contents, edits invalidate it
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+def compiled_sources(output_json):
+    # absolute paths of every file a compile read, imports included
+    return sorted({os.path.abspath(path) for path in output_json.get("sources", {})})
+
+
+def sources_key(paths):
+    # file_key of every path, None once one of them is gone
+    try:
+        return tuple(file_key(path) for path in paths)
+    except FileNotFoundError:
+        return None
+
+
+def _required(params, name):
+    if params.get(name) is None:
+        raise ServiceError(f"Missing parameter {name!r}")
+    return params[name]
+
+
+def _json_param(params, name):
+    # a JSON value given inline or as the path of a JSON file
+    value = _required(params, name)
+    if isinstance(value, str):
+        with open(value, 'r') as file:
+            return json.load(file)
+    return value
+
+
+class SmartShiftService:
+    """
+    The pipeline stages behind one long-running process. Compiler outputs
+    stay in compile_cache's in-memory LRU, and the results built from them
+    (dependency matrices, layouts, selector indexes, shard file indexes)
+    in LRU caches keyed by the path, mtime and size of the source file and
+    of every file its compile imported, so a repeated request costs a few
+    stats instead of a compile and an AST walk.
+    """
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE, store_path=tx_store.DEFAULT_STORE):
+        self.analyses = lru_cache.LruCache(cache_size)
+        self.layouts = lru_cache.LruCache(cache_size)
+        self.selectors = lru_cache.LruCache(cache_size)
+        self.shard_indexes = lru_cache.LruCache(cache_size)
+        # {source path: (source_key, compiled sources)} of the last compile
+        self.source_keys = lru_cache.LruCache(cache_size)
+        self.store_path = store_path
+
+    def source_key(self, source):
+        """
+        Cache key of source and every file its last compile read; a changed
+        file is recompiled, compile_cache checks the imports itself.
+        """
+        path = os.path.abspath(source)
+        known = self.source_keys.get(path)
+        if known is not None:
+            key, sources = known
+            if sources_key(sources) == key:
+                return key
+
+        sources = compiled_sources(compile_cache.compile_file(source))
+        key = tuple(file_key(compiled) for compiled in sources)
+        self.source_keys.put(path, (key, sources))
+        return key
+
+    def analyze(self, params):
+        # {contract: {function: [state vars]}} of params["source"]
+        source = _required(params, "source")
+        return self.analyses.get_or_compute(self.source_key(source), lambda: batch_analyze.run_dependencies(source))
+
+    def extract_layout(self, params):
+        # {contract: {"storage_reorg_info", "data_types"}} of params["source"]
+        source = _required(params, "source")
+        return self.layouts.get_or_compute(self.source_key(source), lambda: batch_analyze.run_layout(source))
+
+    def contract_selectors(self, source, contract=None):
+        selectors = self.selectors.get_or_compute(self.source_key(source), lambda: priovec.get_slectors(source))
+        if isinstance(selectors, str):
+            raise ServiceError(selectors)
+        if contract is None:
+            if len(selectors) != 1:
+                raise ServiceError(f"{source} has {len(selectors)} contracts, pass 'contract'")
+            contract = next(iter(selectors))
+        if contract not in selectors:
+            raise ServiceError(f"Contract {contract!r} not found in {source}")
+        return selectors[contract]
+
+    def prioritize(self, params):
+        """
+        Priority vector of a contract from its transactions in
+        [start_block, end_block]. end_block defaults to the head of
+        params["rpc_url"]; with an Etherscan api_key missing blocks are
+        synced into the tx_store first.
+        """
+        selectors_in_contract = self.contract_selectors(_required(params, "source"), params.get("contract"))
+        address = _required(params, "address")
+
+        end_block = params.get("end_block")
+        if end_block is None:
+            client = rpc_client.get_client(_required(params, "rpc_url"))
+            end_block = int(client.call("eth_blockNumber"), 16)
+        start_block = params.get("start_block", end_block - params.get("block_range", 100))
+
+        # sqlite connections stay in the thread that opened them
+        store = tx_store.open_store(self.store_path)
+        try:
+            return priovec.prioritize(
+                selectors_in_contract, address, start_block, end_block, params.get("api_key"), store,
+                half_life=params.get("half_life"),
+                weight_by_gas=params.get("weight_by_gas", False),
+                per_caller=params.get("per_caller", False))
+        finally:
+            store.close()
+
+    def plan_batches(self, params):
+        """
+        Gas-aware batches from a shard file. prio_vec and dp_mat are given
+        inline or as JSON files; the gas target comes from gas_target, a
+        block_gas_limit, or the latest block of rpc_url. With output the
+        batches are written there (ndjson or binary format) and only their
+        count is returned.
+        """
+        shard_file = _required(params, "shards")
+        prio_vec = _json_param(params, "prio_vec")
+        dependency_matrix = _json_param(params, "dp_mat")
+
+        gas_target = params.get("gas_target")
+        if gas_target is None:
+            gas_limit = params.get("block_gas_limit")
+            if gas_limit is None:
+                client = rpc_client.get_client(_required(params, "rpc_url"))
+                _, gas_limit = batch_gen.fetch_latest_block_and_gas_limit(client)
+            gas_target = batch_planner.gas_target_for_block(gas_limit)
+
+        def build_index():
+            with open(shard_file, "rb") as stream:
+                return batch_stream.index_shard_file(stream)
+
+        index = self.shard_indexes.get_or_compute(file_key(shard_file), build_index)
+        unique_vars = batch_gen.sorted_vars(prio_vec, dependency_matrix)
+        batches = batch_stream.stream_batches(shard_file, unique_vars, dependency_matrix, gas_target, index=index)
+
+        if params.get("output") is not None:
+            count = batch_stream.write_batches(batches, params["output"], params.get("format", "ndjson"))
+            return {"batches": count, "output": params["output"]}
+        return list(batches)
+
+    def stats(self, params=None):
+        return {
+            "compile": compile_cache.memory_cache.stats(),
+            "summaries": inheritance.summary_cache.stats(),
+            "selector_indexes": selector_index.index_cache.stats(),
+            "analyses": self.analyses.stats(),
+            "layouts": self.layouts.stats(),
+            "selectors": self.selectors.stats(),
+            "shard_indexes": self.shard_indexes.stats(),
+            "source_keys": self.source_keys.stats(),
+        }
+
+    def clear(self, params=None):
+        for cache in (compile_cache.memory_cache, inheritance.summary_cache, selector_index.index_cache,
+                      self.analyses, self.layouts, self.selectors, self.shard_indexes, self.source_keys):
+            cache.clear()
+        return True
+
+    def methods(self):
+        return {
+            "analyze": self.analyze,
+            "prioritize": self.prioritize,
+            "extract-layout": self.extract_layout,
+            "plan-batches": self.plan_batches,
+            "stats": self.stats,
+            "clear": self.clear,
+        }
+
+
+def make_handler(service):
+    """
+    HTTP handler for service: POST /<method> with a JSON object of
+    parameters answers {"result": ...} or {"error": {"type", "message"}};
+    GET /health and GET /stats need no body.
+    """
+    methods = service.methods()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _error(self, status, error):
+            self._reply(status, {"error": {"type": type(error).__name__, "message": str(error)}})
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, {"result": "ok"})
+            elif self.path == "/stats":
+                self._reply(200, {"result": service.stats()})
+            else:
+                self._reply(404, {"error": {"type": "NotFound", "message": self.path}})
+
+        def do_POST(self):
+            method = methods.get(self.path.strip("/"))
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY:
+                self.close_connection = True
+                self._reply(413, {"error": {"type": "TooLarge", "message": f"body over {MAX_BODY} bytes"}})
+                return
+            body = self.rfile.read(length)
+            if method is None:
+                self._reply(404, {"error": {"type": "NotFound", "message": self.path}})
+                return
+
+            try:
+                params = json.loads(body) if body else {}
+                if not isinstance(params, dict):
+                    raise ServiceError("Parameters must be a JSON object")
+                result = method(params)
+            except (ServiceError, json.JSONDecodeError, FileNotFoundError) as e:
+                self._error(400, e)
+            except Exception as e:
+                traceback.print_exc()
+                self._error(500, e)
+            else:
+                self._reply(200, {"result": result})
+
+    return Handler
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        # unix sockets have no peer address, http.server expects a (host, port)
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+    handler = make_handler(service)
+    if socket_path is None:
+        return ThreadingHTTPServer((host, port), handler)
+    if os.path.exists(socket_path):
+        # a socket left behind by a previous run
+        os.remove(socket_path)
+    return UnixHTTPServer(socket_path, handler)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Serve the SmartShift stages from one warm process")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", default=None, help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE, help="entries per result cache")
+    parser.add_argument("--compile-cache-size", type=int, default=compile_cache.MEMORY_CACHE_SIZE, help="compiler outputs kept in memory")
+    parser.add_argument("--store", default=tx_store.DEFAULT_STORE, help="tx_store database")
+    parser.add_argument("--warm", action="append", default=[], help="source to compile and analyze at startup, may be repeated")
+    args = parser.parse_args()
+
+    compile_cache.memory_cache.maxsize = args.compile_cache_size
+    service = SmartShiftService(args.cache_size, args.store)
+
+    for source in args.warm:
+        service.analyze({"source": source})
+        service.extract_layout({"source": source})
+
+    server = make_server(service, args.host, args.port, args.socket)
+    print(f"Serving on {args.socket or f'http://{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
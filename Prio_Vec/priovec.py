@@ -1,10 +1,13 @@
-import json
 import sys
 import os
 import requests
-import solcast
-import solcx
-from Crypto.Hash import keccak
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+import compile_cache
+import rpc_client
+import tx_store
+import prio_score
+import selector_index
 
 
 def choose_contract(contracts):
@@ -25,142 +28,108 @@ def choose_contract(contracts):
     return contracts[selected_contract]
 
 
-def get_keccak_hash(input_string):
-    k = keccak.new(digest_bits=256)
-    k.update(input_string.encode())
-    return k.hexdigest()
-
 def extract_function_selectors(abi):
-    selectors = {}
-    for item in abi:
-        if item['type'] == 'function':
-            # Construct the function signature
-            inputs = ','.join([input['type'] for input in item['inputs']])
-            function_signature = f"{item['name']}({inputs})"
-            # Compute the selector
-            hash_digest = get_keccak_hash(function_signature)
-            selector = hash_digest[:8]  # First 4 bytes (8 hex characters)
-            selectors[selector] = item['name']
-    return selectors
+    # {selector: full signature}, cached by ABI hash so overloads stay
+    # distinct and Keccak runs once per ABI
+    return selector_index.build_selector_index(abi)
 
 
 def get_slectors(contract_file):
     
     try:
-        with open(contract_file, 'r') as file:
-            content = file.read()
+        output_json = compile_cache.compile_file(contract_file)
     except FileNotFoundError:
         return f"Error: The file '{contract_file}' does not exist."
 
-    output = solcx.compile_source(content, output_values = ["abi"])
     selectors = {}
-    for contract,abi in output.items():
-        fun_selectors = extract_function_selectors(abi["abi"])
-        selectors[contract.split(":")[1]] = fun_selectors
+    for contract,outputs in compile_cache.get_contract_outputs(output_json).items():
+        if "methodIdentifiers" in outputs.get("evm", {}):
+            # solc already computed the selectors
+            fun_selectors = selector_index.index_from_method_identifiers(outputs["evm"]["methodIdentifiers"])
+        else:
+            fun_selectors = extract_function_selectors(outputs["abi"])
+        selectors[contract] = fun_selectors
 
     return selectors
 
 
 
 
-def get_latest_block_number():
+def get_latest_block_number(client=None):
     
     #api_key = "PUT_YOUR_KEY_HERE"
-    url = f"https://mainnet.infura.io/v3/{api_key}"
-    headers = {'Content-Type': 'application/json'}
-    data = {
-        "jsonrpc": "2.0",
-        "method": "eth_blockNumber",
-        "params": [],
-        "id": 1
-    }
-    
-    # Convert the data dictionary to JSON format
-    json_data = json.dumps(data)
-
-    # Making a POST request
-    response = requests.post(url, headers=headers, data=json_data)
-
-    # Check if the request was successful
-    if response.status_code == 200:
-        response_json = response.json()
-        block_number_hex = response_json.get('result', None)
-        if block_number_hex:
-            return int(block_number_hex, 16)  # Convert hex to int
-        return None
-    else:
+    if client is None:
+        client = rpc_client.get_client(rpc_client.infura_url(api_key))
+
+    # Pooled, retried JSON-RPC call
+    try:
+        block_number_hex = client.call("eth_blockNumber")
+    except (rpc_client.RpcError, requests.RequestException) as e:
         print("Failed to retrieve data")
-        print("Status Code:", response.status_code)
-        print("Response Text:", response.text)
+        print("Error:", e)
         return None
 
+    if block_number_hex:
+        return int(block_number_hex, 16)  # Convert hex to int
+    return None
 
 
+def prioritize(selectors_in_contract, address, start_block, end_block, api_key=None, store=None, half_life=None, weight_by_gas=False, per_caller=False):
+    """
+    Builds the priority vector of a contract from its transactions in
+    [start_block, end_block].
 
+    Args:
+    - selectors_in_contract (dict): {selector: signature}, e.g. one
+      contract of get_slectors.
+    - api_key (str): Etherscan key; blocks missing from the store are
+      downloaded first. Without it only stored transactions are scored.
+    - store (sqlite3.Connection): tx_store connection, the default store if None.
+    - half_life, weight_by_gas, per_caller: Scoring options of
+      prio_score.score_selectors, all off gives plain occurrence counts.
 
+    Returns:
+    - dict: {signature: score}
+    """
+    if store is None:
+        store = tx_store.open_store()
+    # any range works, only blocks missing from the local store are downloaded
+    if api_key is not None:
+        tx_store.sync(store, address, start_block, end_block, api_key)
 
+    blocks, tx_selectors, callers, gas_used = prio_score.arrays_from_rows(
+        tx_store.iter_rows(store, address, start_block, end_block))
+    selector_scores = prio_score.score_selectors(
+        blocks, tx_selectors, gas_used, callers,
+        half_life=half_life, reference_block=end_block,
+        weight_by_gas=weight_by_gas, per_caller=per_caller)
 
-
-def fetch_selectors_from_transactions(address, latest_block_number):
-    
-    url = "https://api.etherscan.io/v2/api"
-
-    #api_key = "PUT_YOUR_KEY_HERE"
-    
-    # Set the parameters for the GET request
-    params = {
-        "chainid": 1,
-        "module": "account",
-        "action": "txlist",
-        "address": address,
-        "startblock": latest_block_number-100,
-        "endblock": latest_block_number,
-        "page": 1,
-        "offset": 100,
-        "sort": "asc",
-        "apikey": api_key
-    }
-
-    # Send the GET request
-    response = requests.get(url, params=params)
-
-    # Check if the request was successful
-    if response.status_code == 200:
-        # Parse the JSON response
-        data = response.json()
-        # Extract 'result' which contains the transactions
-        transactions = data.get("result", [])
-        
-        # Collect all 'input' fields from transactions
-        inputs = [tx["input"].split("x")[1][:8] for tx in transactions if "input" in tx]
-        return inputs
-    else:
-        print("Failed to retrieve data: Status code", response.status_code)
-        return []
+    return prio_score.build_prio_vec(selector_scores, selectors_in_contract)
 
 
-address = "0x6982508145454Ce325dDbE47a25d4ec3d2311933"
-
-
-
-contract_filename = 'sample.sol'
-selectors = get_slectors(contract_filename)
-selectors_in_contract = choose_contract(selectors)
+if __name__ == "__main__":
 
+    address = "0x6982508145454Ce325dDbE47a25d4ec3d2311933"
+    #api_key = "PUT_YOUR_KEY_HERE"
 
+    contract_filename = 'sample.sol'
+    selectors = get_slectors(contract_filename)
+    selectors_in_contract = choose_contract(selectors)
 
+    latest_block_number = get_latest_block_number()
+    if latest_block_number is None:
+        raise ValueError("Latest Block Number could not be fetched")
 
-latest_block_number = get_latest_block_number()
-if latest_block_number is None:
-    raise ValueError("Latest Block Number could not be fetched")
-    
-txs = fetch_selectors_from_transactions(address, latest_block_number)
+    block_range = 100
 
+    # scoring options, all off gives plain occurrence counts
+    half_life = None          # in blocks, e.g. 7200 for roughly one day
+    weight_by_gas = False
+    per_caller = False
 
-prio_vec = {}
-for selector,name in selectors_in_contract.items():
-    prio_vec[name] = 0
-for tx in txs:
-    prio_vec[selectors_in_contract[tx]] = prio_vec[selectors_in_contract[tx]]+1
+    prio_vec = prioritize(
+        selectors_in_contract, address, latest_block_number-block_range, latest_block_number, api_key,
+        half_life=half_life, weight_by_gas=weight_by_gas, per_caller=per_caller)
+    prio_score.write_prio_vec("prio_vec.json", prio_vec)
 
-print(prio_vec)
\ No newline at end of file
+    print(prio_vec)
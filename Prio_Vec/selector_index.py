@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import sys
+from Crypto.Hash import keccak
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+import compile_cache
+import lru_cache
+
+SELECTOR_CACHE_DIR = os.path.join(os.path.dirname(compile_cache.DEFAULT_CACHE_DIR), "selectors")
+
+# Buckets for transactions that do not hit an ABI function
+EMPTY_CALLDATA = "<empty calldata>"   # plain ether transfers, receive()
+UNKNOWN_SELECTOR = "<unknown selector>"  # fallback(), proxy admin calls, ...
+
+SELECTOR_CACHE_SIZE = 256
+index_cache = lru_cache.LruCache(SELECTOR_CACHE_SIZE)
+
+
+def canonical_abi_type(param):
+    # tuples are spelled out as (t1,t2,...), keeping any array suffix
+    abi_type = param['type']
+    if abi_type.startswith("tuple"):
+        components = ",".join(canonical_abi_type(component) for component in param['components'])
+        return f"({components})" + abi_type[len("tuple"):]
+    return abi_type
+
+
+def function_signature(item):
+    inputs = ','.join(canonical_abi_type(param) for param in item['inputs'])
+    return f"{item['name']}({inputs})"
+
+
+def get_keccak_selector(signature):
+    k = keccak.new(digest_bits=256)
+    k.update(signature.encode())
+    return k.hexdigest()[:8]
+
+
+def abi_hash(abi):
+    return hashlib.sha256(json.dumps(abi, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def build_selector_index(abi, cache_dir=None):
+    """
+    Maps every function selector of an ABI to its full signature, so
+    overloads stay distinct. Indexes are cached in-process and on disk by
+    ABI hash, so the Keccak hashes are computed once per ABI.
+
+    Returns:
+    - dict: {selector (8 hex chars): signature}
+    """
+    key = abi_hash(abi)
+    index = index_cache.get(key)
+    if index is not None:
+        return index
+
+    if cache_dir is None:
+        cache_dir = SELECTOR_CACHE_DIR
+    path = os.path.join(cache_dir, key[:2], key + ".json")
+
+    index = compile_cache.read_cache_file(path)
+    if index is None:
+        index = {}
+        for item in abi:
+            if item['type'] == 'function':
+                signature = function_signature(item)
+                index[get_keccak_selector(signature)] = signature
+        compile_cache.write_cache_file(path, index)
+
+    index_cache.put(key, index)
+    return index
+
+
+def index_from_method_identifiers(method_identifiers):
+    # solc's evm.methodIdentifiers already is {signature: selector}
+    return {selector: signature for signature, selector in method_identifiers.items()}
+
+
+def resolve(index, selector):
+    """
+    O(1) lookup of a transaction selector, "" for empty calldata.
+    Selectors outside the index fall into the UNKNOWN_SELECTOR bucket.
+    """
+    signature = index.get(selector)
+    if signature is not None:
+        return signature
+    if selector == "":
+        return EMPTY_CALLDATA
+    return UNKNOWN_SELECTOR
@@ -0,0 +1,141 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+
+ETHERSCAN_URL = "https://api.etherscan.io/v2/api"
+
+# Etherscan returns at most this many transactions per query (page * offset)
+ETHERSCAN_MAX_RESULTS = 10000
+
+
+class EtherscanError(Exception):
+    pass
+
+
+def fetch_transactions_page(session, address, start_block, end_block, api_key, max_results=ETHERSCAN_MAX_RESULTS, max_retries=5, backoff=1.0, page=1):
+    """
+    Fetches page of the transactions of address in [start_block, end_block].
+
+    Returns:
+    - list: Up to max_results transactions in ascending block order. A full
+      page means the range may hold more and has to be split.
+    """
+    params = {
+        "chainid": 1,
+        "module": "account",
+        "action": "txlist",
+        "address": address,
+        "startblock": start_block,
+        "endblock": end_block,
+        "page": page,
+        "offset": max_results,
+        "sort": "asc",
+        "apikey": api_key
+    }
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = session.get(ETHERSCAN_URL, params=params, timeout=30)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff * (2 ** attempt))
+            continue
+
+        if response.status_code == 200:
+            data = response.json()
+            result = data.get("result", [])
+            if isinstance(result, list):
+                # "No transactions found" comes back as status 0 with an empty list
+                return result
+            # errors come back as a string result, e.g. "Max rate limit reached"
+            if "rate limit" not in str(result).lower():
+                raise EtherscanError(result)
+        elif response.status_code not in (429, 500, 502, 503, 504):
+            raise EtherscanError(f"Status code {response.status_code}")
+
+        if attempt == max_retries:
+            raise EtherscanError("Rate limited after retries")
+        time.sleep(backoff * (2 ** attempt))
+
+
+def fetch_block_range(session, address, start_block, end_block, api_key, max_results=ETHERSCAN_MAX_RESULTS):
+    """
+    Fetches every transaction in [start_block, end_block], halving the range
+    whenever a query hits the result-count limit. A single block that fills a
+    page is paged through instead, as far as Etherscan's result window allows.
+
+    Returns:
+    - tuple: (transactions, number of splits that were needed)
+    """
+    transactions = []
+    splits = 0
+    ranges = [(start_block, end_block)]
+
+    while ranges:
+        start, end = ranges.pop()
+        page = fetch_transactions_page(session, address, start, end, api_key, max_results)
+        if len(page) >= max_results and end > start:
+            mid = (start + end) // 2
+            # pushed in reverse so the lower half is fetched first
+            ranges.append((mid + 1, end))
+            ranges.append((start, mid))
+            splits = splits + 1
+            continue
+
+        transactions.extend(page)
+        number = 1
+        while len(page) >= max_results:
+            # a single block cannot be split, so it is paged through
+            number = number + 1
+            if number * max_results > ETHERSCAN_MAX_RESULTS:
+                raise EtherscanError(f"Block {start} holds more than {(number - 1) * max_results} transactions")
+            page = fetch_transactions_page(session, address, start, end, api_key, max_results, page=number)
+            transactions.extend(page)
+
+    return transactions, splits
+
+
+def iter_transactions(address, start_block, end_block, api_key, workers=4, chunk_size=1000, max_results=ETHERSCAN_MAX_RESULTS):
+    """
+    Streams the transactions of address between start_block and end_block.
+
+    Block ranges of chunk_size blocks are fetched by up to workers threads,
+    and results are yielded in block order as each chunk completes. The chunk
+    size shrinks when chunks had to be split to stay under the result limit
+    and grows when chunks come back sparse, so dense and quiet periods both
+    need few requests. At most workers chunks are held in memory.
+    """
+    session = requests.Session()
+    cursor = start_block
+    in_flight = deque()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while cursor <= end_block or in_flight:
+                while cursor <= end_block and len(in_flight) < workers:
+                    chunk_end = min(cursor + chunk_size - 1, end_block)
+                    in_flight.append(executor.submit(
+                        fetch_block_range, session, address, cursor, chunk_end, api_key, max_results))
+                    cursor = chunk_end + 1
+
+                transactions, splits = in_flight.popleft().result()
+
+                if splits > 0:
+                    chunk_size = max(1, chunk_size >> splits.bit_length())
+                elif len(transactions) < max_results // 4:
+                    chunk_size = chunk_size * 2
+
+                for transaction in transactions:
+                    yield transaction
+    finally:
+        session.close()
+
+
+def iter_selectors(address, start_block, end_block, api_key, **kwargs):
+    # First 4 bytes of calldata, "" for plain transfers without calldata
+    for transaction in iter_transactions(address, start_block, end_block, api_key, **kwargs):
+        if "input" in transaction:
+            yield transaction["input"][2:10]
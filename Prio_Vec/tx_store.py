@@ -0,0 +1,173 @@
+import os
+import sqlite3
+import tx_ingest
+
+
+DEFAULT_STORE = os.environ.get(
+    "SMARTSHIFT_TX_STORE",
+    os.path.join(os.path.expanduser("~"), ".cache", "smartshift", "transactions.sqlite"),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    address  TEXT    NOT NULL,
+    block    INTEGER NOT NULL,
+    tx_hash  TEXT    NOT NULL,
+    selector TEXT    NOT NULL,
+    caller   TEXT,
+    gas_used INTEGER,
+    PRIMARY KEY (address, tx_hash)
+);
+CREATE INDEX IF NOT EXISTS transactions_by_block ON transactions (address, block);
+CREATE TABLE IF NOT EXISTS sync_state (
+    address         TEXT PRIMARY KEY,
+    first_block     INTEGER NOT NULL,
+    high_water_mark INTEGER NOT NULL
+);
+"""
+
+# a refetched transaction fills in columns an older store left NULL
+INSERT_TRANSACTION = (
+    "INSERT INTO transactions (address, block, tx_hash, selector, caller, gas_used) "
+    "VALUES (?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(address, tx_hash) DO UPDATE SET "
+    "caller = COALESCE(excluded.caller, caller), gas_used = COALESCE(excluded.gas_used, gas_used)"
+)
+
+# rows written per transaction while syncing
+COMMIT_EVERY = 5000
+
+
+def open_store(path=DEFAULT_STORE):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+
+    # stores created before caller/gas_used were recorded: their rows get
+    # the new columns as NULL, so the synced ranges are dropped and the next
+    # sync refetches them, filling the columns in
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(transactions)")}
+    with conn:
+        if "caller" not in columns:
+            conn.execute("ALTER TABLE transactions ADD COLUMN caller TEXT")
+        if "gas_used" not in columns:
+            conn.execute("ALTER TABLE transactions ADD COLUMN gas_used INTEGER")
+        if "caller" not in columns or "gas_used" not in columns:
+            conn.execute("DELETE FROM sync_state")
+    return conn
+
+
+def get_sync_state(conn, address):
+    # (first_block, high_water_mark) of the stored range, or None
+    row = conn.execute(
+        "SELECT first_block, high_water_mark FROM sync_state WHERE address = ?",
+        (address.lower(),)
+    ).fetchone()
+    return row
+
+
+def _set_sync_state(conn, address, first_block, high_water_mark):
+    conn.execute(
+        "INSERT INTO sync_state (address, first_block, high_water_mark) VALUES (?, ?, ?) "
+        "ON CONFLICT(address) DO UPDATE SET first_block = excluded.first_block, "
+        "high_water_mark = excluded.high_water_mark",
+        (address.lower(), first_block, high_water_mark)
+    )
+
+
+def _store_range(conn, address, start_block, end_block, api_key, on_progress, **ingest_kwargs):
+    address = address.lower()
+    rows = []
+    for transaction in tx_ingest.iter_transactions(address, start_block, end_block, api_key, **ingest_kwargs):
+        if "input" not in transaction:
+            continue
+        block = int(transaction["blockNumber"])
+        gas_used = transaction.get("gasUsed")
+        rows.append((
+            address,
+            block,
+            transaction["hash"],
+            transaction["input"][2:10],
+            transaction.get("from", "").lower() or None,
+            int(gas_used) if gas_used else None,
+        ))
+        if len(rows) >= COMMIT_EVERY:
+            # transactions arrive in block order, so every block before this one is complete
+            with conn:
+                conn.executemany(INSERT_TRANSACTION, rows)
+                on_progress(block - 1)
+            rows = []
+
+    with conn:
+        conn.executemany(INSERT_TRANSACTION, rows)
+        on_progress(end_block)
+
+
+def sync(conn, address, start_block, end_block, api_key, **ingest_kwargs):
+    """
+    Makes sure the store holds every transaction of address in
+    [start_block, end_block], fetching only blocks that are not stored yet.
+    The stored range is kept contiguous: it is extended backwards down to
+    start_block and forwards from its high-water mark up to end_block.
+    Progress is committed as it goes, so an interrupted sync resumes from
+    where it stopped.
+    """
+    state = get_sync_state(conn, address)
+
+    if state is None:
+        first_block, high_water_mark = start_block, start_block - 1
+        with conn:
+            _set_sync_state(conn, address, first_block, high_water_mark)
+    else:
+        first_block, high_water_mark = state
+
+    if start_block < first_block:
+        old_first_block = first_block
+
+        def backfill_progress(block):
+            # the backfilled range only counts once it reaches the stored range
+            if block == old_first_block - 1:
+                _set_sync_state(conn, address, start_block, high_water_mark)
+
+        _store_range(conn, address, start_block, old_first_block - 1, api_key, backfill_progress, **ingest_kwargs)
+        first_block = start_block
+
+    if end_block > high_water_mark:
+        def forward_progress(block):
+            _set_sync_state(conn, address, first_block, block)
+
+        _store_range(conn, address, high_water_mark + 1, end_block, api_key, forward_progress, **ingest_kwargs)
+
+
+def selector_counts(conn, address, start_block=None, end_block=None):
+    """
+    Returns:
+    - dict: {selector: number of transactions} for address, optionally
+      limited to [start_block, end_block].
+    """
+    query = "SELECT selector, COUNT(*) FROM transactions WHERE address = ?"
+    params = [address.lower()]
+    if start_block is not None:
+        query = query + " AND block >= ?"
+        params.append(start_block)
+    if end_block is not None:
+        query = query + " AND block <= ?"
+        params.append(end_block)
+    query = query + " GROUP BY selector"
+    return dict(conn.execute(query, params).fetchall())
+
+
+def iter_rows(conn, address, start_block=None, end_block=None):
+    # (block, selector, caller, gas_used) rows in block order
+    query = "SELECT block, selector, caller, gas_used FROM transactions WHERE address = ?"
+    params = [address.lower()]
+    if start_block is not None:
+        query = query + " AND block >= ?"
+        params.append(start_block)
+    if end_block is not None:
+        query = query + " AND block <= ?"
+        params.append(end_block)
+    return conn.execute(query + " ORDER BY block", params)
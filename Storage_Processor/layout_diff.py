@@ -0,0 +1,196 @@
+import argparse
+import os
+
+import state_extract
+
+
+UNCHANGED = "unchanged"
+MOVED = "moved"
+RETYPED = "retyped"
+NEW = "new"
+REMOVED = "removed"
+
+# statuses whose old state has to be rewritten by the migration
+REWRITE = (MOVED, RETYPED)
+
+
+def type_shape(types, type_name, shapes=None):
+    """
+    Storage shape of a type: everything that decides where and how its
+    bytes are stored, without names. Struct and enum names, solc AST ids and
+    member labels are left out, so a renamed struct member or a recompiled
+    contract keeps its shape while a reordered or resized member does not.
+
+    A struct reaching itself, e.g. through a mapping of its own type, is
+    cut at the reference back to it, which gets the placeholder shape
+    (encoding, size, "recursive").
+    """
+    if shapes is None:
+        shapes = {}
+    if type_name in shapes:
+        return shapes[type_name]
+
+    data_type = types[type_name]
+    encoding = data_type["encoding"]
+    shape = (encoding, int(data_type["numberOfBytes"]))
+    shapes[type_name] = shape + ("recursive",)
+
+    if encoding == "mapping":
+        shape = shape + (type_shape(types, data_type["key"], shapes), type_shape(types, data_type["value"], shapes))
+    elif data_type.get("base"):
+        shape = shape + (type_shape(types, data_type["base"], shapes),)
+    elif data_type.get("members"):
+        shape = shape + tuple(
+            (int(member["slot"]), member["offset"], type_shape(types, member["type"], shapes))
+            for member in data_type["members"]
+        )
+    elif type_name.startswith("t_contract") or type_name.startswith("t_address"):
+        # contracts are stored as addresses
+        shape = shape + ("t_address",)
+    elif type_name.startswith("t_enum"):
+        shape = shape + ("t_enum",)
+    else:
+        shape = shape + (type_name,)
+
+    shapes[type_name] = shape
+    return shape
+
+
+def byte_range(storage_object, types):
+    # [start, end) of the bytes a variable occupies in its declared slots, counted from slot 0
+    start = 32 * int(storage_object["slot"]) + storage_object["offset"]
+    return start, start + int(types[storage_object["type"]]["numberOfBytes"])
+
+
+def diff_layouts(old_layout, new_layout):
+    """
+    Classifies the variables of two storage layouts of a contract, matched
+    by label:
+    - unchanged: same slot, offset and type shape, its state stays valid
+    - moved: same type shape at another slot or offset
+    - retyped: the type shape changed
+    - new: only in the new layout
+    - removed: only in the old layout
+
+    New variables whose bytes overlap the old position of a variable that
+    does not stay there are flagged "stale", their slots hold old data.
+
+    Args:
+    - old_layout, new_layout (dict): solc storageLayout, after clean_types.
+
+    Returns:
+    - list: {"label", "status", "old", "new"} per variable, old and new
+      being the storage entries or None, in new declaration order followed
+      by removed variables.
+    """
+    old_types = old_layout["types"] or {}
+    new_types = new_layout["types"] or {}
+    old_shapes = {}
+    new_shapes = {}
+    old_by_label = {storage_object["label"]: storage_object for storage_object in old_layout["storage"]}
+    new_labels = set()
+
+    diff = []
+    for new_object in new_layout["storage"]:
+        label = new_object["label"]
+        new_labels.add(label)
+        old_object = old_by_label.get(label)
+
+        if old_object is None:
+            status = NEW
+        elif type_shape(old_types, old_object["type"], old_shapes) != type_shape(new_types, new_object["type"], new_shapes):
+            status = RETYPED
+        elif int(old_object["slot"]) != int(new_object["slot"]) or old_object["offset"] != new_object["offset"]:
+            status = MOVED
+        else:
+            status = UNCHANGED
+        diff.append({"label": label, "status": status, "old": old_object, "new": new_object})
+
+    for old_object in old_layout["storage"]:
+        if old_object["label"] not in new_labels:
+            diff.append({"label": old_object["label"], "status": REMOVED, "old": old_object, "new": None})
+
+    # bytes left behind by variables that moved, changed or went away
+    vacated = [byte_range(entry["old"], old_types) for entry in diff if entry["old"] is not None and entry["status"] != UNCHANGED]
+    for entry in diff:
+        if entry["status"] == NEW:
+            start, end = byte_range(entry["new"], new_types)
+            entry["stale"] = any(start < old_end and old_start < end for old_start, old_end in vacated)
+
+    return diff
+
+
+def rewrite_objects(diff):
+    """
+    storage_reorg_info.json entries of the variables to rewrite. "slot" and
+    "offset" are their old position, where shard_gen reads them, and
+    "newSlot" and "newOffset" their new one, where the batches write them.
+    """
+    rewrite = [entry for entry in diff if entry["status"] in REWRITE]
+    objects = state_extract.get_objects({"storage": [entry["old"] for entry in rewrite], "types": None})
+    for storage_object, entry in zip(objects, rewrite):
+        storage_object["newSlot"] = state_extract.int_to_256bit_hex_string(int(entry["new"]["slot"]))
+        storage_object["newOffset"] = entry["new"]["offset"]
+    return objects
+
+
+def extract_diff(old_file, new_file, old_contract=None, new_contract=None):
+    """
+    Compiles both versions and builds the minimal reorganization input:
+    only moved and retyped variables are listed, read from their old
+    position and written to their new one, so unchanged variables cost no migration transactions. This
+    is meant for upgrades that keep the contract's storage, e.g. behind a
+    proxy; a migration into a fresh contract still needs extract_layout.
+
+    Returns:
+    - tuple: (storage_reorg_info entries, data_types of the old layout for
+      them, the full diff)
+    """
+    old_layout = state_extract.get_storage_layout(old_file, old_contract)
+    new_layout = state_extract.get_storage_layout(new_file, new_contract)
+    for layout in (old_layout, new_layout):
+        # solc reports "types": null for contracts without storage
+        if layout["types"] is None:
+            layout["types"] = {}
+        state_extract.clean_types(layout)
+
+    diff = diff_layouts(old_layout, new_layout)
+    result = rewrite_objects(diff)
+    data_types = state_extract.get_types(old_layout["types"], result)
+    return result, data_types, diff
+
+
+def summarize(diff):
+    return {
+        entry["label"]: {
+            "status": entry["status"],
+            "old": None if entry["old"] is None else {"type": entry["old"]["type"], "slot": int(entry["old"]["slot"]), "offset": entry["old"]["offset"]},
+            "new": None if entry["new"] is None else {"type": entry["new"]["type"], "slot": int(entry["new"]["slot"]), "offset": entry["new"]["offset"]},
+            **({"stale": entry["stale"]} if "stale" in entry else {}),
+        }
+        for entry in diff
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Diff the storage layouts of two contract versions and write the variables that need rewriting")
+    parser.add_argument("old", help="old contract source")
+    parser.add_argument("new", help="new contract source")
+    parser.add_argument("-o", "--output-dir", default=".", help="where storage_reorg_info.json, data_types.json and layout_diff.json go")
+    parser.add_argument("--old-contract", default=None)
+    parser.add_argument("--new-contract", default=None)
+    args = parser.parse_args()
+
+    result, data_types, diff = extract_diff(args.old, args.new, args.old_contract, args.new_contract)
+    state_extract.writeJSON(os.path.join(args.output_dir, "storage_reorg_info.json"), result)
+    state_extract.writeJSON(os.path.join(args.output_dir, "data_types.json"), data_types)
+    state_extract.writeJSON(os.path.join(args.output_dir, "layout_diff.json"), summarize(diff))
+
+    counts = {}
+    for entry in diff:
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    print(", ".join(f"{count} {status}" for status, count in counts.items()) + f"; {len(result)} variables to rewrite")
+    for entry in diff:
+        if entry.get("stale"):
+            print(f"warning: new variable {entry['label']} overlaps old state and starts out non-zero")
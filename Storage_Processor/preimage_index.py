@@ -0,0 +1,259 @@
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from Crypto.Hash import keccak
+
+import type_table
+
+
+DEFAULT_INDEX = os.environ.get(
+    "SMARTSHIFT_PREIMAGES",
+    os.path.join(os.path.expanduser("~"), ".cache", "smartshift", "preimages.sqlite"),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS preimages (
+    hash BLOB PRIMARY KEY,
+    base BLOB NOT NULL,
+    key  BLOB NOT NULL
+) WITHOUT ROWID;
+DROP INDEX IF EXISTS preimages_by_base;
+CREATE INDEX IF NOT EXISTS preimages_by_base_key ON preimages (base, key);
+"""
+
+# keys hashed per worker task
+HASH_CHUNK = 50000
+# below this many keys hashing stays in-process
+PARALLEL_THRESHOLD = 200000
+
+# rows per IN (...) lookup, under SQLite's variable limit
+LOOKUP_CHUNK = 500
+
+
+def hash_keys(base, keys):
+    # keccak(key . base) for every key; base is the 32-byte mapping slot
+    digests = []
+    for key in keys:
+        k = keccak.new(digest_bits=256)
+        k.update(key + base)
+        digests.append(k.digest())
+    return digests
+
+
+def _hash_chunk(args):
+    base, keys = args
+    return hash_keys(base, keys)
+
+
+def bulk_hash_keys(base, keys, workers=None):
+    """
+    hash_keys over many keys, spread over a process pool in chunks of
+    HASH_CHUNK keys once there are more than PARALLEL_THRESHOLD.
+    """
+    if len(keys) <= PARALLEL_THRESHOLD or workers == 1:
+        return hash_keys(base, keys)
+
+    chunks = [(base, keys[i:i + HASH_CHUNK]) for i in range(0, len(keys), HASH_CHUNK)]
+    digests = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk_digests in executor.map(_hash_chunk, chunks):
+            digests.extend(chunk_digests)
+    return digests
+
+
+def _as_bytes(key):
+    if isinstance(key, bytes):
+        return key
+    if isinstance(key, int):
+        # negative intN keys are hashed in two's complement
+        return (key % (1 << 256)).to_bytes(32, "big")
+    if isinstance(key, str) and key.startswith("0x"):
+        return bytes.fromhex(key[2:])
+    return key.encode()
+
+
+def encode_key(key, key_type):
+    """
+    Encodes a mapping key the way Solidity hashes it: value types as one
+    32-byte word (bytesN left-aligned, the rest right-aligned), string and
+    bytes keys as their raw bytes.
+
+    Args:
+    - key (int | str | bytes): The key, hex strings are read as bytes.
+    - key_type (str): Storage layout type name, e.g. "t_address".
+    """
+    if key_type.startswith("t_string") or key_type.startswith("t_bytes_"):
+        return _as_bytes(key)
+
+    data = _as_bytes(key)
+    if isinstance(key, int):
+        return data
+    if len(data) > 32:
+        raise ValueError(f"Key {key!r} does not fit into a word")
+    if key_type.startswith("t_bytes"):
+        return data + b"\0" * (32 - len(data))
+    return b"\0" * (32 - len(data)) + data
+
+
+class PreimageIndex:
+    """
+    Persistent hash -> (mapping slot, key) table.
+
+    Every candidate key of a mapping is hashed once with keccak(key . slot)
+    and stored, so shard generation can enumerate the entries of a mapping
+    by its slot, and later runs with the same candidates hash nothing.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def known_keys(self, base):
+        # every indexed key of the mapping at slot base, read as iterated
+        cursor = self.conn.execute("SELECT key FROM preimages WHERE base = ?", (base.to_bytes(32, "big"),))
+        for key, in cursor:
+            yield key
+
+    def _unknown_keys(self, base_bytes, keys):
+        # keys not yet indexed for base, looked up LOOKUP_CHUNK at a time
+        unknown = []
+        for i in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[i:i + LOOKUP_CHUNK]
+            query = "SELECT key FROM preimages WHERE base = ? AND key IN (" + ",".join("?" * len(chunk)) + ")"
+            known = {key for key, in self.conn.execute(query, [base_bytes] + chunk)}
+            unknown.extend(key for key in chunk if key not in known)
+        return unknown
+
+    def add_keys(self, base, keys, workers=None):
+        """
+        Hashes the encoded keys of the mapping at slot base, skipping keys
+        that are already indexed for it.
+
+        Returns:
+        - list: (hashed slot, key) of the newly indexed keys.
+        """
+        base_bytes = base.to_bytes(32, "big")
+        new_keys = self._unknown_keys(base_bytes, list(dict.fromkeys(keys)))
+        if not new_keys:
+            return []
+
+        digests = bulk_hash_keys(base_bytes, new_keys, workers)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO preimages (hash, base, key) VALUES (?, ?, ?)",
+                zip(digests, [base_bytes] * len(new_keys), new_keys)
+            )
+        return [(int.from_bytes(digest, "big"), key) for digest, key in zip(digests, new_keys)]
+
+    def entries(self, base):
+        # (hashed slot, key) of every indexed key of the mapping at slot base
+        cursor = self.conn.execute("SELECT hash, key FROM preimages WHERE base = ?", (base.to_bytes(32, "big"),))
+        for digest, key in cursor:
+            yield int.from_bytes(digest, "big"), key
+
+    def lookup(self, slots):
+        """
+        Returns:
+        - dict: {slot: (mapping slot, key)} for the slots with a known preimage.
+        """
+        slots = list(slots)
+        found = {}
+        for i in range(0, len(slots), LOOKUP_CHUNK):
+            chunk = [slot.to_bytes(32, "big") for slot in slots[i:i + LOOKUP_CHUNK]]
+            query = "SELECT hash, base, key FROM preimages WHERE hash IN (" + ",".join("?" * len(chunk)) + ")"
+            for digest, base, key in self.conn.execute(query, chunk):
+                found[int.from_bytes(digest, "big")] = (int.from_bytes(base, "big"), key)
+        return found
+
+
+def candidates_from_transactions(conn, address):
+    # senders recorded in the tx_store, the usual keys of balance-like mappings
+    rows = conn.execute(
+        "SELECT DISTINCT caller FROM transactions WHERE address = ? AND caller IS NOT NULL",
+        (address.lower(),)
+    )
+    return [caller for caller, in rows]
+
+
+def candidates_from_logs(logs):
+    # indexed event arguments (topics after the signature) and the words of log data
+    words = set()
+    for log in logs:
+        for topic in log.get("topics", [])[1:]:
+            words.add(topic)
+        data = log.get("data", "0x")[2:]
+        for i in range(0, len(data) - 63, 64):
+            words.add("0x" + data[i:i + 64])
+    return sorted(words)
+
+
+def integer_keys(count, start=0):
+    # ids, indices and counters
+    return list(range(start, start + count))
+
+
+def _mapping_slots(table, type_name, slot):
+    # (slot, mapping type) of the mappings held by a variable, through
+    # structs and static arrays
+    for leaf_slot, _, _, record in table.flat(type_name):
+        if record.encoding == "mapping":
+            yield slot + leaf_slot, table.types[record.name]
+
+
+def index_mappings(index, reorg_infos, data_types, candidates, workers=None):
+    """
+    Indexes candidate keys for every mapping in the layout, those inside
+    structs, static arrays and other mappings included: the inner mapping of each outer entry is indexed with the
+    candidates of its own key type, so nested mappings cost the product of
+    their candidate counts.
+
+    Args:
+    - index (PreimageIndex): Where the hashes go.
+    - reorg_infos (list): storage_reorg_info.json entries.
+    - data_types (list): data_types.json entries, mapping types with "key"
+      and "value".
+    - candidates (dict): {key type: [keys]}, e.g.
+      {"t_address": callers, "t_uint256": integer_keys(10000)}.
+
+    Returns:
+    - int: Number of newly hashed keys.
+    """
+    table = type_table.TypeTable({data_type["type"]: data_type for data_type in data_types})
+    encoded = {}
+
+    def keys_for(key_type):
+        if key_type not in encoded:
+            encoded[key_type] = [encode_key(key, key_type) for key in candidates.get(key_type, [])]
+        return encoded[key_type]
+
+    added = 0
+    pending = []
+    for info in reorg_infos:
+        pending.extend(_mapping_slots(table, info["type"], int(info["slot"], 16)))
+
+    while pending:
+        base, mapping_type = pending.pop()
+        new_entries = index.add_keys(base, keys_for(mapping_type["key"]), workers)
+        added = added + len(new_entries)
+
+        value_type = mapping_type["value"]
+        if not any(record.encoding == "mapping" for _, _, _, record in table.flat(value_type)):
+            continue
+        # inner mappings live at the entry slot of the outer one
+        for hashed_slot, _ in index.entries(base):
+            pending.extend(_mapping_slots(table, value_type, hashed_slot))
+
+    return added
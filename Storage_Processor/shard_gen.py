@@ -0,0 +1,403 @@
+import argparse
+import json
+import os
+import sys
+import numpy as np
+from Crypto.Hash import keccak
+
+import type_table
+
+
+BYTE_POSITIONS = np.arange(32, dtype=np.int64)
+
+
+class ShardGenerationError(Exception):
+    pass
+
+
+def keccak256(data):
+    k = keccak.new(digest_bits=256)
+    k.update(data)
+    return k.digest()
+
+
+def data_slot(slot):
+    # first slot of the data of a dynamic array or long bytes stored at slot
+    return int.from_bytes(keccak256(slot.to_bytes(32, "big")), "big")
+
+
+def to_hash(value):
+    return "0x" + format(value, "064x")
+
+
+class SlotState:
+    """
+    Contract storage as one (N, 32) uint8 matrix of big-endian slot values
+    plus a slot -> row index. Row N is all zeros and stands in for slots
+    that are not set.
+    """
+
+    def __init__(self, slots, values):
+        self.index = {slot: row for row, slot in enumerate(slots)}
+        self.values = np.zeros((len(slots) + 1, 32), dtype=np.uint8)
+        if slots:
+            self.values[:len(slots)] = np.frombuffer(b"".join(value.to_bytes(32, "big") for value in values), dtype=np.uint8).reshape(-1, 32)
+        self.zero_row = len(slots)
+
+    def rows(self, slots):
+        index = self.index
+        zero_row = self.zero_row
+        return np.fromiter((index.get(slot, zero_row) for slot in slots), dtype=np.int64, count=len(slots))
+
+    def get(self, slot):
+        # one slot as an int, 0 when unset
+        row = self.index.get(slot)
+        if row is None:
+            return 0
+        return int.from_bytes(self.values[row].tobytes(), "big")
+
+    def __contains__(self, slot):
+        return slot in self.index
+
+    def gather(self, slots):
+        # (len(slots), 32) uint8 values, zero rows for unset slots
+        return self.values[self.rows(slots)]
+
+    def slots(self):
+        return iter(self.index)
+
+
+def load_old_storage(file_name):
+    """
+    Reads old_storage.json ({hashed slot: {"key": slot, "value": value}})
+    into a SlotState, dropping zero values like ReadStorageFromFile.
+    """
+    with open(file_name, 'r') as file:
+        storage = json.load(file)
+
+    slots = []
+    values = []
+    for entry in storage.values():
+        value = int(entry["value"], 16)
+        if value != 0:
+            slots.append(int(entry["key"], 16))
+            values.append(value)
+    return SlotState(slots, values)
+
+
+def load_data_types(data_types):
+    # data_types.json list -> {type name: type}, with numberOfBytes as int
+    types = {}
+    for data_type in data_types:
+        data_type = dict(data_type)
+        data_type["numberOfBytes"] = int(data_type["numberOfBytes"])
+        types[data_type["type"]] = data_type
+    return types
+
+
+ENCODINGS = ("inplace", "dynamic_array", "bytes", "mapping")
+
+
+class ShardGenerator:
+    """
+    Python port of shard_gen.go's ShardGenerator, extended to mappings.
+
+    The reorganize_* methods only record which byte ranges of which slots
+    belong to the variable being extracted. The bytes themselves are cut
+    out once per shard in finish_shard: the recorded slots are gathered from
+    the state matrix, masked with their byte ranges and OR-combined per slot
+    in a few NumPy operations instead of per-byte copies. Structs and static
+    arrays are walked through the flattened slot-offset maps of a
+    type_table.TypeTable, computed once per type.
+
+    Mapping entries are enumerated through a preimage_index.PreimageIndex:
+    every indexed key of a mapping whose entry slot holds state is
+    extracted. Without an index, mappings are rejected as in the Go version.
+
+    Reorg infos may carry a "newSlot" and "newOffset" (layout_diff writes
+    them for variables that moved): the state is read at "slot"/"offset"
+    and the shard holds it at the new position, the data slots of dynamic
+    arrays, bytes and mapping entries rederived from the new header slot.
+    """
+
+    def __init__(self, state, reorg_infos, data_types, preimages=None):
+        self.state = state
+        self.reorg_infos = reorg_infos
+        self.data_types = load_data_types(data_types)
+        self.type_table = type_table.TypeTable(self.data_types)
+        self.preimages = preimages
+        self._clear()
+
+    def _clear(self):
+        # slot and [lo, hi) big-endian byte range of every extraction, the
+        # slot it goes to and how many bytes it moves towards the high end
+        self.slots = []
+        self.lo = []
+        self.hi = []
+        self.targets = []
+        self.shifts = []
+
+    def _extract(self, slot, lo, hi, target, shift=0):
+        if lo - shift < 0 or hi - shift > 32:
+            raise ShardGenerationError(f"Bytes of slot {to_hash(slot)} do not fit their new offset")
+        self.slots.append(slot)
+        self.lo.append(lo)
+        self.hi.append(hi)
+        self.targets.append(target)
+        self.shifts.append(shift)
+
+    def _extract_range(self, first_slot, count, target, lo=0, hi=32):
+        # the same byte range of count consecutive slots
+        self.slots.extend(range(first_slot, first_slot + count))
+        self.lo.extend([lo] * count)
+        self.hi.extend([hi] * count)
+        self.targets.extend(range(target, target + count))
+        self.shifts.extend([0] * count)
+
+    def get_type(self, type_name):
+        data_type = self.data_types.get(type_name)
+        if data_type is None:
+            raise ShardGenerationError("Type not found")
+        return data_type
+
+    def get_number_of_bytes(self, type_name):
+        return self.get_type(type_name)["numberOfBytes"]
+
+    def is_nested(self, type_name):
+        data_type = self.get_type(type_name)
+        return bool(data_type.get("base")) or bool(data_type.get("members"))
+
+    def reorganize(self, type_name, slot, offset, target=None, target_offset=None):
+        # target and target_offset: where the variable goes, its own position by default
+        if target is None:
+            target = slot
+        if target_offset is None:
+            target_offset = offset
+        encoding = self.get_type(type_name)["encoding"]
+        if encoding == "inplace":
+            self.reorganize_inplace(type_name, slot, offset, target, target_offset)
+        elif encoding == "dynamic_array":
+            self.reorganize_dynamic_array(type_name, slot, target)
+        elif encoding == "bytes":
+            self.reorganize_bytes(type_name, slot, target)
+        elif encoding == "mapping" and self.preimages is not None:
+            self.reorganize_mapping(type_name, slot, target)
+        else:
+            raise ShardGenerationError("Not implemented yet")
+
+    def reorganize_inplace(self, type_name, slot, offset, target=None, target_offset=None):
+        if target is None:
+            target = slot
+        if target_offset is None:
+            target_offset = offset
+        shift = target_offset - offset
+
+        # every leaf of the type's static part, from its flattened slot-offset map
+        for leaf_slot, leaf_offset, number_of_bytes, leaf in self.type_table.flat(type_name):
+            if leaf.encoding != "inplace":
+                # header of a dynamic array, bytes or mapping inside a struct or static array
+                self.reorganize(leaf.name, slot + leaf_slot, 0, target + leaf_slot, 0)
+                continue
+
+            # number_of_bytes bytes starting start bytes from the right of the leaf's slot
+            start = offset + leaf_offset
+            end = start + number_of_bytes
+            while start < end:
+                slot_end = min(end, (start // 32 + 1) * 32)
+                self._extract(slot + leaf_slot + start // 32, 32 - (slot_end - 32 * (start // 32)), 32 - start % 32,
+                              target + leaf_slot + start // 32, shift)
+                start = slot_end
+
+    def reorganize_dynamic_array(self, type_name, slot, target=None):
+        if target is None:
+            target = slot
+        number_of_bytes = self.get_number_of_bytes(type_name)
+        self._extract(slot, 0, number_of_bytes, target)
+
+        number_of_elements = self.state.get(slot)
+        if number_of_elements == 0:
+            return
+
+        first_data_slot = data_slot(slot)
+        first_target = first_data_slot if target == slot else data_slot(target)
+        base = self.get_type(type_name)["base"]
+        base_encoding = self.get_type(base)["encoding"]
+
+        if base_encoding == "inplace":
+            size_of_element = self.get_number_of_bytes(base)
+            if self.is_nested(base):
+                slots_per_element = size_of_element // 32
+                for i in range(number_of_elements):
+                    self.reorganize_inplace(base, first_data_slot + slots_per_element * i, 0,
+                                            first_target + slots_per_element * i, 0)
+            else:
+                # packed elements, every slot holds the same byte range
+                elements_per_slot = 32 // size_of_element
+                number_of_slots = -(-number_of_elements // elements_per_slot)
+                self._extract_range(first_data_slot, number_of_slots, first_target, 32 - elements_per_slot * size_of_element, 32)
+
+        elif base_encoding in ("dynamic_array", "bytes"):
+            for i in range(number_of_elements):
+                self.reorganize_inplace(base, first_data_slot + i, 0, first_target + i, 0)
+
+        else:
+            raise ShardGenerationError("Not Implemented Yet....")
+
+    def reorganize_bytes(self, type_name, slot, target=None):
+        if target is None:
+            target = slot
+        number_of_bytes = self.get_number_of_bytes(type_name)
+        self._extract(slot, 0, number_of_bytes, target)
+
+        value = self.state.get(slot)
+        if value & 1:
+            # long bytes/string: length in the header, data from keccak(slot)
+            length = (value - 1) // 2
+            self._extract_range(data_slot(slot), -(-length // 32), data_slot(target))
+
+    def value_slots(self, type_name):
+        # slots a mapping value starts with that must hold state if the entry exists
+        data_type = self.get_type(type_name)
+        if data_type["encoding"] != "inplace":
+            return 1
+        return max(1, data_type["numberOfBytes"] // 32)
+
+    def reorganize_mapping(self, type_name, slot, target=None):
+        if target is None:
+            target = slot
+        mapping_type = self.get_type(type_name)
+        value_type = mapping_type["value"]
+        value_encoding = self.get_type(value_type)["encoding"]
+        value_slots = self.value_slots(value_type)
+
+        for entry_slot, key in self.preimages.entries(slot):
+            # the same key under the mapping's new slot
+            entry_target = entry_slot if target == slot else int.from_bytes(keccak256(key + target.to_bytes(32, "big")), "big")
+            if value_encoding == "mapping":
+                # nested mappings store nothing at the entry slot itself
+                self.reorganize_mapping(value_type, entry_slot, entry_target)
+            elif any(entry_slot + i in self.state for i in range(value_slots)):
+                self.reorganize(value_type, entry_slot, 0, entry_target, 0)
+
+    def finish_shard(self):
+        """
+        Cuts the recorded byte ranges out of the state.
+
+        Returns:
+        - dict: {slot: value} as 0x-prefixed 32-byte hex strings.
+        """
+        if not self.slots:
+            return {}
+
+        unique_slots, positions = np.unique(np.asarray(self.slots, dtype=object), return_inverse=True)
+        unique_slots = unique_slots.tolist()
+
+        lo = np.asarray(self.lo, dtype=np.int64)[:, None]
+        hi = np.asarray(self.hi, dtype=np.int64)[:, None]
+        masks = ((BYTE_POSITIONS >= lo) & (BYTE_POSITIONS < hi)).astype(np.uint8) * 0xff
+
+        extracted = self.state.gather(unique_slots)[positions] & masks
+
+        # bytes of variables given a new offset; outside their range all is masked to zero
+        for i, shift in enumerate(self.shifts):
+            if shift:
+                extracted[i] = np.roll(extracted[i], -shift)
+
+        if self.targets == self.slots:
+            unique_targets, target_positions = unique_slots, positions
+        else:
+            unique_targets, target_positions = np.unique(np.asarray(self.targets, dtype=object), return_inverse=True)
+            unique_targets = unique_targets.tolist()
+
+        shard_values = np.zeros((len(unique_targets), 32), dtype=np.uint8)
+        np.bitwise_or.at(shard_values, target_positions, extracted)
+
+        hex_values = shard_values.tobytes().hex()
+        self._clear()
+        return {
+            to_hash(slot): "0x" + hex_values[64 * i:64 * (i + 1)]
+            for i, slot in enumerate(unique_targets)
+        }
+
+    def generate_shards(self):
+        """
+        Returns:
+        - tuple: (merged {slot: value} of all shards, {label: shard})
+        """
+        shards = {}
+        for info in self.reorg_infos:
+            encoding = self.get_type(info["type"])["encoding"]
+            if encoding not in ENCODINGS:
+                raise ShardGenerationError("Not implemented yet")
+            self.reorganize(info["type"], int(info["slot"], 16), info["offset"],
+                            int(info.get("newSlot", info["slot"]), 16), info.get("newOffset", info["offset"]))
+            shards[info["label"]] = self.finish_shard()
+
+        merged = {}
+        for shard in shards.values():
+            merged.update(shard)
+        return merged, shards
+
+
+def state_as_hashes(state):
+    return {to_hash(slot): to_hash(state.get(slot)) for slot in state.slots()}
+
+
+def generate_directory(directory_path, write=True, preimages=None):
+    """
+    Runs the shard generator on a directory holding old_storage.json,
+    storage_reorg_info.json and data_types.json, writing shards.json.
+    Mappings need a PreimageIndex holding their candidate keys. An
+    old_storage.snapshot (see state_snapshot) is used instead of
+    old_storage.json when present.
+
+    Returns:
+    - tuple: (shards, whether the merged shards reproduce old_storage)
+    """
+    snapshot_file = os.path.join(directory_path, "old_storage.snapshot")
+    if os.path.exists(snapshot_file):
+        import state_snapshot
+        state = state_snapshot.Snapshot(snapshot_file)
+    else:
+        state = load_old_storage(os.path.join(directory_path, "old_storage.json"))
+    with open(os.path.join(directory_path, "storage_reorg_info.json"), 'r') as file:
+        reorg_infos = json.load(file)
+    with open(os.path.join(directory_path, "data_types.json"), 'r') as file:
+        data_types = json.load(file)
+
+    merged, shards = ShardGenerator(state, reorg_infos, data_types, preimages).generate_shards()
+
+    if write:
+        with open(os.path.join(directory_path, "shards.json"), 'w') as file:
+            json.dump(shards, file, indent=4, sort_keys=True)
+
+    return shards, merged == state_as_hashes(state)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Generate shards.json for test directories")
+    parser.add_argument("directories", nargs="*", help="directories to process (default: every directory under Tests)")
+    parser.add_argument("--preimages", default=None, help="preimage index used to enumerate mapping entries")
+    args = parser.parse_args()
+
+    target_directory = "Tests"
+    directories = args.directories or sorted(
+        os.path.join(target_directory, entry) for entry in os.listdir(target_directory)
+        if os.path.isdir(os.path.join(target_directory, entry))
+    )
+
+    preimages = None
+    if args.preimages is not None:
+        import preimage_index
+        preimages = preimage_index.PreimageIndex(args.preimages)
+
+    failed = 0
+    for directory in directories:
+        shards, matches = generate_directory(directory, preimages=preimages)
+        if matches:
+            print("Test passed: " + directory)
+        else:
+            failed = failed + 1
+            print("Test failed: " + directory + ", shards do not reproduce old_storage.json")
+    sys.exit(1 if failed else 0)
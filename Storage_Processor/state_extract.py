@@ -1,9 +1,13 @@
-import subprocess
 import json
+import copy
 import sys
 import os
 import re
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+import compile_cache
+import type_table
+
 def int_to_256bit_hex_string(num):
     # Convert the integer to a hex string
     hex_string = hex(num)[2:]
@@ -16,35 +20,22 @@ def int_to_256bit_hex_string(num):
 
     return final_hex_string
 
-def get_storage_layout(file_name):
-    # Command to run (solc --stage-layout sample.sol)
-    command = ["solc", "--storage-layout"]
-    command.append(file_name)
-
-    # Run the command
-    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-
-    # Check if the command was successful
-    if result.returncode == 0:
-        output = result.stdout
-
-        # Find the index of "Contract Storage Layout:"
-        layout_start_index = output.find("Contract Storage Layout:")
-
-        # Extract the data after "Contract Storage Layout:"
-        if layout_start_index != -1:
-            layout_data_str = output[layout_start_index + len("Contract Storage Layout:"):].strip()
-
-            # Convert the string to a dictionary using json.loads
-            try:
-                layout_data_dict = json.loads(layout_data_str)
-                return layout_data_dict
-            except json.JSONDecodeError as e:
-                raise Exception("Error decoding JSON")
-        else:
-            raise Exception("Contract Storage Layout not found in the output.")
-    else:
-        raise Exception(result.stderr)
+def get_storage_layout(file_name, contract_name=None):
+    # Storage layout is read from the shared compile cache, the same standard
+    # JSON compile the other stages use
+    output_json = compile_cache.compile_file(file_name)
+    contracts = compile_cache.get_contract_outputs(output_json, file_name)
+
+    if contract_name is None:
+        if len(contracts) != 1:
+            raise Exception("Expected exactly one contract in " + file_name + ", pass contract_name")
+        contract_name = next(iter(contracts))
+
+    if contract_name not in contracts or "storageLayout" not in contracts[contract_name]:
+        raise Exception("Contract Storage Layout not found in the output.")
+
+    # callers clean and annotate the layout in place, keep the cached copy intact
+    return copy.deepcopy(contracts[contract_name]["storageLayout"])
 
 
 
@@ -86,60 +77,31 @@ def get_types(old_json, common_objects):
             raise Exception("Type not found....")
     return nested_types,flat_types
 """
-def process_type(types, current_type, inserted_types, data_types):
-    
-    if current_type in inserted_types:
-        return
-    
-    types[current_type]["type"] = current_type 
-    types[current_type]["numberOfBytes"] = int(types[current_type]["numberOfBytes"]) 
-    
-
-    inserted_types.append(current_type)
-    #if there is a base type process it too
-    if "base" in types[current_type]:
-        process_type(types,types[current_type]["base"],inserted_types,data_types)
+#MEMBER_KEYS_DROPPED are solc bookkeeping that data_types.json leaves out
+MEMBER_KEYS_DROPPED = ("astId", "contract", "label")
+
+def type_entry(name, solc_type):
+    #data_types.json entry of a type, built from a copy of the solc type
+    entry = dict(solc_type)
+    entry["type"] = name
+    entry["numberOfBytes"] = int(entry["numberOfBytes"])
+    if "base" not in entry:
+        entry["base"] = None
+    if "members" in entry:
+        entry["members"] = [
+            {key: (int_to_256bit_hex_string(int(value)) if key == "slot" else value) for key, value in member.items() if key not in MEMBER_KEYS_DROPPED}
+            for member in entry["members"]
+        ]
     else:
-        types[current_type]["base"] = None
-
-    #if the data type is a struct then process the members
-    if "members" in types[current_type]:
-        members = {}
-        
-        
-        for member in types[current_type]["members"]:
-            members[member["label"]] = member
-
-        
-        
-        for member in types[current_type]["members"]:
-            process_type(types,member["type"],inserted_types,data_types)
-    else:
-        types[current_type]["members"] = None
-
-
-    data_types.append(types[current_type])    
+        entry["members"] = None
+    return entry
 
 #find the data types of the storage objects that require reorganization
 def get_types(types, storage_objects):
-    inserted_types = []
-    data_types = []
-    
-    for storage_object in storage_objects:
-        current_type = storage_object["type"]
-        process_type(types,current_type,inserted_types,data_types)
-        
-    
-    for type in data_types:
-        if type["members"] is not None:
-            for member in type["members"]:
-                
-                member["slot"] = int_to_256bit_hex_string(int(member["slot"]))
-                member.pop("astId")
-                member.pop("contract")
-                member.pop("label")
-                
-    return data_types
+    #every type is interned once, after the types it refers to; the solc
+    #types are left untouched
+    records = type_table.TypeTable(types).resolve(storage_object["type"] for storage_object in storage_objects)
+    return [type_entry(record.name, types[record.name]) for record in records]
 
 def writeJSON(file_name,data):
     with open(file_name, 'w') as json_file:
@@ -156,10 +118,12 @@ def get_directories_in_path(directory_path):
     return directories
 
 #modify struct type name
+STRUCT_TYPE_PATTERN = re.compile(r't_struct\((.*?)\)[a-zA-Z0-9]+_storage')
+
 def modify_struct_types(text):
-    pattern = r't_struct\((.*?)\)[a-zA-Z0-9]+_storage'
-    result = re.sub(pattern, r't_struct(\1)_storage', text)
-    return result
+    if "t_struct(" not in text:
+        return text
+    return STRUCT_TYPE_PATTERN.sub(r't_struct(\1)_storage', text)
 
 def clean_types(storage_layout):
     storage = storage_layout["storage"]
@@ -169,14 +133,15 @@ def clean_types(storage_layout):
         modified_type_def = modify_struct_types(item["type"])
         item["type"] = modified_type_def
 
+    #only names that mention a struct change, every reference to them too
     all_keys = list(types.keys())
     for key in all_keys:
         new_key = modify_struct_types(key)
-        if "base" in types[key]:
-            base = types[key]["base"]
-            new_base = modify_struct_types(base)
-            if new_base != base:
-                types[key]["base"] = new_base
+        for field in ("base", "key", "value"):
+            if field in types[key]:
+                types[key][field] = modify_struct_types(types[key][field])
+        for member in types[key].get("members") or ():
+            member["type"] = modify_struct_types(member["type"])
         if new_key != key:
             types[new_key] = types.pop(key)
 
@@ -185,6 +150,20 @@ def clean_types(storage_layout):
 
 
 
+def extract_layout(file_name, contract_name=None):
+    storage_layout = get_storage_layout(file_name, contract_name)
+    # solc reports "types": null for contracts without storage
+    if storage_layout["types"] is None:
+        storage_layout["types"] = {}
+    clean_types(storage_layout)
+
+    result = get_objects(storage_layout)
+
+    data_types = get_types(storage_layout["types"],result)
+    return result, data_types
+
+
+
 if __name__ == "__main__":
     
     target_directory = "Tests"
@@ -194,24 +173,8 @@ if __name__ == "__main__":
     for directory in directories_list:
         current_directory = target_directory+"/"+directory
         src_file = current_directory+"/"+"Sample.sol"
-        storage_layout = get_storage_layout(src_file)
-        clean_types(storage_layout)
-        
-        result = get_objects(storage_layout)
-        
-        data_types = get_types(storage_layout["types"],result)
+        result, data_types = extract_layout(src_file)
         writeJSON(current_directory+"/"+"storage_reorg_info.json",result)
         writeJSON(current_directory+"/"+"data_types.json",data_types)
 
-        
-        """
-        #nested,flat = get_types(old_storage_layout,result)
-        data_types = get_types(old_storage_layout["types"],new_storage_layout["types"],result)
-        #print(json.dumps(data_types,indent=2))
-        
-        writeJSON(current_directory+"/"+"storage_reorg_info.json",result)
-        #writeJSON(current_directory+"/"+"nested_types.json",nested)
-        #writeJSON(current_directory+"/"+"flat_types.json",flat)
-        writeJSON(current_directory+"/"+"data_types.json",data_types)
-        """
-        
\ No newline at end of file
+    # comparing an old and a new version of a contract is done by layout_diff.py
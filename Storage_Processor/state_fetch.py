@@ -0,0 +1,365 @@
+import argparse
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+import rpc_client
+import shard_gen
+import state_snapshot
+
+
+DEFAULT_RPC_URL = "http://127.0.0.1:8545"
+
+# storage entries per debug_storageRangeAt page
+RANGE_PAGE_SIZE = 1024
+# slices of the hashed key space paged concurrently
+RANGE_SEGMENTS = 8
+# pages per segment buffered between the paging threads and the dump writer
+RANGE_QUEUE_PAGES = 2
+KEY_SPACE = 1 << 256
+
+# a dynamic array or bytes header beyond this is a wrong layout, not state
+MAX_LENGTH = 1 << 32
+
+# JSON-RPC codes for a method the node does not serve
+METHOD_UNAVAILABLE_CODES = {-32601, -32600}
+
+
+class StateFetchError(Exception):
+    pass
+
+
+def _walk(types, type_name, slot, slots, headers, preimages):
+    """
+    Appends the slots of a variable that follow from the layout alone to
+    slots. Dynamic arrays and bytes only contribute their header slot and
+    are appended to headers as (type, slot), their data slots depend on the
+    header value.
+    """
+    data_type = types.get(type_name)
+    if data_type is None:
+        raise StateFetchError("Type not found: " + type_name)
+    encoding = data_type["encoding"]
+
+    if encoding in ("dynamic_array", "bytes"):
+        slots.append(slot)
+        headers.append((type_name, slot))
+
+    elif encoding == "mapping":
+        # entries can only be enumerated through known keys
+        if preimages is not None:
+            for entry_slot, _ in preimages.entries(slot):
+                _walk(types, data_type["value"], entry_slot, slots, headers, preimages)
+
+    elif data_type.get("members"):
+        for member in data_type["members"]:
+            _walk(types, member["type"], slot + int(member["slot"], 16), slots, headers, preimages)
+
+    elif data_type.get("base") and _is_nested(types, data_type["base"]):
+        # static array of structs, arrays or dynamic types
+        base = types[data_type["base"]]
+        stride = max(1, base["numberOfBytes"] // 32) if base["encoding"] == "inplace" else 1
+        for i in range(data_type["numberOfBytes"] // (32 * stride)):
+            _walk(types, data_type["base"], slot + i * stride, slots, headers, preimages)
+
+    else:
+        # value types and static arrays of packed values
+        slots.extend(range(slot, slot + max(1, -(-data_type["numberOfBytes"] // 32))))
+
+
+def _is_nested(types, type_name):
+    data_type = types[type_name]
+    return data_type["encoding"] != "inplace" or bool(data_type.get("base")) or bool(data_type.get("members"))
+
+
+def _expand_header(types, type_name, slot, value, slots, headers, preimages):
+    # data slots of a dynamic array or bytes whose header slot holds value
+    data_type = types[type_name]
+
+    if data_type["encoding"] == "bytes":
+        if value & 1:
+            # long form, the length is stored as 2 * length + 1
+            length = (value - 1) // 2
+            if length > MAX_LENGTH:
+                raise StateFetchError(f"Implausible length {length} of {type_name} at {shard_gen.to_hash(slot)}")
+            first = shard_gen.data_slot(slot)
+            slots.extend(range(first, first + -(-length // 32)))
+        return
+
+    if value > MAX_LENGTH:
+        raise StateFetchError(f"Implausible length {value} of {type_name} at {shard_gen.to_hash(slot)}")
+    if value == 0:
+        return
+
+    first = shard_gen.data_slot(slot)
+    base_name = data_type["base"]
+    if not _is_nested(types, base_name):
+        # packed elements
+        per_slot = 32 // types[base_name]["numberOfBytes"]
+        slots.extend(range(first, first + -(-value // per_slot)))
+    else:
+        base = types[base_name]
+        stride = max(1, base["numberOfBytes"] // 32) if base["encoding"] == "inplace" else 1
+        for i in range(value):
+            _walk(types, base_name, first + i * stride, slots, headers, preimages)
+
+
+def layout_state(fetch, reorg_infos, data_types, preimages=None):
+    """
+    Fetches every slot the layout implies, in rounds: each round fetches
+    all slots known so far in one call to fetch, then the headers of
+    dynamic arrays and bytes among them expand into the next round's data
+    slots. The number of rounds is the nesting depth of dynamic types, not
+    the number of variables.
+
+    Args:
+    - fetch (callable): [slot] -> {slot: value}, slots and values as ints.
+    - reorg_infos (list): storage_reorg_info.json entries.
+    - data_types (list): data_types.json entries.
+    - preimages (PreimageIndex): Enumerates mapping entries, mappings are
+      skipped without it.
+
+    Returns:
+    - dict: {slot: value} of every slot fetched, zero values included.
+    """
+    types = shard_gen.load_data_types(data_types)
+
+    slots = []
+    headers = []
+    for info in reorg_infos:
+        _walk(types, info["type"], int(info["slot"], 16), slots, headers, preimages)
+
+    state = {}
+    while slots:
+        missing = [slot for slot in dict.fromkeys(slots) if slot not in state]
+        if missing:
+            state.update(fetch(missing))
+
+        slots = []
+        pending, headers = headers, []
+        for type_name, slot in pending:
+            _expand_header(types, type_name, slot, state[slot], slots, headers, preimages)
+    return state
+
+
+def pin_block(client, block=None):
+    # block number every read is pinned to, the current head by default
+    if block is None:
+        return int(client.call("eth_blockNumber"), 16)
+    return int(block)
+
+
+def storage_at_fetcher(client, address, block):
+    """
+    fetch callable for layout_state over batched eth_getStorageAt calls.
+    The client splits large rounds into batches of its batch_size and sends
+    at most max_workers of them at a time.
+    """
+    tag = hex(block)
+
+    def fetch(slots):
+        results = client.batch([("eth_getStorageAt", [address, shard_gen.to_hash(slot), tag]) for slot in slots])
+        return {slot: int(result, 16) for slot, result in zip(slots, results)}
+
+    return fetch
+
+
+def range_block_hash(client, block):
+    """
+    debug_storageRangeAt reads the state before a transaction of a block, so
+    the state after block is read before transaction 0 of the next block.
+
+    Returns:
+    - str: Hash of block + 1, None while that block does not exist.
+    """
+    next_block = client.call("eth_getBlockByNumber", [hex(block + 1), False])
+    if next_block is None:
+        return None
+    return next_block["hash"]
+
+
+def _range_segment(client, block_hash, address, start, end, page_size):
+    # pages through the hashed keys in [start, end), one list of (hashed slot, value) per page
+    next_key = start
+    while next_key is not None and next_key < end:
+        page = client.call("debug_storageRangeAt", [block_hash, 0, address, shard_gen.to_hash(next_key), page_size])
+        entries = []
+        for hashed, entry in page["storage"].items():
+            hashed = int(hashed, 16)
+            if start <= hashed < end:
+                entries.append((hashed, int(entry["value"], 16)))
+        yield entries
+        next_key = None if page.get("nextKey") is None else int(page["nextKey"], 16)
+
+
+def iter_storage_range(client, address, block_hash, page_size=RANGE_PAGE_SIZE, segments=RANGE_SEGMENTS):
+    """
+    Streams the whole storage of address with debug_storageRangeAt as
+    (hashed slot, value) pairs. The hashed key space is cut into segments
+    paged concurrently; at most RANGE_QUEUE_PAGES pages per segment wait
+    for the consumer, so memory does not grow with the storage.
+    """
+    bounds = [KEY_SPACE * i // segments for i in range(segments + 1)]
+    pages = queue.Queue(maxsize=RANGE_QUEUE_PAGES * segments)
+    stop = threading.Event()
+
+    def offer(item):
+        # False once the consumer is gone
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def page_segment(i):
+        try:
+            for entries in _range_segment(client, block_hash, address, bounds[i], bounds[i + 1], page_size):
+                if not offer(entries):
+                    return
+        except Exception as error:
+            offer(error)
+            return
+        # one None per finished segment
+        offer(None)
+
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        for i in range(segments):
+            executor.submit(page_segment, i)
+        try:
+            finished = 0
+            while finished < segments:
+                item = pages.get()
+                if item is None:
+                    finished = finished + 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield from item
+        finally:
+            stop.set()
+
+
+def storage_range(client, address, block_hash, file_name, page_size=RANGE_PAGE_SIZE, segments=RANGE_SEGMENTS):
+    """
+    Dumps the whole storage of address into a state_snapshot file keyed by
+    hashed slot, written as the debug_storageRangeAt pages arrive.
+
+    Returns:
+    - int: Number of entries written.
+    """
+    return state_snapshot.write_snapshot(iter_storage_range(client, address, block_hash, page_size, segments), file_name)
+
+
+def range_fetcher(dump):
+    # fetch callable for layout_state over a storage_range dump, opened as a state_snapshot.Snapshot
+    def fetch(slots):
+        return {
+            slot: dump.get(int.from_bytes(shard_gen.keccak256(slot.to_bytes(32, "big")), "big"))
+            for slot in slots
+        }
+
+    return fetch
+
+
+def fetch_state(client, address, reorg_infos, data_types, block=None, use_range=True, preimages=None, page_size=RANGE_PAGE_SIZE, segments=RANGE_SEGMENTS, dump_dir=None):
+    """
+    Fetches the state of the variables in reorg_infos at one block.
+
+    With use_range the storage is dumped with debug_storageRangeAt, which
+    takes one call per page instead of one per slot, into a temporary
+    snapshot in dump_dir (the system temporary directory by default) that
+    is removed afterwards. The range is read at the start of the next block,
+    so without an explicit block it pins the block before the head. Nodes
+    without the debug namespace, and a given block whose successor is not
+    mined yet, fall back to batched eth_getStorageAt.
+
+    Returns:
+    - tuple: ({slot: value}, block number)
+    """
+    if block is None and use_range:
+        block = pin_block(client) - 1
+    else:
+        block = pin_block(client, block)
+
+    dump = None
+    dump_file = None
+    try:
+        if use_range:
+            try:
+                block_hash = range_block_hash(client, block)
+                if block_hash is not None:
+                    descriptor, dump_file = tempfile.mkstemp(suffix=".range", dir=dump_dir)
+                    os.close(descriptor)
+                    storage_range(client, address, block_hash, dump_file, page_size, segments)
+                    dump = state_snapshot.Snapshot(dump_file)
+            except rpc_client.RpcError as error:
+                if error.code not in METHOD_UNAVAILABLE_CODES:
+                    raise
+
+        if dump is not None:
+            fetch = range_fetcher(dump)
+        else:
+            fetch = storage_at_fetcher(client, address, block)
+        return layout_state(fetch, reorg_infos, data_types, preimages), block
+    finally:
+        if dump is not None:
+            dump.close()
+        if dump_file is not None and os.path.exists(dump_file):
+            os.remove(dump_file)
+
+
+def as_old_storage(state):
+    # {slot: value} -> old_storage.json layout, unset slots left out
+    return {
+        shard_gen.to_hash(int.from_bytes(shard_gen.keccak256(slot.to_bytes(32, "big")), "big")): {
+            "key": shard_gen.to_hash(slot),
+            "value": shard_gen.to_hash(value),
+        }
+        for slot, value in sorted(state.items()) if value != 0
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Fetch the state a storage layout implies from a node")
+    parser.add_argument("directory", help="directory with storage_reorg_info.json and data_types.json")
+    parser.add_argument("address", help="contract address")
+    parser.add_argument("--rpc", default=DEFAULT_RPC_URL)
+    parser.add_argument("--block", type=int, default=None, help="block to read at (default: the block before the head, the head with --no-range)")
+    parser.add_argument("--no-range", action="store_true", help="only use eth_getStorageAt")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent requests")
+    parser.add_argument("--batch-size", type=int, default=100, help="calls per JSON-RPC batch")
+    parser.add_argument("--snapshot", action="store_true", help="write old_storage.snapshot instead of old_storage.json")
+    parser.add_argument("--preimages", default=None, help="preimage index used to enumerate mapping entries")
+    parser.add_argument("--dump-dir", default=None, help="directory of the temporary debug_storageRangeAt dump")
+    args = parser.parse_args()
+
+    with open(os.path.join(args.directory, "storage_reorg_info.json"), 'r') as file:
+        reorg_infos = json.load(file)
+    with open(os.path.join(args.directory, "data_types.json"), 'r') as file:
+        data_types = json.load(file)
+
+    preimages = None
+    if args.preimages is not None:
+        import preimage_index
+        preimages = preimage_index.PreimageIndex(args.preimages)
+
+    with rpc_client.RpcClient(args.rpc, max_workers=args.concurrency, batch_size=args.batch_size) as client:
+        state, block = fetch_state(client, args.address, reorg_infos, data_types, args.block, not args.no_range, preimages,
+                                   segments=args.concurrency, dump_dir=args.dump_dir)
+
+    if args.snapshot:
+        count = state_snapshot.write_snapshot(state.items(), os.path.join(args.directory, "old_storage.snapshot"))
+    else:
+        old_storage = as_old_storage(state)
+        count = len(old_storage)
+        with open(os.path.join(args.directory, "old_storage.json"), 'w') as file:
+            json.dump(old_storage, file, indent="\t")
+    print(f"Fetched {count} slots of {args.address} at block {block}")
@@ -0,0 +1,236 @@
+import argparse
+import bisect
+import heapq
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+import json_stream
+
+
+# Snapshot file: magic, record count, then count records of a 32-byte
+# big-endian slot and its 32-byte value, sorted by slot, slots unique
+MAGIC = b"SSSNAP01"
+HEADER = struct.Struct(">8sQ")
+RECORD_SIZE = 64
+ZERO_WORD = bytes(32)
+
+# records sorted in memory at once while converting, 64 MiB of records
+RUN_RECORDS = 1 << 20
+
+
+def iter_old_storage(file_name):
+    """
+    Streams the (slot, value) pairs of an old_storage.json file
+    ({hashed slot: {"key": slot, "value": value}}) without loading it.
+    """
+    with open(file_name, "rb") as stream:
+        tokens = json_stream.iter_tokens(stream)
+        json_stream.expect(tokens, "{")
+        for _, token in tokens:
+            if token == "}":
+                return
+            if token == ",":
+                continue
+            json_stream.expect(tokens, ":")
+            json_stream.expect(tokens, "{")
+            entry = {}
+            for _, field in tokens:
+                if field == "}":
+                    break
+                if field == ",":
+                    continue
+                json_stream.expect(tokens, ":")
+                _, entry[field] = next(tokens)
+            yield int(entry["key"], 16), int(entry["value"], 16)
+
+
+def _sort_run(records):
+    # sorts packed records by slot; the last write of a slot wins
+    array = np.frombuffer(b"".join(records), dtype=np.uint8).reshape(-1, RECORD_SIZE)
+    words = array[:, :32].copy().view(">u8")
+    order = np.lexsort((np.arange(len(array))[::-1], words[:, 3], words[:, 2], words[:, 1], words[:, 0]))
+    return array[order]
+
+
+def _write_run(array, directory):
+    run = tempfile.NamedTemporaryFile(dir=directory, suffix=".run", delete=False)
+    with run:
+        run.write(array.tobytes())
+    return run.name
+
+
+def _iter_run(path, index):
+    # ((slot, -run index), record), so later runs sort first for equal slots
+    with open(path, "rb") as run:
+        while True:
+            record = run.read(RECORD_SIZE)
+            if not record:
+                return
+            yield (record[:32], -index), record
+
+
+def write_snapshot(pairs, file_name, run_records=RUN_RECORDS):
+    """
+    Writes (slot, value) int pairs as a snapshot. Pairs may come in any
+    order and are sorted in runs of run_records, merged on disk for states
+    larger than one run. The last value of a repeated slot wins and slots
+    left at zero are dropped, as ReadStorageFromFile does.
+
+    Returns:
+    - int: Number of records written.
+    """
+    directory = os.path.dirname(os.path.abspath(file_name))
+    runs = []
+    records = []
+    try:
+        for slot, value in pairs:
+            records.append(slot.to_bytes(32, "big") + value.to_bytes(32, "big"))
+            if len(records) >= run_records:
+                runs.append(_write_run(_sort_run(records), directory))
+                records = []
+        if records:
+            runs.append(_write_run(_sort_run(records), directory))
+
+        # k-way merge of the runs; within a run the last write of a slot
+        # sorts first, across runs the later run wins
+        merged = heapq.merge(*[_iter_run(path, index) for index, path in enumerate(runs)])
+
+        count = 0
+        temporary = file_name + ".tmp"
+        with open(temporary, "wb") as out:
+            out.write(HEADER.pack(MAGIC, 0))
+            previous = None
+            for (slot, _), record in merged:
+                if slot == previous:
+                    continue
+                previous = slot
+                # a slot whose last write is zero is unset
+                if record[32:] == ZERO_WORD:
+                    continue
+                out.write(record)
+                count = count + 1
+            out.seek(0)
+            out.write(HEADER.pack(MAGIC, count))
+        os.replace(temporary, file_name)
+        return count
+    finally:
+        for path in runs:
+            os.remove(path)
+
+
+def convert_json(json_file, snapshot_file, run_records=RUN_RECORDS):
+    # old_storage.json -> snapshot, streaming
+    return write_snapshot(iter_old_storage(json_file), snapshot_file, run_records)
+
+
+class _Keys:
+    # lazy sequence of the 32-byte slots of a snapshot, for bisect
+    def __init__(self, buffer, count):
+        self.buffer = buffer
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        start = HEADER.size + i * RECORD_SIZE
+        return self.buffer[start:start + 32]
+
+
+class Snapshot:
+    """
+    Memory-mapped snapshot reader. Lookups binary-search the sorted slots
+    in place, so opening a snapshot costs no parsing and only the pages
+    touched are read.
+
+    It offers the state interface ShardGenerator uses (get, __contains__,
+    gather, slots) as well as range iteration.
+    """
+
+    def __init__(self, file_name):
+        self.file = open(file_name, "rb")
+        if os.fstat(self.file.fileno()).st_size < HEADER.size:
+            raise ValueError(f"{file_name} is not a state snapshot")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise ValueError(f"{file_name} is not a state snapshot")
+        self.keys = _Keys(self.buffer, self.count)
+        self.records = np.frombuffer(self.buffer, dtype=np.uint8, count=self.count * RECORD_SIZE, offset=HEADER.size).reshape(-1, RECORD_SIZE)
+
+    def close(self):
+        # drop the array view first, the mapping cannot close while it is exported
+        self.records = None
+        self.buffer.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def find(self, slot):
+        # record index of slot, or None
+        key = slot.to_bytes(32, "big")
+        i = bisect.bisect_left(self.keys, key)
+        if i < self.count and self.keys[i] == key:
+            return i
+        return None
+
+    def __contains__(self, slot):
+        return self.find(slot) is not None
+
+    def get(self, slot):
+        # value of slot as an int, 0 when unset
+        i = self.find(slot)
+        if i is None:
+            return 0
+        return int.from_bytes(self.records[i, 32:].tobytes(), "big")
+
+    def gather(self, slots):
+        """
+        Returns:
+        - array: (len(slots), 32) uint8 values of slots, zero rows for
+          unset slots.
+        """
+        values = np.zeros((len(slots), 32), dtype=np.uint8)
+        for position, slot in enumerate(slots):
+            i = self.find(slot)
+            if i is not None:
+                values[position] = self.records[i, 32:]
+        return values
+
+    def range(self, start=0, end=None):
+        # (slot, value) ints for start <= slot < end, in slot order
+        i = bisect.bisect_left(self.keys, start.to_bytes(32, "big"))
+        stop = self.count if end is None else bisect.bisect_left(self.keys, end.to_bytes(32, "big"))
+        for j in range(i, stop):
+            record = self.records[j].tobytes()
+            yield int.from_bytes(record[:32], "big"), int.from_bytes(record[32:], "big")
+
+    def __iter__(self):
+        return self.range()
+
+    def slots(self):
+        for slot, _ in self.range():
+            yield slot
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Convert old_storage.json into a binary state snapshot")
+    parser.add_argument("input", help="old_storage.json")
+    parser.add_argument("output", help="snapshot file to write")
+    args = parser.parse_args()
+
+    count = convert_json(args.input, args.output)
+    print(f"Wrote {count} slots to {args.output}")
@@ -0,0 +1,181 @@
+class TypeResolutionError(Exception):
+    pass
+
+
+def parse_slot(slot):
+    # solc writes member slots in decimal, data_types.json in 0x-prefixed hex
+    if isinstance(slot, int):
+        return slot
+    if slot.startswith("0x"):
+        return int(slot, 16)
+    return int(slot)
+
+
+class TypeRecord:
+    """
+    One interned storage type.
+
+    base, key and value are ids of other records, members a tuple of
+    (slot, offset, member type id). flat caches TypeTable.flat.
+    """
+
+    __slots__ = ("id", "name", "encoding", "size", "base", "key", "value", "members", "flat")
+
+    def __init__(self, type_id, name, encoding, size):
+        self.id = type_id
+        self.name = name
+        self.encoding = encoding
+        self.size = size
+        self.base = None
+        self.key = None
+        self.value = None
+        self.members = None
+        self.flat = None
+
+    def is_plain(self):
+        # a value type, stored in place without nested types
+        return self.encoding == "inplace" and self.base is None and self.members is None
+
+    def is_packed_array(self, table):
+        # static array of value types, its elements packed into consecutive slots
+        return self.encoding == "inplace" and self.base is not None and table.records[self.base].is_plain()
+
+
+class TypeTable:
+    """
+    Interns the types of a storage layout once each, in the order the old
+    recursive resolver emitted them: every type after its base, members,
+    key and value type.
+
+    Types are read from a {type name: type} dict, either solc's
+    storageLayout["types"] or load_data_types output, which is not
+    modified.
+    """
+
+    def __init__(self, types):
+        self.types = types
+        self.records = []
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def _children(self, name):
+        data_type = self.types.get(name)
+        if data_type is None:
+            raise TypeResolutionError("Type not found: " + name)
+        children = []
+        if data_type.get("base"):
+            children.append(data_type["base"])
+        for member in data_type.get("members") or ():
+            children.append(member["type"])
+        if data_type["encoding"] == "mapping":
+            children.append(data_type["key"])
+            children.append(data_type["value"])
+        return children
+
+    def _link(self, record, data_type):
+        ids = self.ids
+        if data_type.get("base"):
+            record.base = ids[data_type["base"]]
+        if data_type.get("members"):
+            record.members = tuple(
+                (parse_slot(member["slot"]), member["offset"], ids[member["type"]])
+                for member in data_type["members"]
+            )
+        if record.encoding == "mapping":
+            record.key = ids[data_type["key"]]
+            record.value = ids[data_type["value"]]
+
+    def resolve(self, names):
+        """
+        Interns names and every type they reach, with an explicit worklist
+        so deep nesting needs no recursion. Records are created first and
+        linked by id once all are interned, so recursive structs, reachable
+        through their own arrays or mappings, need no special case.
+
+        Returns:
+        - list: The newly interned records, each after the types it refers
+          to (or, in a cycle, after the ones not yet interned).
+        """
+        added = []
+        entered = set(self.ids)
+        # (name, children done); a name is interned when popped the second time
+        stack = [(name, False) for name in reversed(list(names))]
+        while stack:
+            name, done = stack.pop()
+            if done:
+                data_type = self.types[name]
+                record = TypeRecord(len(self.records), name, data_type["encoding"], int(data_type["numberOfBytes"]))
+                self.ids[name] = record.id
+                self.records.append(record)
+                added.append(record)
+                continue
+            if name in entered:
+                continue
+            entered.add(name)
+            stack.append((name, True))
+            for child in reversed(self._children(name)):
+                stack.append((child, False))
+
+        for record in added:
+            self._link(record, self.types[record.name])
+        return added
+
+    def record(self, name):
+        type_id = self.ids.get(name)
+        if type_id is None:
+            self.resolve([name])
+            type_id = self.ids[name]
+        return self.records[type_id]
+
+    def flat(self, name):
+        """
+        Flattened slot-offset map of a type: (slot, offset, size, record) of
+        every leaf in its static part, relative to the slot it starts at.
+        Leaves are value types, static arrays of value types (their whole
+        packed range) and the header slot of dynamic arrays, bytes and
+        mappings. Computed once per type.
+
+        Returns:
+        - tuple: The leaves in storage order.
+        """
+        root = self.record(name)
+        if root.flat is not None:
+            return root.flat
+
+        records = self.records
+        stack = [(root, False)]
+        while stack:
+            record, done = stack.pop()
+            if record.flat is not None:
+                continue
+
+            if record.encoding != "inplace" or record.is_plain() or record.is_packed_array(self):
+                record.flat = ((0, 0, record.size, record),)
+                continue
+
+            if record.members is not None:
+                children = [records[member_id] for _, _, member_id in record.members]
+            else:
+                children = [records[record.base]]
+            if not done:
+                stack.append((record, True))
+                stack.extend((child, False) for child in children if child.flat is None)
+                continue
+
+            leaves = []
+            if record.members is not None:
+                for slot, offset, member_id in record.members:
+                    for leaf_slot, leaf_offset, size, leaf in records[member_id].flat:
+                        leaves.append((slot + leaf_slot, offset + leaf_offset, size, leaf))
+            else:
+                base = records[record.base]
+                # nested static arrays and structs take whole slots, dynamic types one each
+                stride = max(1, base.size // 32) if base.encoding == "inplace" else 1
+                for i in range(record.size // (32 * stride)):
+                    for leaf_slot, leaf_offset, size, leaf in base.flat:
+                        leaves.append((i * stride + leaf_slot, leaf_offset, size, leaf))
+            record.flat = tuple(leaves)
+
+        return root.flat
@@ -0,0 +1,57 @@
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+for directory in ("Common", "Dependency_Matrix_Builder", "Storage_Processor", "Prio_Vec", "Batch_Mngr", "Pipeline"):
+    sys.path.append(os.path.join(ROOT, directory))
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+@pytest.fixture
+def sample_output():
+    # solc standard JSON output of fixtures/Sample.sol, so the AST tests run
+    # without a compiler
+    with open(os.path.join(FIXTURES, "Sample.output.json"), 'r') as file:
+        return json.load(file)
+
+
+@pytest.fixture
+def sample_contract(sample_output):
+    import solcast
+    source_units = solcast.from_standard_output(sample_output)
+    return source_units[0].children(filters={'nodeType': "ContractDefinition"})[0]
+
+
+SOLC_VERSION = "0.8.19"
+
+
+@pytest.fixture
+def compiled_sample(sample_output, tmp_path, monkeypatch):
+    """
+    Serves fixtures/Sample.sol from a compile cache seeded with its output,
+    so the stages that compile run without a solc binary.
+
+    Returns:
+    - str: The source path to pass to the compiling stages.
+    """
+    import compile_cache
+    import inheritance
+
+    monkeypatch.chdir(FIXTURES)
+    monkeypatch.setattr(compile_cache, "DEFAULT_CACHE_DIR", str(tmp_path / "solc"))
+    monkeypatch.setattr(compile_cache, "active_solc_version", lambda solc_version=None: solc_version or SOLC_VERSION)
+    monkeypatch.setattr(inheritance, "SUMMARY_CACHE_DIR", str(tmp_path / "summaries"))
+    compile_cache.memory_cache.clear()
+    inheritance.summary_cache.clear()
+
+    input_dict = compile_cache.create_standard_input("Sample.sol")
+    key = compile_cache.get_cache_key(input_dict, SOLC_VERSION)
+    compile_cache.write_cache_file(os.path.join(str(tmp_path / "solc"), key[:2], key + ".json"),
+                                   compile_cache.make_cache_entry(input_dict, sample_output))
+    yield "Sample.sol"
+    compile_cache.memory_cache.clear()
+    inheritance.summary_cache.clear()
@@ -0,0 +1,24 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+contract Sample {
+    uint256 total;
+    mapping(address => uint256) balances;
+
+    function deposit(uint256 amount) public {
+        total = total + amount;
+        credit(msg.sender, amount);
+    }
+
+    function credit(address account, uint256 amount) internal {
+        balances[account] += amount;
+    }
+
+    function credit(address account) internal {
+        credit(account, 1);
+    }
+
+    function getTotal() public view returns (uint256) {
+        return total;
+    }
+}
@@ -0,0 +1,91 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class RpcStubError(Exception):
+    # raised by a stub method to answer with a JSON-RPC error object
+    def __init__(self, code, message="stub error"):
+        self.code = code
+        super().__init__(message)
+
+
+class RpcStub:
+    """
+    JSON-RPC node stub on an http.server bound to a free local port.
+
+    methods maps method names to callables taking the params list; their
+    return value is the result, RpcStubError an error object. statuses
+    queues HTTP statuses answered (with an empty body) before any request
+    is handled, and every decoded request body is kept in requests.
+    """
+
+    def __init__(self, methods):
+        self.methods = methods
+        self.requests = []
+        self.statuses = []
+        self.headers = {}
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub.lock:
+                    stub.requests.append(body)
+                    status = stub.statuses.pop(0) if stub.statuses else None
+                if status is not None:
+                    self._send(status, b"", stub.headers)
+                    return
+                if isinstance(body, list):
+                    answer = [stub.answer(call) for call in body]
+                    answer = [response for response in answer if response is not None]
+                else:
+                    answer = stub.answer(body)
+                self._send(200, json.dumps(answer).encode(), {"Content-Type": "application/json"})
+
+            def _send(self, status, data, headers):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.01,), daemon=True)
+
+    def answer(self, call):
+        # None drops the call from a batch answer
+        method = self.methods.get(call["method"])
+        if method is None:
+            return {"jsonrpc": "2.0", "id": call["id"], "error": {"code": -32601, "message": "method not found"}}
+        try:
+            result = method(call["params"])
+        except RpcStubError as e:
+            return {"jsonrpc": "2.0", "id": call["id"], "error": {"code": e.code, "message": str(e)}}
+        if result is DROP:
+            return None
+        return {"jsonrpc": "2.0", "id": call["id"], "result": result}
+
+    def batch_sizes(self):
+        return [len(body) if isinstance(body, list) else 1 for body in self.requests]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# returned by a stub method to leave the call out of the batch answer
+DROP = object()
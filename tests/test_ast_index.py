@@ -0,0 +1,138 @@
+from ast_index import index_function, index_contract, build_symbol_table
+from dp_builder import analyze_contract
+
+
+def functions_by_signature(contract_def):
+    symbol_table = build_symbol_table(contract_def)
+    return {
+        entry["signature"]: node
+        for node in contract_def
+        for entry in [symbol_table.get(node.id)]
+        if entry is not None and entry["nodeType"] == "FunctionDefinition"
+    }
+
+
+def test_index_function_reaches_nested_nodes(sample_contract):
+    deposit = functions_by_signature(sample_contract)["deposit(uint256)"]
+    call_sites, references = index_function(deposit)
+
+    assert [call.expression.name for call in call_sites] == ["credit"]
+    # total = total + amount; credit(msg.sender, amount);
+    assert [identifier.name for identifier in references] == ["total", "total", "amount", "credit", "msg", "amount"]
+
+
+def test_index_function_leaf_statement(sample_contract):
+    credit = functions_by_signature(sample_contract)["credit(address,uint256)"]
+    call_sites, references = index_function(credit)
+
+    assert call_sites == []
+    assert [identifier.name for identifier in references] == ["balances", "account", "amount"]
+
+
+def test_index_contract(sample_contract):
+    contract_index = index_contract(sample_contract)
+
+    assert sorted(node.name for node in contract_index["state_vars"].values()) == ["balances", "total"]
+    assert len(contract_index["functions"]) == 4
+    assert set(contract_index["call_sites"]) == set(contract_index["functions"])
+
+
+def test_analyze_contract(sample_contract):
+    # named like analyze_file: overloads by signature, state by Contract.variable
+    for backend in ("sets", "bitset"):
+        assert analyze_contract(sample_contract, backend) == {
+            "deposit": {"Sample.total", "Sample.balances"},
+            "credit(address,uint256)": {"Sample.balances"},
+            "credit(address)": {"Sample.balances"},
+            "getTotal": {"Sample.total"},
+        }
+
+
+def ast_node(node_type, **fields):
+    return {"nodeType": node_type, "src": "0:0:0", **fields}
+
+
+def elementary(type_string):
+    return ast_node("ElementaryTypeName", name=type_string.split()[0], typeDescriptions={"typeString": type_string})
+
+
+def user_type(declaration_id, type_string):
+    return ast_node("UserDefinedTypeName", referencedDeclaration=declaration_id, typeDescriptions={"typeString": type_string})
+
+
+def array(base, type_string):
+    return ast_node("ArrayTypeName", baseType=base, typeDescriptions={"typeString": type_string})
+
+
+def variable(name, type_name):
+    return ast_node("VariableDeclaration", name=name, typeName=type_name, stateVariable=False,
+                    typeDescriptions=type_name["typeDescriptions"])
+
+
+def contract(contract_id, name, kind, nodes):
+    return ast_node("ContractDefinition", id=contract_id, name=name, contractKind=kind, nodes=nodes,
+                    contractDependencies=[], linearizedBaseContracts=[contract_id])
+
+
+# Types.sol: struct Point { uint256 x; address y; } interface IERC20 {}
+# Token.sol: contract Token {
+#     struct Order { Point from; uint64[2] sizes; }
+#     enum Side { Buy, Sell }
+#     type Price is uint128;
+#     function place(Order memory, Side, address payable, IERC20, Price[] calldata, Point[] memory, bytes32) external;
+# }
+TYPES_AST = ast_node("SourceUnit", absolutePath="Types.sol", exportedSymbols={"Point": [1], "IERC20": [2]}, nodes=[
+    ast_node("StructDefinition", id=1, name="Point", members=[
+        variable("x", elementary("uint256")), variable("y", elementary("address"))]),
+    contract(2, "IERC20", "interface", []),
+])
+TOKEN_AST = ast_node("SourceUnit", absolutePath="Token.sol", exportedSymbols={"Token": [10]}, nodes=[
+    contract(10, "Token", "contract", [
+        ast_node("StructDefinition", id=11, name="Order", members=[
+            variable("from", user_type(1, "struct Point storage pointer")),
+            variable("sizes", array(elementary("uint64"), "uint64[2] storage pointer")),
+        ]),
+        ast_node("EnumDefinition", id=12, name="Side", members=[]),
+        ast_node("UserDefinedValueTypeDefinition", id=13, name="Price", underlyingType=elementary("uint128")),
+        ast_node("FunctionDefinition", id=14, name="place", kind="function", parameters=ast_node("ParameterList", parameters=[
+            variable("order", user_type(11, "struct Token.Order memory")),
+            variable("side", user_type(12, "enum Token.Side")),
+            variable("to", elementary("address payable")),
+            variable("token", user_type(2, "contract IERC20")),
+            variable("prices", array(user_type(13, "Token.Price"), "Token.Price[] calldata")),
+            variable("points", array(user_type(1, "struct Point"), "struct Point[] memory")),
+            variable("tag", elementary("bytes32")),
+        ])),
+    ]),
+])
+PLACE_SIGNATURE = "place(((uint256,address),uint64[2]),uint8,address,address,uint128[],(uint256,address)[],bytes32)"
+
+
+def test_function_signature_uses_abi_types():
+    import solcast
+    import inheritance
+    from ast_index import function_signature
+
+    source_units = solcast.from_standard_output({"sources": {"Types.sol": {"ast": TYPES_AST}, "Token.sol": {"ast": TOKEN_AST}}})
+    place = source_units[1]["Token"]["place"]
+
+    assert function_signature(place, inheritance.index_declarations(source_units)) == PLACE_SIGNATURE
+    # Point is found through Token's dependencies without a declarations index
+    assert function_signature(place) == PLACE_SIGNATURE
+
+
+def test_function_signature_matches_the_abi_selector(tmp_path):
+    import solcast
+    import selector_index
+    from ast_index import function_signature
+
+    point = {"type": "tuple", "components": [{"type": "uint256"}, {"type": "address"}]}
+    abi = [{"type": "function", "name": "place", "inputs": [
+        {"type": "tuple", "components": [point, {"type": "uint64[2]"}]},
+        {"type": "uint8"}, {"type": "address"}, {"type": "address"}, {"type": "uint128[]"},
+        dict(point, type="tuple[]"), {"type": "bytes32"},
+    ]}]
+    source_units = solcast.from_standard_output({"sources": {"Types.sol": {"ast": TYPES_AST}, "Token.sol": {"ast": TOKEN_AST}}})
+
+    index = selector_index.build_selector_index(abi, cache_dir=str(tmp_path))
+    assert list(index.values()) == [function_signature(source_units[1]["Token"]["place"])]
@@ -0,0 +1,40 @@
+import batch_analyze
+
+
+def test_one_job_per_source(tmp_path, monkeypatch):
+    for name in ("A.sol", "B.sol"):
+        (tmp_path / name).write_text("contract C {}")
+    (tmp_path / "notes.txt").write_text("")
+
+    calls = []
+
+    def run_dependencies(src_file):
+        calls.append(("dependencies", src_file))
+        return {"C": {}}
+
+    def run_layout(src_file):
+        calls.append(("layout", src_file))
+        if src_file.endswith("B.sol"):
+            raise ValueError("no layout")
+        return {"C": {}}
+
+    monkeypatch.setattr(batch_analyze, "run_dependencies", run_dependencies)
+    monkeypatch.setattr(batch_analyze, "run_layout", run_layout)
+
+    results = batch_analyze.run_batch([str(tmp_path)], workers=1)
+
+    a_file, b_file = sorted(results)
+    # each source runs all of its stages back to back in one job
+    assert calls == [("dependencies", a_file), ("layout", a_file), ("dependencies", b_file), ("layout", b_file)]
+    assert results[a_file] == {"dependencies": {"C": {}}, "layout": {"C": {}}, "errors": {}}
+    assert results[b_file]["dependencies"] == {"C": {}}
+    assert "layout" not in results[b_file]
+    assert results[b_file]["errors"]["layout"]["type"] == "ValueError"
+
+
+def test_selected_stages(tmp_path, monkeypatch):
+    (tmp_path / "A.sol").write_text("contract C {}")
+    monkeypatch.setattr(batch_analyze, "run_dependencies", lambda src_file: {"C": {}})
+
+    results = batch_analyze.run_batch([str(tmp_path / "A.sol")], stages=("dependencies",), workers=1)
+    assert list(results.values()) == [{"dependencies": {"C": {}}, "errors": {}}]
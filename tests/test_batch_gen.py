@@ -0,0 +1,60 @@
+import json
+import os
+import subprocess
+import sys
+
+import batch_gen
+import batch_stream
+from conftest import ROOT
+
+SHARDS = {
+    "total": {"0x" + "00" * 31 + "00": "0x" + "00" * 31 + "05"},
+    "balances": {"0x" + "11" * 32: "0x" + "00" * 31 + "07", "0x" + "22" * 32: "0x" + "00" * 31 + "09"},
+}
+DP_MAT = {
+    "deposit": ["Sample.total", "Sample.balances"],
+    "getTotal": ["Sample.total"],
+    "owner": ["Sample.owner"],
+    "ping": [],
+}
+PRIO_VEC = {"getTotal()": 3, "deposit(uint256)": 2, "owner()": 1}
+
+
+def test_sorted_vars():
+    assert batch_gen.sorted_vars(PRIO_VEC, DP_MAT) == ["Sample.total", "Sample.balances", "Sample.owner"]
+
+
+def test_create_function_batches_skips_variables_without_shards():
+    unique_vars = batch_gen.sorted_vars(PRIO_VEC, DP_MAT)
+    missing = []
+    batches = batch_gen.create_function_batches(SHARDS, unique_vars, DP_MAT, 2, missing)
+
+    assert missing == ["Sample.owner"]
+    assert [sorted(key for key in batch if key != "activate") for batch in batches] == [
+        sorted(list(SHARDS["total"]) + list(SHARDS["balances"])[:1]),
+        list(SHARDS["balances"])[1:],
+    ]
+    assert [batch["activate"] for batch in batches] == [["ping", "getTotal"], ["deposit", "owner"]]
+
+
+def test_main_plans_with_the_gas_target(tmp_path):
+    for name, content in (("shards.json", SHARDS), ("dp_mat.json", DP_MAT), ("prio_vec.json", PRIO_VEC)):
+        (tmp_path / name).write_text(json.dumps(content))
+    output = str(tmp_path / "batches.ndjson")
+
+    def run(gas_target):
+        completed = subprocess.run(
+            [sys.executable, os.path.join(ROOT, "Batch_Mngr", "batch_gen.py"), "shards.json", "prio_vec.json",
+             "dp_mat.json", "--gas-target", str(gas_target), "-o", output],
+            cwd=tmp_path, capture_output=True, text=True, check=True)
+        assert "Sample.owner: no shards" in completed.stderr
+        return list(batch_stream.read_batches(output))
+
+    # a 50k target fits one slot write or activation per transaction
+    small = run(50000)
+    assert len(small) == 7
+    assert all(batch["gas"] <= 50000 for batch in small)
+    batches = run(10000000)
+    assert len(batches) == 1
+    assert batches[0]["gas"] < 10000000
+    assert sorted(batches[0]["activate"]) == ["deposit", "getTotal", "owner", "ping"]
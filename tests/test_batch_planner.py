@@ -0,0 +1,104 @@
+import batch_planner
+from batch_planner import to_hash
+
+REORG_INFOS = [
+    {"label": "flag", "type": "t_uint8", "slot": to_hash(0), "offset": 0},
+    {"label": "count", "type": "t_uint16", "slot": to_hash(0), "offset": 1},
+    {"label": "total", "type": "t_uint256", "slot": to_hash(1), "offset": 0},
+]
+DATA_TYPES = [
+    {"type": "t_uint8", "numberOfBytes": 1},
+    {"type": "t_uint16", "numberOfBytes": 2},
+    {"type": "t_uint256", "numberOfBytes": 32},
+]
+SHARDS = {
+    "flag": {to_hash(0): hex(0x05)},
+    "count": {to_hash(0): hex(0x0700)},
+    "total": {to_hash(1): hex(0x09)},
+}
+BYTE_RANGES = batch_planner.packed_byte_ranges(REORG_INFOS, DATA_TYPES)
+
+
+def slot_values(batches):
+    values = {}
+    for batch in batches:
+        for key, value in batch.items():
+            if key.startswith("0x"):
+                values[int(key, 16)] = int(value, 16)
+    return values
+
+
+def test_packed_byte_ranges():
+    assert BYTE_RANGES == {"flag": (0, 1), "count": (1, 2)}
+
+
+def test_shard_label():
+    assert batch_planner.shard_label(SHARDS, "flag") == "flag"
+    assert batch_planner.shard_label(SHARDS, "Sample.flag") == "flag"
+    assert batch_planner.shard_label(SHARDS, "Sample.owner") is None
+
+
+def test_shards_replace_their_bytes_of_the_original_value():
+    original_state = {to_hash(0): hex(0xAB << 200 | 0xFFFFFF), to_hash(1): hex(0xFFFF)}
+    for gas_target in (30000, 10 ** 7):
+        batches = batch_planner.plan_batches(
+            SHARDS, ["flag", "total", "count"], {"f": ["flag", "count"]}, gas_target,
+            original_state=original_state, byte_ranges=BYTE_RANGES)
+        # bytes outside flag and count keep their original value, total owns its slot
+        assert slot_values(batches) == {0: 0xAB << 200 | 0x000705, 1: 0x09}
+
+
+def test_packed_slots_merge_across_batches():
+    # one slot write per batch, count is written a batch after flag
+    batches = batch_planner.plan_batches(
+        SHARDS, ["flag", "total", "count"], {}, 48000, byte_ranges=BYTE_RANGES)
+    assert [sorted(int(key, 16) for key in batch if key.startswith("0x")) for batch in batches] == [[0], [1], [0]]
+    assert int(batches[2][to_hash(0)], 16) == 0x0705
+    # the second write of slot 0 is a reset of a non-zero slot
+    assert batches[0]["gas"] > batches[2]["gas"]
+
+
+def test_packed_slot_written_again_later_is_a_reset():
+    # flag and count share slot 0 but are written 100 batches apart
+    shards = {f"v{i}": {to_hash(i + 2): hex(i + 1)} for i in range(100)}
+    shards.update(SHARDS)
+    unique_vars = ["flag"] + [f"v{i}" for i in range(100)] + ["count"]
+
+    batches = batch_planner.plan_batches(shards, unique_vars, {}, 50000, byte_ranges=BYTE_RANGES)
+    assert batches[0][to_hash(0)] == to_hash(0x05)
+    last = batches[-1]
+    assert sorted(key for key in last if key.startswith("0x")) == [to_hash(0), to_hash(101)]
+    assert last[to_hash(0)] == to_hash(0x0705)
+
+    # v99 is a set, the second write of slot 0 a reset of the value flag left
+    v99 = batch_planner.slot_write_gas(101, 100)
+    count = batch_planner.slot_write_gas(0, 0x0705, original_value=0x05)
+    assert count == batch_planner.COLD_SLOAD_COST + batch_planner.SSTORE_RESET_GAS + \
+        batch_planner.calldata_gas(0) + batch_planner.calldata_gas(0x0705)
+    assert last["gas"] == batch_planner.TX_BASE_GAS + v99 + count
+
+
+def test_activation_follows_last_dependency():
+    batches = batch_planner.plan_batches(
+        SHARDS, ["total", "flag", "count"], {"getTotal": ["total"], "both": ["flag", "count"], "ping": []}, 10 ** 7,
+        byte_ranges=BYTE_RANGES)
+    assert len(batches) == 1
+    assert batches[0]["activate"] == ["ping", "getTotal", "both"]
+
+
+def test_sstore_gas():
+    assert batch_planner.sstore_gas(0, 0, 1, warm=False) == batch_planner.COLD_SLOAD_COST + batch_planner.SSTORE_SET_GAS
+    assert batch_planner.sstore_gas(1, 1, 2, warm=False) == 5000
+    assert batch_planner.sstore_gas(1, 2, 3, warm=True) == batch_planner.WARM_STORAGE_READ_COST
+    assert batch_planner.sstore_gas(1, 1, 1, warm=True) == batch_planner.WARM_STORAGE_READ_COST
+
+
+def test_stream_batches_read_the_layout_next_to_the_shards(tmp_path):
+    import json
+    import batch_stream
+
+    for name, content in (("shards.json", SHARDS), ("storage_reorg_info.json", REORG_INFOS), ("data_types.json", DATA_TYPES)):
+        (tmp_path / name).write_text(json.dumps(content))
+
+    streamed = list(batch_stream.stream_batches(str(tmp_path / "shards.json"), ["flag", "total", "count"], {}, 48000))
+    assert streamed == batch_planner.plan_batches(SHARDS, ["flag", "total", "count"], {}, 48000, byte_ranges=BYTE_RANGES)
@@ -0,0 +1,176 @@
+import json
+import threading
+
+import pytest
+
+import batch_processor
+import rpc_client
+from rpc_stub import RpcStub
+
+SENDER = "0x" + "11" * 20
+TARGET = "0x" + "22" * 20
+FIRST_NONCE = 7
+
+
+class Node:
+    """
+    Mines a transaction on the second receipt poll after it was sent and
+    records how many were pending at every send.
+    """
+
+    def __init__(self, revert_nonces=()):
+        self.sent = {}
+        self.polls = {}
+        self.mined = set()
+        self.pending_at_send = []
+        self.revert_nonces = set(revert_nonces)
+        self.lock = threading.Lock()
+
+    def send(self, params):
+        tx = params[0]
+        with self.lock:
+            tx_hash = "0x" + format(int(tx["nonce"], 16), "064x")
+            self.sent[tx_hash] = tx
+            self.pending_at_send.append(len(self.sent) - len(self.mined))
+        return tx_hash
+
+    def receipt(self, params):
+        tx_hash = params[0]
+        with self.lock:
+            self.polls[tx_hash] = self.polls.get(tx_hash, 0) + 1
+            if self.polls[tx_hash] < 2:
+                return None
+            self.mined.add(tx_hash)
+            nonce = int(self.sent[tx_hash]["nonce"], 16)
+        return {
+            "status": "0x0" if nonce in self.revert_nonces else "0x1",
+            "gasUsed": hex(50000),
+            "blockNumber": hex(100 + nonce),
+        }
+
+    def methods(self):
+        return {
+            "eth_getTransactionCount": lambda params: hex(FIRST_NONCE),
+            "eth_gasPrice": lambda params: hex(10 ** 9),
+            "eth_sendTransaction": self.send,
+            "eth_getTransactionReceipt": self.receipt,
+        }
+
+
+def batches(count):
+    return [{"0x" + format(i, "064x"): "0x01", "activate": [f"f{i}"], "gas": 60000} for i in range(count)]
+
+
+def run(node, count, window, **kwargs):
+    with RpcStub(node.methods()) as stub:
+        client = rpc_client.RpcClient(stub.url, backoff=0)
+        try:
+            processor = batch_processor.BatchProcessor(client, SENDER, TARGET, window=window, poll_interval=0.01, **kwargs)
+            return processor.process(batches(count))
+        finally:
+            client.close()
+
+
+def test_window_of_transactions_stays_in_flight():
+    node = Node()
+    results = run(node, 10, 3)
+
+    assert [result["index"] for result in results] == list(range(10))
+    assert [result["nonce"] for result in results] == list(range(FIRST_NONCE, FIRST_NONCE + 10))
+    assert all(result["status"] == 1 for result in results)
+    # the window fills up and is refilled as receipts come in
+    assert max(node.pending_at_send) == 3
+    assert len(node.sent) == 10
+
+    selector = "0x" + batch_processor.get_selector(batch_processor.MIGRATE_SIGNATURE).hex()
+    assert all(tx["data"].startswith(selector) for tx in node.sent.values())
+    assert all(int(tx["gas"], 16) == int(60000 * batch_processor.GAS_MARGIN) for tx in node.sent.values())
+
+
+def test_revert_stops_submitting():
+    node = Node(revert_nonces={FIRST_NONCE + 1})
+    with pytest.raises(batch_processor.BatchProcessorError, match="Batch 1 reverted"):
+        run(node, 20, 2)
+    assert len(node.sent) < 20
+
+
+def test_revert_without_stopping():
+    node = Node(revert_nonces={FIRST_NONCE + 1})
+    with RpcStub(node.methods()) as stub:
+        client = rpc_client.RpcClient(stub.url, backoff=0)
+        processor = batch_processor.BatchProcessor(client, SENDER, TARGET, window=2, poll_interval=0.01)
+        results = processor.process(batches(4), stop_on_failure=False)
+        client.close()
+    assert [result["status"] for result in results] == [1, 0, 1, 1]
+
+
+def test_encode_batch():
+    batch = {"0x" + "00" * 31 + "01": "0x" + "00" * 31 + "02", "activate": ["f"], "gas": 1}
+    data = bytes.fromhex(batch_processor.encode_batch(batch)[2:])
+
+    words = [int.from_bytes(data[4 + i:36 + i], "big") for i in range(0, len(data) - 4, 32)]
+    assert data[:4] == batch_processor.get_selector(batch_processor.MIGRATE_SIGNATURE)
+    # heads, slots [1], values [2], activate ["f"]
+    assert words[:3] == [96, 160, 224]
+    assert words[3:7] == [1, 1, 1, 2]
+    assert words[7:10] == [1, 32, 1]
+    assert data[4 + 32 * 10:4 + 32 * 10 + 1] == b"f"
+
+
+def test_migration_signature_from_abi(tmp_path):
+    abi = [
+        {"type": "function", "name": "transfer", "inputs": [{"type": "address"}, {"type": "uint256"}]},
+        {"type": "function", "name": "importState", "inputs": [{"type": "bytes32[]"}, {"type": "bytes32[]"}, {"type": "string[]"}]},
+        {"type": "event", "name": "Imported", "inputs": []},
+    ]
+    artifact = tmp_path / "Target.json"
+    artifact.write_text(json.dumps({"contractName": "Target", "abi": abi}))
+
+    assert batch_processor.migration_signature(batch_processor.load_abi(str(artifact))) == \
+        "importState(bytes32[],bytes32[],string[])"
+    with pytest.raises(batch_processor.BatchProcessorError):
+        batch_processor.migration_signature(abi[:1])
+
+
+class StuckNode(Node):
+    """
+    Mines nothing until a transaction is replaced. The gas price lookup of
+    the replacement waits for a receipt poll, which only comes through while
+    the processor does not hold its lock over the RPC calls.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.gas_price_calls = 0
+        self.polled = threading.Event()
+        self.polled_during_replacement = None
+
+    def gas_price(self, params):
+        self.gas_price_calls = self.gas_price_calls + 1
+        if self.gas_price_calls == 2:
+            # the first replacement, while the first version is still pending
+            self.polled.clear()
+            self.polled_during_replacement = self.polled.wait(timeout=2)
+        return hex(10 ** 9)
+
+    def send(self, params):
+        tx_hash = super().send(params)
+        with self.lock:
+            # the first version is never mined, the replacement as usual
+            self.polls[tx_hash] = 0 if self.gas_price_calls > 1 else -10 ** 6
+        return tx_hash
+
+    def receipt(self, params):
+        self.polled.set()
+        return super().receipt(params)
+
+    def methods(self):
+        return dict(super().methods(), eth_gasPrice=self.gas_price)
+
+
+def test_stuck_transaction_is_replaced_outside_the_lock():
+    node = StuckNode()
+    results = run(node, 1, 1, stuck_after=0.05)
+
+    assert results[0]["resubmits"] >= 1
+    assert node.polled_during_replacement
@@ -0,0 +1,67 @@
+import numpy as np
+
+from ast_index import build_symbol_table
+from bitset_matrix import BitsetMatrix
+
+
+def function_entry(name, signature, readable):
+    return {"name": name, "nodeType": "FunctionDefinition", "signature": signature, "offset": None, "readable": readable}
+
+
+def state_entry(name):
+    return {"name": name, "nodeType": "VariableDeclaration", "signature": "uint256", "offset": None, "readable": "C." + name}
+
+
+# two overloads of f, ids 1 and 2, and g
+SYMBOL_TABLE = {
+    1: function_entry("f", "f(uint256)", "f(uint256)"),
+    2: function_entry("f", "f()", "f()"),
+    3: function_entry("g", "g()", "g"),
+    10: state_entry("a"),
+    11: state_entry("b"),
+    12: state_entry("c"),
+}
+
+
+def test_overloads_round_trip():
+    sets = {1: {10}, 2: {11}, 3: set()}
+    matrix = BitsetMatrix.from_sets(sets, [10, 11, 12])
+
+    readable = matrix.to_readable(SYMBOL_TABLE)
+    assert readable == {"f(uint256)": {"C.a"}, "f()": {"C.b"}, "g": set()}
+    assert BitsetMatrix.from_readable(readable, SYMBOL_TABLE).to_sets() == sets
+
+
+def test_readable_names_match_the_symbol_table(sample_contract):
+    symbol_table = build_symbol_table(sample_contract)
+    names = {entry["readable"] for entry in symbol_table.values()}
+    assert names == {"deposit", "credit(address,uint256)", "credit(address)", "getTotal", "Sample.total", "Sample.balances"}
+
+    readable = {"deposit": {"Sample.total"}, "credit(address,uint256)": {"Sample.balances"},
+                "credit(address)": set(), "getTotal": {"Sample.total"}}
+    assert BitsetMatrix.from_readable(readable, symbol_table).to_readable(symbol_table) == readable
+
+
+def test_close_follows_callees_first():
+    # f(uint256) -> f() -> g
+    calls = {3: set(), 2: {3}, 1: {2}}
+    matrix = BitsetMatrix.from_sets({1: {10}, 2: {11}, 3: {12}}, [10, 11, 12])
+    matrix.close([3, 2, 1], calls)
+
+    assert matrix.to_sets() == {1: {10, 11, 12}, 2: {11, 12}, 3: {12}}
+    assert matrix.count(1) == 3
+
+
+def test_to_numpy():
+    matrix = BitsetMatrix.from_sets({1: {10, 12}, 2: set()}, [10, 11, 12])
+    funcs, columns, dense = matrix.to_numpy()
+
+    assert funcs == [1, 2] and columns == [10, 11, 12]
+    assert dense.dtype == bool
+    assert np.array_equal(dense, [[True, False, True], [False, False, False]])
+
+    # rows wider than a byte
+    wide = BitsetMatrix.from_sets({1: {0, 9, 17}}, list(range(18)))
+    assert np.flatnonzero(wide.to_numpy()[2][0]).tolist() == [0, 9, 17]
+
+    assert BitsetMatrix([]).to_numpy()[2].shape == (0, 0)
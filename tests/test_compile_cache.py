@@ -0,0 +1,82 @@
+import pytest
+
+import compile_cache
+
+SOLC_VERSION = "0.8.19"
+
+
+@pytest.fixture
+def solc(tmp_path, monkeypatch):
+    """
+    Compiles in tmp_path with a compiler double that records its calls and
+    reports every file the input imports as read, like solc does.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(compile_cache, "DEFAULT_CACHE_DIR", str(tmp_path / "solc"))
+    compile_cache.memory_cache.clear()
+    calls = []
+
+    def compile_standard(input_dict, solc_version):
+        calls.append(input_dict)
+        sources = {}
+        for path, source in input_dict["sources"].items():
+            sources[path] = {"id": len(sources)}
+            for line in source["content"].splitlines():
+                if line.startswith("import "):
+                    sources[line.split('"')[1]] = {"id": len(sources)}
+        return {"sources": sources, "contracts": {}}
+
+    monkeypatch.setattr(compile_cache.solcx, "compile_standard", compile_standard)
+    yield calls
+    compile_cache.memory_cache.clear()
+
+
+def test_unchanged_sources_are_compiled_once(solc, tmp_path):
+    (tmp_path / "Token.sol").write_text('import "Base.sol";\ncontract Token is Base {}')
+    (tmp_path / "Base.sol").write_text("contract Base {}")
+
+    first = compile_cache.compile_file("Token.sol", SOLC_VERSION)
+    assert compile_cache.compile_file("Token.sol", SOLC_VERSION) == first
+    compile_cache.memory_cache.clear()
+    assert compile_cache.compile_file("Token.sol", SOLC_VERSION) == first
+    assert len(solc) == 1
+
+
+@pytest.mark.parametrize("restart", [False, True])
+def test_edited_import_is_recompiled(solc, tmp_path, restart):
+    (tmp_path / "Token.sol").write_text('import "Base.sol";\ncontract Token is Base {}')
+    (tmp_path / "Base.sol").write_text("contract Base {}")
+    compile_cache.compile_file("Token.sol", SOLC_VERSION)
+
+    (tmp_path / "Base.sol").write_text("contract Base { uint256 x; }")
+    if restart:
+        # a new process only has the entry on disk
+        compile_cache.memory_cache.clear()
+    compile_cache.compile_file("Token.sol", SOLC_VERSION)
+    assert len(solc) == 2
+
+    # the recompiled entry is current again
+    compile_cache.memory_cache.clear()
+    compile_cache.compile_file("Token.sol", SOLC_VERSION)
+    assert len(solc) == 2
+
+
+def test_deleted_import_is_recompiled(solc, tmp_path):
+    (tmp_path / "Token.sol").write_text('import "Base.sol";\ncontract Token is Base {}')
+    (tmp_path / "Base.sol").write_text("contract Base {}")
+    compile_cache.compile_file("Token.sol", SOLC_VERSION)
+
+    (tmp_path / "Base.sol").unlink()
+    compile_cache.compile_file("Token.sol", SOLC_VERSION)
+    assert len(solc) == 2
+
+
+def test_entries_without_import_digests_are_recompiled(solc, tmp_path):
+    (tmp_path / "Token.sol").write_text("contract Token {}")
+    input_dict = compile_cache.create_standard_input("Token.sol")
+    key = compile_cache.get_cache_key(input_dict, SOLC_VERSION)
+    # an entry holding the bare output, as written before imports were tracked
+    compile_cache.write_cache_file(str(tmp_path / "solc" / key[:2] / (key + ".json")), {"sources": {}})
+
+    assert compile_cache.compile_file("Token.sol", SOLC_VERSION) == {"sources": {"Token.sol": {"id": 0}}, "contracts": {}}
+    assert len(solc) == 1
@@ -0,0 +1,73 @@
+import inspect
+import sys
+
+import pytest
+
+from bitset_matrix import BitsetMatrix
+from dp_builder import strongly_connected_components, close_state_dependency_matrix
+
+
+def close_both(calls, state):
+    """
+    Closes state over calls with both backends.
+
+    Returns:
+    - tuple: (dict-of-sets closure, bitset closure as sets)
+    """
+    components = strongly_connected_components(calls)
+    closed = close_state_dependency_matrix(calls, state, components)
+    matrix = BitsetMatrix.from_sets(state, sorted(set().union(*state.values())))
+    matrix.close_components(components, calls)
+    return closed, matrix.to_sets()
+
+
+def test_mutual_recursion():
+    # a -> b -> a, both call c; d calls a
+    calls = {"a": {"b", "c"}, "b": {"a"}, "c": set(), "d": {"a"}}
+    state = {"a": {"x"}, "b": {"y"}, "c": {"z"}, "d": {"w"}}
+
+    components = strongly_connected_components(calls)
+    assert sorted(sorted(component) for component in components) == [["a", "b"], ["c"], ["d"]]
+    # callees first
+    order = {func: i for i, component in enumerate(components) for func in component}
+    assert order["c"] < order["a"] == order["b"] < order["d"]
+
+    for closed in close_both(calls, state):
+        assert closed == {"a": {"x", "y", "z"}, "b": {"x", "y", "z"}, "c": {"z"}, "d": {"w", "x", "y", "z"}}
+
+
+def test_self_call():
+    calls = {"f": {"f", "g"}, "g": set()}
+    state = {"f": {"x"}, "g": {"y"}}
+    assert strongly_connected_components(calls) == [["g"], ["f"]]
+    for closed in close_both(calls, state):
+        assert closed == {"f": {"x", "y"}, "g": {"y"}}
+
+
+def test_members_of_a_component_do_not_share_sets():
+    calls = {"a": {"b"}, "b": {"a"}}
+    closed = close_state_dependency_matrix(calls, {"a": {"x"}, "b": set()})
+    closed["a"].add("extra")
+    assert closed["b"] == {"x"}
+
+
+@pytest.fixture
+def low_recursion_limit():
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(len(inspect.stack()) + 50)
+    yield
+    sys.setrecursionlimit(limit)
+
+
+def test_deep_chain_is_closed_iteratively(low_recursion_limit):
+    # f0 -> f1 -> ... -> f1999, the last two calling each other
+    depth = 2000
+    calls = {i: {i + 1} for i in range(depth - 1)}
+    calls[depth - 1] = {depth - 2}
+    state = {i: {i} for i in range(depth)}
+
+    closed, bitset_closed = close_both(calls, state)
+    assert closed[0] == set(range(depth))
+    assert closed[depth - 1] == closed[depth - 2] == {depth - 2, depth - 1}
+    assert closed[depth // 2] == set(range(depth // 2, depth))
+    assert bitset_closed == closed
@@ -0,0 +1,60 @@
+import dp_builder
+import incremental
+import inheritance
+from conftest import SOLC_VERSION
+
+
+EXPECTED = {
+    "deposit": {"Sample.total", "Sample.balances"},
+    "credit(address,uint256)": {"Sample.balances"},
+    "credit(address)": {"Sample.balances"},
+    "getTotal": {"Sample.total"},
+}
+
+
+def test_analyze_file(compiled_sample):
+    for backend in ("sets", "bitset"):
+        assert dp_builder.analyze_file(compiled_sample, backend) == {"Sample": EXPECTED}
+
+
+def test_readable_function_names():
+    names = inheritance.readable_function_names({"f(uint256)": "A.f(uint256)", "f()": "B.f()", "g()": "A.g()"})
+    assert names == {"f(uint256)": "f(uint256)", "f()": "f()", "g()": "g"}
+
+
+def test_summary_key_depends_on_solc_version(sample_output, sample_contract):
+    import solcast
+    declarations = inheritance.index_declarations(solcast.from_standard_output(sample_output))
+    source_texts = {sample_contract.contract_id: b"x" * sample_contract.offset[1]}
+
+    key = inheritance.summary_key(sample_contract, declarations, source_texts, "0.8.19")
+    assert key == inheritance.summary_key(sample_contract, declarations, source_texts, "0.8.19")
+    assert key != inheritance.summary_key(sample_contract, declarations, source_texts, "0.8.20")
+
+
+def test_incremental_matches_full(compiled_sample, tmp_path):
+    snapshot_file = str(tmp_path / "Sample.deps.json")
+
+    matrices, recomputed = incremental.analyze_file_incremental(compiled_sample, snapshot_file)
+    assert matrices == dp_builder.analyze_file(compiled_sample)
+    assert recomputed == {"Sample": 4}
+
+    # unchanged sources reuse every summary of the snapshot
+    matrices, recomputed = incremental.analyze_file_incremental(compiled_sample, snapshot_file)
+    assert matrices == {"Sample": EXPECTED}
+    assert recomputed == {"Sample": 0}
+
+    # a changed context (declarations or compiler) invalidates the snapshot
+    snapshot = incremental.load_snapshot(snapshot_file)
+    snapshot["contracts"]["Sample"]["context"] = "stale"
+    incremental.save_snapshot(snapshot_file, snapshot)
+    matrices, recomputed = incremental.analyze_file_incremental(compiled_sample, snapshot_file)
+    assert matrices == {"Sample": EXPECTED}
+    assert recomputed == {"Sample": 4}
+
+
+def test_context_depends_on_solc_version(sample_output, sample_contract):
+    import solcast
+    declarations = inheritance.index_declarations(solcast.from_standard_output(sample_output))
+    assert incremental.context_hash(sample_contract, declarations, SOLC_VERSION) != \
+        incremental.context_hash(sample_contract, declarations, "0.8.20")
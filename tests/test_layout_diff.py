@@ -0,0 +1,115 @@
+import batch_planner
+import layout_diff
+import preimage_index
+import shard_gen
+import state_extract
+
+
+def storage_object(label, type_name, slot, offset=0):
+    return {"label": label, "type": type_name, "slot": str(slot), "offset": offset}
+
+
+def value_type(name, size):
+    return {"encoding": "inplace", "label": name, "numberOfBytes": str(size)}
+
+
+def node_types(struct):
+    # struct Node { uint256 value; mapping(uint256 => Node) children; }
+    mapping = f"t_mapping(t_uint256,{struct})"
+    return {
+        "t_uint256": value_type("uint256", 32),
+        mapping: {"encoding": "mapping", "label": "mapping(uint256 => Node)", "numberOfBytes": "32",
+                  "key": "t_uint256", "value": struct},
+        struct: {"encoding": "inplace", "label": "struct Node", "numberOfBytes": "64", "members": [
+            storage_object("value", "t_uint256", 0),
+            storage_object("children", mapping, 1),
+        ]},
+    }
+
+
+def test_type_shape_of_self_referential_struct():
+    old_shape = layout_diff.type_shape(node_types("t_struct(Node)12_storage"), "t_struct(Node)12_storage")
+    new_shape = layout_diff.type_shape(node_types("t_struct(Node)40_storage"), "t_struct(Node)40_storage")
+    assert old_shape == new_shape
+
+    resized = node_types("t_struct(Node)40_storage")
+    resized["t_struct(Node)40_storage"]["members"].reverse()
+    assert layout_diff.type_shape(resized, "t_struct(Node)40_storage") != old_shape
+
+
+TYPES = {
+    "t_uint8": value_type("uint8", 1),
+    "t_uint256": value_type("uint256", 32),
+    "t_address": value_type("address", 20),
+    "t_string_storage": {"encoding": "bytes", "label": "string", "numberOfBytes": "32"},
+    "t_mapping(t_address,t_uint256)": {"encoding": "mapping", "label": "mapping(address => uint256)",
+                                       "numberOfBytes": "32", "key": "t_address", "value": "t_uint256"},
+}
+
+OLD_LAYOUT = {"types": TYPES, "storage": [
+    storage_object("flag", "t_uint8", 0),
+    storage_object("total", "t_uint256", 1),
+    storage_object("name", "t_string_storage", 2),
+    storage_object("balances", "t_mapping(t_address,t_uint256)", 3),
+]}
+
+NEW_LAYOUT = {"types": TYPES, "storage": [
+    storage_object("owner", "t_address", 0),
+    storage_object("flag", "t_uint8", 0, 20),
+    storage_object("total", "t_uint256", 1),
+    storage_object("balances", "t_mapping(t_address,t_uint256)", 2),
+    storage_object("name", "t_string_storage", 3),
+]}
+
+
+def test_moved_variables_carry_their_new_position():
+    diff = layout_diff.diff_layouts(OLD_LAYOUT, NEW_LAYOUT)
+    statuses = {entry["label"]: entry["status"] for entry in diff}
+    assert statuses == {"owner": "new", "flag": "moved", "total": "unchanged", "balances": "moved", "name": "moved"}
+
+    objects = {info["label"]: info for info in layout_diff.rewrite_objects(diff)}
+    assert set(objects) == {"flag", "balances", "name"}
+    assert (int(objects["flag"]["slot"], 16), objects["flag"]["offset"]) == (0, 0)
+    assert (int(objects["flag"]["newSlot"], 16), objects["flag"]["newOffset"]) == (0, 20)
+    assert int(objects["name"]["newSlot"], 16) == 3
+    assert int(objects["balances"]["newSlot"], 16) == 2
+
+
+def test_shards_of_moved_variables_land_at_the_new_position(tmp_path):
+    diff = layout_diff.diff_layouts(OLD_LAYOUT, NEW_LAYOUT)
+    reorg_infos = layout_diff.rewrite_objects(diff)
+    data_types = state_extract.get_types(TYPES, reorg_infos)
+
+    holder = "0x" + "11" * 20
+    holder_key = preimage_index.encode_key(holder, "t_address")
+    name = b"a string longer than thirty-one bytes"
+    old_state = {
+        0: 0x7f,
+        1: 1000,
+        2: 2 * len(name) + 1,
+        shard_gen.data_slot(2): int.from_bytes(name[:32], "big"),
+        shard_gen.data_slot(2) + 1: int.from_bytes(name[32:].ljust(32, b"\0"), "big"),
+        int.from_bytes(shard_gen.keccak256(holder_key + (3).to_bytes(32, "big")), "big"): 55,
+    }
+    state = shard_gen.SlotState(list(old_state), list(old_state.values()))
+
+    with preimage_index.PreimageIndex(str(tmp_path / "preimages.sqlite")) as index:
+        index.add_keys(3, [holder_key])
+        _, shards = shard_gen.ShardGenerator(state, reorg_infos, data_types, index).generate_shards()
+
+    def values(shard):
+        return {int(slot, 16): int(value, 16) for slot, value in shard.items()}
+
+    # uint8 from the low byte of slot 0 to offset 20 of slot 0
+    assert values(shards["flag"]) == {0: 0x7f << (8 * 20)}
+    assert values(shards["name"]) == {
+        3: 2 * len(name) + 1,
+        shard_gen.data_slot(3): old_state[shard_gen.data_slot(2)],
+        shard_gen.data_slot(3) + 1: old_state[shard_gen.data_slot(2) + 1],
+    }
+    assert values(shards["balances"]) == {
+        int.from_bytes(shard_gen.keccak256(holder_key + (2).to_bytes(32, "big")), "big"): 55,
+    }
+
+    # flag shares its new slot with owner, which the diff leaves alone
+    assert batch_planner.packed_byte_ranges(reorg_infos, data_types) == {"flag": (20, 1)}
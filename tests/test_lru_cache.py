@@ -0,0 +1,56 @@
+import lru_cache
+
+
+def test_evicts_least_recently_used():
+    cache = lru_cache.LruCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.get("b", "missing") == "missing"
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 3, "misses": 1, "evictions": 1}
+
+
+def test_put_refreshes_an_existing_key():
+    cache = lru_cache.LruCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("a", 10)
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 10
+
+
+def test_unbounded():
+    cache = lru_cache.LruCache(None)
+    for i in range(1000):
+        cache.put(i, i)
+    assert len(cache) == 1000
+    assert cache.stats()["evictions"] == 0
+
+
+def test_get_or_compute_and_pop():
+    cache = lru_cache.LruCache(4)
+    computed = []
+
+    def compute():
+        computed.append(1)
+        return "value"
+
+    assert cache.get_or_compute("key", compute) == "value"
+    assert cache.get_or_compute("key", compute) == "value"
+    assert len(computed) == 1
+
+    # falsy values are cached too
+    assert cache.get_or_compute("empty", lambda: {}) == {}
+    assert cache.get_or_compute("empty", compute) == {}
+
+    assert cache.pop("key") == "value"
+    assert cache.pop("key") is None
+    assert "key" not in cache
+
+    cache.clear()
+    assert len(cache) == 0
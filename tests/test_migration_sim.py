@@ -0,0 +1,35 @@
+import migration_sim
+import selector_index
+
+
+def test_schedule_batches():
+    batches = [{"activate": ["a"], "gas": 60}, {"activate": [], "gas": 50}, {"activate": ["b"], "gas": 30}]
+    schedule = migration_sim.schedule_batches(batches, block_gas_limit=100)
+    assert [entry["block"] for entry in schedule] == [1, 2, 2]
+
+
+def test_unmatched_calls_are_reported_apart_from_functions():
+    schedule = [
+        {"block": 1, "slots": 1, "gas": 1, "activate": ["transfer"]},
+        {"block": 3, "slots": 1, "gas": 1, "activate": ["approve"]},
+    ]
+    calls = [
+        (100, "transfer(address,uint256)"),
+        (100, "approve(address,uint256)"),
+        (101, selector_index.EMPTY_CALLDATA),
+        (101, selector_index.UNKNOWN_SELECTOR),
+        (105, selector_index.UNKNOWN_SELECTOR),
+        (105, "approve(address,uint256)"),
+    ]
+    report = migration_sim.simulate(schedule, calls, ["transfer", "approve"])
+
+    assert sorted(report["functions"]) == ["approve", "transfer"]
+    assert report["total_calls"] == 3
+    assert report["rejected_calls"] == 2
+    assert report["mean_function_downtime"] == 2.0
+    assert report["downtime_curve"] == [2, 0, 0, 0]
+    assert report["fat_curve"][-1]["active"] == 1.0
+    assert report["unmatched"] == {
+        selector_index.EMPTY_CALLDATA: {"calls": 1, "rejected": 1},
+        selector_index.UNKNOWN_SELECTOR: {"calls": 2, "rejected": 1},
+    }
@@ -0,0 +1,75 @@
+import preimage_index
+
+
+def slot_hex(slot):
+    return "0x" + format(slot, "064x")
+
+
+def data_type(name, encoding, size, base=None, members=None, key=None, value=None):
+    entry = {"type": name, "label": name, "encoding": encoding, "numberOfBytes": size, "base": base, "members": members}
+    if encoding == "mapping":
+        entry["key"] = key
+        entry["value"] = value
+    return entry
+
+
+DATA_TYPES = [
+    data_type("t_uint256", "inplace", 32),
+    data_type("t_address", "inplace", 20),
+    data_type("t_mapping(t_address,t_uint256)", "mapping", 32, key="t_address", value="t_uint256"),
+    # struct Account { uint256 total; mapping(address => uint256) allowance; }
+    data_type("t_struct(Account)1_storage", "inplace", 64, members=[
+        {"label": "total", "type": "t_uint256", "slot": "0", "offset": 0},
+        {"label": "allowance", "type": "t_mapping(t_address,t_uint256)", "slot": "1", "offset": 0},
+    ]),
+    # Account[2]
+    data_type("t_array(t_struct(Account)1_storage)2_storage", "inplace", 128, base="t_struct(Account)1_storage"),
+    # mapping(uint256 => Account[2])
+    data_type("t_mapping(t_uint256,t_array(t_struct(Account)1_storage)2_storage)", "mapping", 32,
+              key="t_uint256", value="t_array(t_struct(Account)1_storage)2_storage"),
+]
+
+
+def mapping_slot(key, key_type, base):
+    digest, = preimage_index.hash_keys(base.to_bytes(32, "big"), [preimage_index.encode_key(key, key_type)])
+    return int.from_bytes(digest, "big")
+
+
+def test_mappings_inside_static_arrays_of_structs(tmp_path):
+    callers = ["0x" + "11" * 20, "0x" + "22" * 20]
+    reorg_infos = [
+        {"label": "accounts", "type": "t_array(t_struct(Account)1_storage)2_storage", "slot": slot_hex(3), "offset": 0},
+        {"label": "byId", "type": "t_mapping(t_uint256,t_array(t_struct(Account)1_storage)2_storage)",
+         "slot": slot_hex(7), "offset": 0},
+    ]
+
+    with preimage_index.PreimageIndex(str(tmp_path / "preimages.sqlite")) as index:
+        added = preimage_index.index_mappings(index, reorg_infos, DATA_TYPES, {"t_address": callers, "t_uint256": [5]})
+
+        # accounts[0].allowance at slot 4, accounts[1].allowance at slot 6
+        bases = [4, 6]
+        # byId[5] starts at keccak(5 . 7), its elements' allowances one and three slots further
+        entry = mapping_slot(5, "t_uint256", 7)
+        bases.extend([entry + 1, entry + 3])
+
+        for base in bases:
+            keys = {preimage_index.encode_key(caller, "t_address") for caller in callers}
+            assert set(index.known_keys(base)) == keys
+            for slot, key in index.entries(base):
+                assert slot == int.from_bytes(preimage_index.hash_keys(base.to_bytes(32, "big"), [key])[0], "big")
+        assert added == 1 + 2 * len(bases)
+
+        # a second run finds every key indexed already
+        assert preimage_index.index_mappings(index, reorg_infos, DATA_TYPES, {"t_address": callers, "t_uint256": [5]}) == 0
+
+
+def test_add_keys_skips_known_keys_across_lookup_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(preimage_index, "LOOKUP_CHUNK", 3)
+    keys = [preimage_index.encode_key(i, "t_uint256") for i in range(10)]
+
+    with preimage_index.PreimageIndex(str(tmp_path / "preimages.sqlite")) as index:
+        assert len(index.add_keys(9, keys[:4])) == 4
+        added = index.add_keys(9, keys + keys[:2])
+        assert [key for _, key in added] == keys[4:]
+        assert sorted(index.known_keys(9)) == sorted(keys)
+        assert list(index.known_keys(10)) == []
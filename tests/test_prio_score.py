@@ -0,0 +1,57 @@
+import pytest
+
+import prio_score
+import selector_index
+
+# selectors "a" and "b", block, caller and gas used per transaction
+BLOCKS = [100, 90, 80, 100]
+SELECTORS = ["a", "a", "a", "b"]
+CALLERS = ["x", "x", "y", "x"]
+GAS_USED = [100, 50, 30, 20]
+
+
+def scores(**kwargs):
+    return prio_score.score_selectors(BLOCKS, SELECTORS, gas_used=GAS_USED, callers=CALLERS, **kwargs)
+
+
+def test_plain_counts():
+    assert scores() == {"a": 3, "b": 1}
+    assert prio_score.score_selectors([], []) == {}
+
+
+def test_half_life_is_measured_from_the_reference_block():
+    # the newest block (100) is the default reference
+    assert scores(half_life=10) == pytest.approx({"a": 1 + 0.5 + 0.25, "b": 1})
+    assert scores(half_life=10, reference_block=110) == pytest.approx({"a": 0.5 + 0.25 + 0.125, "b": 0.5})
+
+
+def test_weight_by_gas_sums_gas():
+    assert scores(weight_by_gas=True) == pytest.approx({"a": 180, "b": 20})
+    assert scores(weight_by_gas=True, half_life=10) == pytest.approx({"a": 100 + 25 + 7.5, "b": 20})
+
+
+def test_per_caller_counts_unique_callers():
+    assert scores(per_caller=True) == pytest.approx({"a": 2, "b": 1})
+    # x's two calls of a share one vote, their mean gas
+    assert scores(per_caller=True, weight_by_gas=True) == pytest.approx({"a": 75 + 30, "b": 20})
+
+
+def test_arrays_from_rows():
+    rows = [(5, "a", "x", 21000), (6, "", None, None)]
+    blocks, selectors, callers, gas_used = prio_score.arrays_from_rows(rows)
+    assert blocks.tolist() == [5, 6]
+    assert selectors.tolist() == ["a", ""]
+    assert callers.tolist() == ["x", ""]
+    assert gas_used.tolist() == [21000.0, 0.0]
+
+
+def test_build_prio_vec_buckets():
+    selectors_in_contract = {"b6b55f25": "deposit(uint256)", "4c75ed26": "getTotal()"}
+    selector_scores = {"b6b55f25": 2, "": 3, "deadbeef": 1, "0badf00d": 4}
+
+    assert prio_score.build_prio_vec(selector_scores, selectors_in_contract) == {
+        "deposit(uint256)": 2,
+        "getTotal()": 0,
+        selector_index.EMPTY_CALLDATA: 3,
+        selector_index.UNKNOWN_SELECTOR: 5,
+    }
@@ -0,0 +1,11 @@
+import priovec
+
+
+def test_get_selectors(compiled_sample):
+    assert priovec.get_slectors(compiled_sample) == {
+        "Sample": {"b6b55f25": "deposit(uint256)", "4c75ed26": "getTotal()"},
+    }
+
+
+def test_get_selectors_missing_file(compiled_sample):
+    assert priovec.get_slectors("Missing.sol").startswith("Error:")
@@ -0,0 +1,126 @@
+import pytest
+import requests
+
+import rpc_client
+from rpc_stub import RpcStub, RpcStubError, DROP
+
+
+def echo(params):
+    return params[0]
+
+
+def make_client(stub, **kwargs):
+    kwargs.setdefault("backoff", 0)
+    return rpc_client.RpcClient(stub.url, **kwargs)
+
+
+def test_batches_are_chunked_and_ordered():
+    with RpcStub({"echo": echo}) as stub, make_client(stub, batch_size=3, max_workers=2) as client:
+        results = client.batch(("echo", [i]) for i in range(7))
+
+    assert results == list(range(7))
+    assert sorted(stub.batch_sizes()) == [1, 3, 3]
+    assert all(isinstance(body, list) for body in stub.requests)
+
+
+def test_call():
+    with RpcStub({"eth_blockNumber": lambda params: "0x10"}) as stub, make_client(stub) as client:
+        assert client.call("eth_blockNumber") == "0x10"
+    assert stub.requests[0][0]["params"] == []
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_retryable_status_is_retried(status):
+    with RpcStub({"echo": echo}) as stub, make_client(stub) as client:
+        stub.statuses = [status, status]
+        assert client.call("echo", ["ok"]) == "ok"
+    assert len(stub.requests) == 3
+
+
+def test_retry_after_sets_the_delay(monkeypatch):
+    delays = []
+    monkeypatch.setattr(rpc_client.time, "sleep", delays.append)
+    with RpcStub({"echo": echo}) as stub, make_client(stub, backoff=0.01) as client:
+        stub.statuses = [429, 429]
+        stub.headers = {"Retry-After": "2"}
+        assert client.call("echo", [1]) == 1
+    assert delays == [2.0, 2.0]
+
+
+def test_backoff_doubles(monkeypatch):
+    delays = []
+    monkeypatch.setattr(rpc_client.time, "sleep", delays.append)
+    with RpcStub({"echo": echo}) as stub, make_client(stub, backoff=0.5) as client:
+        stub.statuses = [503, 503, 503]
+        assert client.call("echo", [1]) == 1
+    assert delays == [0.5, 1.0, 2.0]
+
+
+def test_retries_are_bounded():
+    with RpcStub({"echo": echo}) as stub, make_client(stub, max_retries=2) as client:
+        stub.statuses = [503] * 5
+        with pytest.raises(requests.HTTPError):
+            client.call("echo", [1])
+    assert len(stub.requests) == 3
+
+
+def test_client_errors_are_not_retried():
+    with RpcStub({"echo": echo}) as stub, make_client(stub) as client:
+        stub.statuses = [400]
+        with pytest.raises(requests.HTTPError):
+            client.call("echo", [1])
+    assert len(stub.requests) == 1
+
+
+def test_partial_batch_errors():
+    def fail(params):
+        raise RpcStubError(-32000, "execution reverted")
+
+    with RpcStub({"echo": echo, "fail": fail}) as stub, make_client(stub) as client:
+        calls = [("echo", [1]), ("fail", []), ("echo", [3])]
+        results = client.batch(calls, raise_errors=False)
+
+        assert results[0] == 1 and results[2] == 3
+        assert isinstance(results[1], rpc_client.RpcError)
+        assert results[1].code == -32000
+        assert str(results[1]) == "execution reverted"
+
+        with pytest.raises(rpc_client.RpcError):
+            client.batch(calls)
+    # errors other than rate limits are final
+    assert stub.batch_sizes() == [3, 3]
+
+
+def test_rate_limited_calls_are_resent_alone():
+    limited = {"count": 0}
+
+    def limited_echo(params):
+        if limited["count"] < 2:
+            limited["count"] = limited["count"] + 1
+            raise RpcStubError(-32005, "rate limited")
+        return params[0]
+
+    with RpcStub({"echo": echo, "limited": limited_echo}) as stub, make_client(stub) as client:
+        assert client.batch([("echo", [1]), ("limited", [2]), ("echo", [3])]) == [1, 2, 3]
+    assert stub.batch_sizes() == [3, 1, 1]
+
+
+def test_dropped_responses_are_resent():
+    dropped = {"count": 0}
+
+    def flaky(params):
+        if dropped["count"] == 0:
+            dropped["count"] = 1
+            return DROP
+        return params[0]
+
+    with RpcStub({"echo": echo, "flaky": flaky}) as stub, make_client(stub) as client:
+        assert client.batch([("echo", [1]), ("flaky", [2])]) == [1, 2]
+    assert stub.batch_sizes() == [2, 1]
+
+
+def test_unanswered_calls_fail_after_retries():
+    with RpcStub({"drop": lambda params: DROP}) as stub, make_client(stub, max_retries=1) as client:
+        results = client.batch([("drop", [])], raise_errors=False)
+    assert isinstance(results[0], rpc_client.RpcError)
+    assert len(stub.requests) == 2
@@ -0,0 +1,68 @@
+import pytest
+
+import selector_index
+
+ABI = [
+    {"type": "constructor", "inputs": []},
+    {"type": "function", "name": "transfer", "inputs": [{"type": "address"}, {"type": "uint256"}]},
+    {"type": "function", "name": "balanceOf", "inputs": [{"type": "address"}]},
+    # overload of balanceOf, with a struct array
+    {"type": "function", "name": "balanceOf", "inputs": [
+        {"type": "tuple[]", "components": [
+            {"type": "address"},
+            {"type": "tuple", "components": [{"type": "uint8"}, {"type": "bytes32"}]},
+        ]},
+    ]},
+    {"type": "event", "name": "Transfer", "inputs": [{"type": "address"}]},
+]
+
+
+@pytest.fixture(autouse=True)
+def clear_index_cache():
+    selector_index.index_cache.clear()
+    yield
+    selector_index.index_cache.clear()
+
+
+def test_tuples_are_spelled_out():
+    assert selector_index.function_signature(ABI[3]) == "balanceOf((address,(uint8,bytes32))[])"
+    assert selector_index.get_keccak_selector("transfer(address,uint256)") == "a9059cbb"
+
+
+def test_overloads_keep_their_own_selectors(tmp_path):
+    index = selector_index.build_selector_index(ABI, cache_dir=str(tmp_path))
+    assert index == {
+        "a9059cbb": "transfer(address,uint256)",
+        "70a08231": "balanceOf(address)",
+        selector_index.get_keccak_selector("balanceOf((address,(uint8,bytes32))[])"): "balanceOf((address,(uint8,bytes32))[])",
+    }
+
+
+def test_resolve_buckets():
+    index = {"a9059cbb": "transfer(address,uint256)"}
+    assert selector_index.resolve(index, "a9059cbb") == "transfer(address,uint256)"
+    assert selector_index.resolve(index, "") == selector_index.EMPTY_CALLDATA
+    assert selector_index.resolve(index, "deadbeef") == selector_index.UNKNOWN_SELECTOR
+
+
+def test_index_cache_is_keyed_by_abi_hash(tmp_path, monkeypatch):
+    hashed = []
+    get_keccak_selector = selector_index.get_keccak_selector
+    monkeypatch.setattr(selector_index, "get_keccak_selector",
+                        lambda signature: hashed.append(signature) or get_keccak_selector(signature))
+
+    index = selector_index.build_selector_index(ABI, cache_dir=str(tmp_path))
+    assert len(hashed) == 3
+    # key order does not change the hash
+    reordered = [dict(reversed(list(item.items()))) for item in ABI]
+    assert selector_index.build_selector_index(reordered, cache_dir=str(tmp_path)) is index
+    assert selector_index.index_cache.stats()["hits"] == 1
+
+    # after a restart the index is read back from disk
+    selector_index.index_cache.clear()
+    assert selector_index.build_selector_index(ABI, cache_dir=str(tmp_path)) == index
+    assert len(hashed) == 3
+
+    # a different ABI gets its own index
+    assert selector_index.build_selector_index(ABI[1:2], cache_dir=str(tmp_path)) == {"a9059cbb": "transfer(address,uint256)"}
+    assert len(hashed) == 4
@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+
+import pytest
+import requests
+
+import batch_analyze
+import compile_cache
+import service as service_module
+
+
+@pytest.fixture
+def service(tmp_path):
+    return service_module.SmartShiftService(cache_size=8, store_path=str(tmp_path / "transactions.sqlite"))
+
+
+@pytest.fixture
+def url(service):
+    server = service_module.make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def post(url, method, params):
+    response = requests.post(f"{url}/{method}", data=json.dumps(params))
+    return response.status_code, response.json()
+
+
+def test_analyze_is_served_from_the_result_cache(url, compiled_sample):
+    status, body = post(url, "analyze", {"source": compiled_sample})
+    assert status == 200
+    assert body["result"] == batch_analyze.run_dependencies(compiled_sample)
+
+    assert post(url, "analyze", {"source": compiled_sample})[1] == body
+    stats = requests.get(f"{url}/stats").json()["result"]
+    assert stats["analyses"]["hits"] == 1 and stats["analyses"]["misses"] == 1
+
+
+def test_extract_layout(url, compiled_sample):
+    status, body = post(url, "extract-layout", {"source": compiled_sample})
+    assert status == 200
+    layout = body["result"]["Sample"]
+    assert [(info["label"], int(info["slot"], 16)) for info in layout["storage_reorg_info"]] == [("total", 0), ("balances", 1)]
+    assert {data_type["type"] for data_type in layout["data_types"]} == {"t_uint256", "t_address", "t_mapping(t_address,t_uint256)"}
+
+
+def test_edited_source_is_recomputed(service, compiled_sample, monkeypatch):
+    runs = []
+    monkeypatch.setattr(batch_analyze, "run_dependencies", lambda source: runs.append(source) or {"Sample": {}})
+
+    service.analyze({"source": compiled_sample})
+    service.analyze({"source": compiled_sample})
+    assert len(runs) == 1
+
+    stat = os.stat(compiled_sample)
+    os.utime(compiled_sample, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    service.analyze({"source": compiled_sample})
+    assert len(runs) == 2
+
+
+def test_edited_import_is_recompiled(service, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(compile_cache, "DEFAULT_CACHE_DIR", str(tmp_path / "solc"))
+    monkeypatch.setattr(compile_cache, "active_solc_version", lambda solc_version=None: "0.8.19")
+    compile_cache.memory_cache.clear()
+    (tmp_path / "Token.sol").write_text('import "Base.sol"; contract Token is Base {}')
+    (tmp_path / "Base.sol").write_text("contract Base {}")
+
+    compiles = []
+    monkeypatch.setattr(compile_cache.solcx, "compile_standard",
+                        lambda input_dict, solc_version: compiles.append(solc_version) or {"sources": {"Token.sol": {}, "Base.sol": {}}})
+
+    key = service.source_key("Token.sol")
+    assert [path for path, _, _ in key] == [str(tmp_path / "Base.sol"), str(tmp_path / "Token.sol")]
+    assert service.source_key("Token.sol") == key
+    assert len(compiles) == 1
+
+    (tmp_path / "Base.sol").write_text("contract Base { uint256 x; }")
+    assert service.source_key("Token.sol") != key
+    assert len(compiles) == 2
+    compile_cache.memory_cache.clear()
+
+
+def test_plan_batches(url, tmp_path):
+    shard_file = tmp_path / "shards.json"
+    shard_file.write_text(json.dumps({
+        "total": {"0x" + format(0, "064x"): "0x" + format(5, "064x")},
+        "balances": {"0x" + format(9, "064x"): "0x" + format(7, "064x")},
+    }))
+
+    status, body = post(url, "plan-batches", {
+        "shards": str(shard_file),
+        "prio_vec": {"deposit(uint256)": 2, "getTotal()": 1},
+        "dp_mat": {"deposit": ["total", "balances"], "getTotal": ["total"]},
+        "gas_target": 15000000,
+    })
+    assert status == 200
+    batches = body["result"]
+    assert len(batches) == 1
+    assert json.dumps(batches[0]).count("0x" + format(9, "064x")) == 1
+
+    output = tmp_path / "batches.ndjson"
+    status, body = post(url, "plan-batches", {
+        "shards": str(shard_file), "prio_vec": {"getTotal()": 1}, "dp_mat": {"getTotal": ["total"]},
+        "gas_target": 15000000, "output": str(output),
+    })
+    assert body["result"] == {"batches": 1, "output": str(output)}
+    assert len(output.read_text().splitlines()) == 1
+
+
+def test_errors(url, tmp_path):
+    assert requests.get(f"{url}/health").json() == {"result": "ok"}
+
+    status, body = post(url, "analyze", {})
+    assert status == 400 and body["error"]["type"] == "ServiceError"
+
+    status, body = post(url, "analyze", {"source": str(tmp_path / "Missing.sol")})
+    assert status == 400 and body["error"]["type"] == "FileNotFoundError"
+
+    status, body = post(url, "unknown", {})
+    assert status == 404
+
+    response = requests.post(f"{url}/analyze", data="[1, 2]")
+    assert response.status_code == 400
+
+    response = requests.post(f"{url}/analyze", data="{not json")
+    assert response.status_code == 400 and response.json()["error"]["type"] == "JSONDecodeError"
+
+
+def test_clear_empties_every_cache(url, compiled_sample):
+    post(url, "analyze", {"source": compiled_sample})
+    assert post(url, "clear", {})[1] == {"result": True}
+    stats = requests.get(f"{url}/stats").json()["result"]
+    assert all(cache["size"] == 0 for cache in stats.values())
@@ -0,0 +1,65 @@
+import json
+import os
+
+import pytest
+
+import preimage_index
+import shard_gen
+from conftest import ROOT
+
+LAYOUTS = os.path.join(ROOT, "Storage_Processor", "Tests")
+
+
+@pytest.mark.parametrize("layout", sorted(os.listdir(LAYOUTS)))
+def test_generate_directory_matches_shards_json(layout):
+    directory = os.path.join(LAYOUTS, layout)
+    shards, matches = shard_gen.generate_directory(directory, write=False)
+
+    with open(os.path.join(directory, "shards.json"), 'r') as file:
+        assert shards == json.load(file)
+    assert matches
+
+
+def entry_slot(key, base):
+    return int.from_bytes(shard_gen.keccak256(key + base.to_bytes(32, "big")), "big")
+
+
+DATA_TYPES = [
+    {"type": "t_uint256", "encoding": "inplace", "label": "uint256", "numberOfBytes": 32, "base": None, "members": None},
+    {"type": "t_address", "encoding": "inplace", "label": "address", "numberOfBytes": 20, "base": None, "members": None},
+    {"type": "t_mapping(t_address,t_uint256)", "encoding": "mapping", "label": "mapping(address => uint256)",
+     "numberOfBytes": 32, "base": None, "members": None, "key": "t_address", "value": "t_uint256"},
+    {"type": "t_mapping(t_address,t_mapping(t_address,t_uint256))", "encoding": "mapping",
+     "label": "mapping(address => mapping(address => uint256))", "numberOfBytes": 32, "base": None, "members": None,
+     "key": "t_address", "value": "t_mapping(t_address,t_uint256)"},
+]
+
+
+@pytest.mark.parametrize("new_slot", [None, 9])
+def test_reorganize_mapping(tmp_path, new_slot):
+    owner, spender, stranger = (preimage_index.encode_key("0x" + byte * 20, "t_address") for byte in ("11", "22", "33"))
+    info = {"label": "allowance", "type": "t_mapping(t_address,t_mapping(t_address,t_uint256))",
+            "slot": shard_gen.to_hash(4), "offset": 0}
+    if new_slot is not None:
+        info["newSlot"] = shard_gen.to_hash(new_slot)
+        info["newOffset"] = 0
+
+    # allowance[owner][spender] = 7, allowance[owner][owner] unset
+    inner = entry_slot(owner, 4)
+    state = shard_gen.SlotState([entry_slot(spender, inner)], [7])
+
+    with preimage_index.PreimageIndex(str(tmp_path / "preimages.sqlite")) as index:
+        preimage_index.index_mappings(index, [info], DATA_TYPES, {"t_address": ["0x" + "11" * 20, "0x" + "22" * 20]})
+        # a key indexed for another mapping only
+        index.add_keys(5, [stranger])
+        _, shards = shard_gen.ShardGenerator(state, [info], DATA_TYPES, index).generate_shards()
+
+    target = 4 if new_slot is None else new_slot
+    expected_slot = entry_slot(spender, entry_slot(owner, target))
+    assert shards == {"allowance": {shard_gen.to_hash(expected_slot): shard_gen.to_hash(7)}}
+
+
+def test_mappings_need_a_preimage_index():
+    info = {"label": "balances", "type": "t_mapping(t_address,t_uint256)", "slot": shard_gen.to_hash(0), "offset": 0}
+    with pytest.raises(shard_gen.ShardGenerationError):
+        shard_gen.ShardGenerator(shard_gen.SlotState([], []), [info], DATA_TYPES).generate_shards()
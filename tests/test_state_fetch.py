@@ -0,0 +1,123 @@
+import json
+import os
+
+import pytest
+
+import rpc_client
+import shard_gen
+import state_fetch
+from conftest import ROOT
+from rpc_stub import RpcStub, RpcStubError
+
+LAYOUTS = os.path.join(ROOT, "Storage_Processor", "Tests")
+HEAD = 0x10
+BLOCK_HASH = "0x" + "ab" * 32
+
+
+def load_layout(name):
+    directory = os.path.join(LAYOUTS, name)
+    with open(os.path.join(directory, "old_storage.json"), 'r') as file:
+        storage = json.load(file)
+    with open(os.path.join(directory, "storage_reorg_info.json"), 'r') as file:
+        reorg_infos = json.load(file)
+    with open(os.path.join(directory, "data_types.json"), 'r') as file:
+        data_types = json.load(file)
+    return storage, reorg_infos, data_types
+
+
+def node_methods(storage, debug=True):
+    # a node at block HEAD holding storage ({hashed slot: {"key", "value"}})
+    hashed = sorted((int(digest, 16), entry) for digest, entry in storage.items())
+
+    def storage_at(params):
+        slot = int(params[1], 16)
+        digest = shard_gen.to_hash(int.from_bytes(shard_gen.keccak256(slot.to_bytes(32, "big")), "big"))
+        return storage.get(digest, {}).get("value", shard_gen.to_hash(0))
+
+    def block_by_number(params):
+        return {"hash": BLOCK_HASH} if int(params[0], 16) <= HEAD else None
+
+    def storage_range_at(params):
+        if not debug:
+            raise RpcStubError(-32601, "the method debug_storageRangeAt does not exist")
+        assert params[0] == BLOCK_HASH and params[1] == 0
+        start, size = int(params[3], 16), params[4]
+        selected = [(digest, entry) for digest, entry in hashed if digest >= start]
+        page = selected[:size]
+        next_key = shard_gen.to_hash(selected[size][0]) if len(selected) > size else None
+        return {"storage": {shard_gen.to_hash(digest): entry for digest, entry in page}, "nextKey": next_key}
+
+    return {
+        "eth_blockNumber": lambda params: hex(HEAD),
+        "eth_getBlockByNumber": block_by_number,
+        "eth_getStorageAt": storage_at,
+        "debug_storageRangeAt": storage_range_at,
+    }
+
+
+def methods_called(stub):
+    calls = []
+    for body in stub.requests:
+        calls.extend(body if isinstance(body, list) else [body])
+    return {call["method"] for call in calls}
+
+
+@pytest.mark.parametrize("layout", sorted(os.listdir(LAYOUTS)))
+@pytest.mark.parametrize("debug", [True, False])
+def test_fetch_state_matches_old_storage(layout, debug, tmp_path):
+    storage, reorg_infos, data_types = load_layout(layout)
+
+    with RpcStub(node_methods(storage, debug)) as stub, \
+            rpc_client.RpcClient(stub.url, batch_size=7, backoff=0) as client:
+        state, block = state_fetch.fetch_state(client, "0x01", reorg_infos, data_types,
+                                               page_size=3, segments=4, dump_dir=str(tmp_path))
+
+    # the range is read at the start of the head, so the block before it is pinned
+    assert block == HEAD - 1
+    expected = {digest: {"key": entry["key"], "value": entry["value"]}
+                for digest, entry in storage.items() if int(entry["value"], 16) != 0}
+    assert state_fetch.as_old_storage(state) == expected
+    assert ("eth_getStorageAt" in methods_called(stub)) != debug
+    # the range dump is temporary
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("block, use_range", [(None, False), (HEAD, True)])
+def test_head_is_read_with_storage_at(block, use_range, tmp_path):
+    storage, reorg_infos, data_types = load_layout("test1")
+
+    with RpcStub(node_methods(storage)) as stub, rpc_client.RpcClient(stub.url, backoff=0) as client:
+        state, pinned = state_fetch.fetch_state(client, "0x01", reorg_infos, data_types, block=block,
+                                                use_range=use_range, dump_dir=str(tmp_path))
+
+    # the head's successor is not mined yet, so there is no range to read
+    assert pinned == HEAD
+    assert "debug_storageRangeAt" not in methods_called(stub)
+    assert state_fetch.as_old_storage(state) == {digest: {"key": entry["key"], "value": entry["value"]}
+                                                 for digest, entry in storage.items() if int(entry["value"], 16) != 0}
+
+
+def test_storage_range_streams_pages_into_snapshot(tmp_path):
+    import state_snapshot
+    storage, _, _ = load_layout("test6")
+
+    with RpcStub(node_methods(storage)) as stub, rpc_client.RpcClient(stub.url, backoff=0) as client:
+        dump_file = str(tmp_path / "dump.range")
+        count = state_fetch.storage_range(client, "0x01", BLOCK_HASH, dump_file, page_size=2, segments=3)
+
+    nonzero = {int(digest, 16): int(entry["value"], 16) for digest, entry in storage.items() if int(entry["value"], 16)}
+    assert count == len(nonzero)
+    with state_snapshot.Snapshot(dump_file) as dump:
+        assert dict(dump.range()) == nonzero
+
+
+def test_range_errors_propagate(tmp_path):
+    def failing(params):
+        raise RpcStubError(-32000, "missing trie node")
+
+    methods = node_methods({})
+    methods["debug_storageRangeAt"] = failing
+    with RpcStub(methods) as stub, rpc_client.RpcClient(stub.url, backoff=0) as client:
+        with pytest.raises(rpc_client.RpcError):
+            state_fetch.fetch_state(client, "0x01", [], [], segments=2, dump_dir=str(tmp_path))
+    assert os.listdir(tmp_path) == []
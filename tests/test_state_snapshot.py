@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pytest
+
+import shard_gen
+import state_snapshot
+from conftest import ROOT
+
+LAYOUTS = os.path.join(ROOT, "Storage_Processor", "Tests")
+
+
+@pytest.mark.parametrize("layout", sorted(os.listdir(LAYOUTS)))
+def test_convert_json(layout, tmp_path):
+    json_file = os.path.join(LAYOUTS, layout, "old_storage.json")
+    snapshot_file = str(tmp_path / "old_storage.snapshot")
+    count = state_snapshot.convert_json(json_file, snapshot_file, run_records=3)
+
+    state = shard_gen.load_old_storage(json_file)
+    with state_snapshot.Snapshot(snapshot_file) as snapshot:
+        assert count == len(snapshot) == len(state.index)
+        assert list(snapshot) == sorted((slot, state.get(slot)) for slot in state.slots())
+
+
+def test_last_write_wins_and_zeros_are_dropped(tmp_path):
+    snapshot_file = str(tmp_path / "state.snapshot")
+    pairs = [(5, 1), (1, 7), (5, 2), (3, 4), (3, 0), (9, 0)]
+    assert state_snapshot.write_snapshot(pairs, snapshot_file) == 2
+
+    with state_snapshot.Snapshot(snapshot_file) as snapshot:
+        assert list(snapshot) == [(1, 7), (5, 2)]
+
+
+@pytest.mark.parametrize("run_records", [1, 2, 3, 100])
+def test_runs_are_merged(tmp_path, run_records):
+    # repeated slots across runs, the later run wins
+    pairs = [(slot * 7919 % 101, slot + 1) for slot in range(60)] + [(50, 1000), (0, 0)]
+    expected = {}
+    for slot, value in pairs:
+        expected[slot] = value
+    expected = sorted((slot, value) for slot, value in expected.items() if value)
+
+    snapshot_file = str(tmp_path / "state.snapshot")
+    assert state_snapshot.write_snapshot(pairs, snapshot_file, run_records=run_records) == len(expected)
+    with state_snapshot.Snapshot(snapshot_file) as snapshot:
+        assert list(snapshot) == expected
+    # no run files are left behind
+    assert os.listdir(tmp_path) == ["state.snapshot"]
+
+
+def test_lookups_and_ranges(tmp_path):
+    big = (1 << 255) + 3
+    snapshot_file = str(tmp_path / "state.snapshot")
+    state_snapshot.write_snapshot([(2, 20), (big, 30), (7, 70)], snapshot_file)
+
+    with state_snapshot.Snapshot(snapshot_file) as snapshot:
+        assert snapshot.get(7) == 70 and snapshot.get(big) == 30
+        assert snapshot.get(3) == 0
+        assert 2 in snapshot and 3 not in snapshot
+        assert list(snapshot.range(3)) == [(7, 70), (big, 30)]
+        assert list(snapshot.range(2, 7)) == [(2, 20)]
+        assert list(snapshot.range(8, big)) == []
+        assert list(snapshot.slots()) == [2, 7, big]
+
+        values = snapshot.gather([7, 4, 2])
+        assert values.shape == (3, 32)
+        assert [int.from_bytes(row.tobytes(), "big") for row in values] == [70, 0, 20]
+
+
+def test_empty_snapshot(tmp_path):
+    snapshot_file = str(tmp_path / "empty.snapshot")
+    assert state_snapshot.write_snapshot([], snapshot_file) == 0
+
+    with state_snapshot.Snapshot(snapshot_file) as snapshot:
+        assert len(snapshot) == 0
+        assert list(snapshot) == []
+        assert snapshot.get(0) == 0
+        assert np.array_equal(snapshot.gather([1]), np.zeros((1, 32), dtype=np.uint8))
+
+
+def test_rejects_other_files(tmp_path):
+    (tmp_path / "short").write_bytes(b"abc")
+    (tmp_path / "other").write_bytes(b"NOTASNAP" + bytes(8))
+    for name in ("short", "other"):
+        with pytest.raises(ValueError):
+            state_snapshot.Snapshot(str(tmp_path / name))
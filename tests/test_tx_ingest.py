@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+
+import tx_ingest
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, result):
+        self.result = result
+
+    def json(self):
+        return {"status": "1", "result": self.result}
+
+
+class FakeSession:
+    # Etherscan over a chain holding counts[block] transactions in each block
+    def __init__(self, counts):
+        self.counts = counts
+        self.queries = []
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def get(self, url, params, timeout):
+        start, end = params["startblock"], params["endblock"]
+        with self.lock:
+            self.queries.append((start, end, params["page"]))
+        matching = [{"blockNumber": str(block), "hash": f"0x{block:x}-{i}", "input": "0x"}
+                    for block in range(start, end + 1) for i in range(self.counts.get(block, 0))]
+        first = (params["page"] - 1) * params["offset"]
+        return FakeResponse(matching[first:first + params["offset"]])
+
+    def close(self):
+        self.closed = True
+
+
+def fake_session(monkeypatch, counts):
+    session = FakeSession(counts)
+    monkeypatch.setattr(tx_ingest.requests, "Session", lambda: session)
+    return session
+
+
+def hashes(counts, start, end):
+    return [f"0x{block:x}-{i}" for block in range(start, end + 1) for i in range(counts.get(block, 0))]
+
+
+def test_chunks_shrink_in_dense_and_grow_in_quiet_ranges(monkeypatch):
+    # blocks 0-63 hold 3 transactions each, later blocks none
+    counts = {block: 3 for block in range(64)}
+    session = fake_session(monkeypatch, counts)
+    chunks = []
+    fetch_block_range = tx_ingest.fetch_block_range
+
+    def recording(session, address, start, end, api_key, max_results):
+        chunks.append((start, end))
+        return fetch_block_range(session, address, start, end, api_key, max_results)
+
+    monkeypatch.setattr(tx_ingest, "fetch_block_range", recording)
+    transactions = list(tx_ingest.iter_transactions("0xaa", 0, 255, "key", workers=1, chunk_size=16, max_results=8))
+
+    assert [tx["hash"] for tx in transactions] == hashes(counts, 0, 255)
+    # 0-15 holds 48 transactions and takes 7 splits, so chunks shrink to 16 >> 3 blocks
+    assert chunks[:2] == [(0, 15), (16, 17)]
+    assert all(end - start == 1 for start, end in chunks[1:] if start < 64)
+    # quiet chunks double until the end of the range
+    assert [end - start + 1 for start, end in chunks if start >= 64] == [2, 4, 8, 16, 32, 64, 66]
+    assert session.closed
+
+
+def test_transactions_are_yielded_in_block_order_across_workers(monkeypatch):
+    counts = {block: block % 5 for block in range(300)}
+    fake_session(monkeypatch, counts)
+
+    transactions = tx_ingest.iter_transactions("0xaa", 10, 299, "key", workers=4, chunk_size=7, max_results=6)
+    assert [tx["hash"] for tx in transactions] == hashes(counts, 10, 299)
+
+
+def test_full_block_is_paged_through(monkeypatch):
+    counts = {5: 20, 6: 1}
+    session = fake_session(monkeypatch, counts)
+
+    transactions, splits = tx_ingest.fetch_block_range(session, "0xaa", 5, 6, "key", max_results=8)
+    assert [tx["hash"] for tx in transactions] == hashes(counts, 5, 6)
+    assert splits == 1
+    assert [(start, page) for start, end, page in session.queries if start == end == 5] == [(5, 1), (5, 2), (5, 3)]
+
+
+def test_block_beyond_the_result_window_raises(monkeypatch):
+    monkeypatch.setattr(tx_ingest, "ETHERSCAN_MAX_RESULTS", 16)
+    session = fake_session(monkeypatch, {5: 20})
+
+    with pytest.raises(tx_ingest.EtherscanError):
+        tx_ingest.fetch_block_range(session, "0xaa", 5, 5, "key", max_results=8)
+
+
+def test_session_is_closed_when_the_consumer_stops_early(monkeypatch):
+    session = fake_session(monkeypatch, {block: 1 for block in range(100)})
+
+    transactions = tx_ingest.iter_transactions("0xaa", 0, 99, "key", workers=2, chunk_size=10, max_results=50)
+    next(transactions)
+    transactions.close()
+    assert session.closed
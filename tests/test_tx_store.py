@@ -0,0 +1,75 @@
+import sqlite3
+
+import tx_store
+
+ADDRESS = "0x00000000000000000000000000000000000000aa"
+
+OLD_SCHEMA = """
+CREATE TABLE transactions (
+    address  TEXT    NOT NULL,
+    block    INTEGER NOT NULL,
+    tx_hash  TEXT    NOT NULL,
+    selector TEXT    NOT NULL,
+    PRIMARY KEY (address, tx_hash)
+);
+CREATE TABLE sync_state (
+    address         TEXT PRIMARY KEY,
+    first_block     INTEGER NOT NULL,
+    high_water_mark INTEGER NOT NULL
+);
+"""
+
+
+def transaction(block, tx_hash, selector, caller="0xCA11", gas_used="21000"):
+    return {"blockNumber": str(block), "hash": tx_hash, "input": "0x" + selector + "00" * 32,
+            "from": caller, "gasUsed": gas_used}
+
+
+def fake_ingest(monkeypatch, transactions):
+    fetched = []
+
+    def iter_transactions(address, start_block, end_block, api_key, **kwargs):
+        fetched.append((start_block, end_block))
+        return [tx for tx in transactions if start_block <= int(tx["blockNumber"]) <= end_block]
+
+    monkeypatch.setattr(tx_store.tx_ingest, "iter_transactions", iter_transactions)
+    return fetched
+
+
+def test_sync_fetches_only_missing_blocks(tmp_path, monkeypatch):
+    transactions = [transaction(block, f"0x{block:x}", "a9059cbb") for block in range(10, 30)]
+    fetched = fake_ingest(monkeypatch, transactions)
+    conn = tx_store.open_store(str(tmp_path / "store.sqlite"))
+
+    tx_store.sync(conn, ADDRESS, 15, 20, "key")
+    tx_store.sync(conn, ADDRESS, 10, 25, "key")
+    tx_store.sync(conn, ADDRESS, 12, 22, "key")
+
+    assert fetched == [(15, 20), (10, 14), (21, 25)]
+    assert tx_store.get_sync_state(conn, ADDRESS) == (10, 25)
+    assert tx_store.selector_counts(conn, ADDRESS, 12, 22) == {"a9059cbb": 11}
+
+
+def test_migrated_store_refetches_null_columns(tmp_path, monkeypatch):
+    path = str(tmp_path / "store.sqlite")
+    old = sqlite3.connect(path)
+    old.executescript(OLD_SCHEMA)
+    old.execute("INSERT INTO transactions VALUES (?, 5, '0x5', 'a9059cbb')", (ADDRESS,))
+    old.execute("INSERT INTO sync_state VALUES (?, 5, 6)", (ADDRESS,))
+    old.commit()
+    old.close()
+
+    conn = tx_store.open_store(path)
+    # the stored range predates caller/gas_used and is no longer trusted
+    assert tx_store.get_sync_state(conn, ADDRESS) is None
+    assert list(tx_store.iter_rows(conn, ADDRESS)) == [(5, "a9059cbb", None, None)]
+
+    fetched = fake_ingest(monkeypatch, [transaction(5, "0x5", "a9059cbb"), transaction(6, "0x6", "095ea7b3")])
+    tx_store.sync(conn, ADDRESS, 5, 6, "key")
+
+    assert fetched == [(5, 6)]
+    assert list(tx_store.iter_rows(conn, ADDRESS)) == [(5, "a9059cbb", "0xca11", 21000), (6, "095ea7b3", "0xca11", 21000)]
+
+    # reopening a migrated store keeps its ranges
+    conn.close()
+    assert tx_store.get_sync_state(tx_store.open_store(path), ADDRESS) == (5, 6)